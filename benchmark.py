@@ -0,0 +1,368 @@
+"""Benchmark determinista de los cuatro puntos de entrada con un LLM simulado.
+
+Mide el coste de la orquestación (y lo que gana la concurrencia) sin llamar a
+ningún proveedor: todos los modelos se sustituyen por FakeChatModel con la
+latencia, la distribución y la velocidad de tokens indicadas.
+
+Escenarios:
+    voting      -> voting.evaluate_medical_case
+    debate      -> debate.DebateManager.run
+    initdebate  -> initdebate.run_debate
+    groupchat   -> groupchat.get_graph().stream
+
+Por escenario se informa: sesiones/s, latencia p50/p95/p99 por sesión,
+llamadas al LLM por sesión, CPU del proceso (la espera del LLM simulado no
+consume CPU, así que es el coste propio de la orquestación) y RSS máximo.
+
+Con --imports mide en cambio cuánto tarda importar cada módulo en un intérprete
+nuevo y qué dependencias pesadas arrastra; con --import-budget-ms falla si algún
+módulo supera el presupuesto (para vigilar el arranque de workers y tests).
+
+Con --http lanza los clientes reales de OpenAI y Ollama contra un servidor
+local (fake_llm.StubLLMServer) y compara cuántas conexiones abren con el pool
+HTTP compartido y con un cliente httpx por modelo.
+
+Uso:
+    python benchmark.py --sessions 20 --concurrency 4 --latency 0.05 --output bench.json
+    python benchmark.py --scenarios voting,groupchat --compare bench.json
+    python benchmark.py --imports --import-budget-ms 300
+    python benchmark.py --http --sessions 10 --concurrency 32
+"""
+
+import argparse
+import contextlib
+import contextvars
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Dict, List, Optional
+
+from fake_llm import DEFAULT_VOTE_RESPONSE, FakeChatModel
+from llms import override_chat_models
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+VOTE_RESPONSES = [
+    DEFAULT_VOTE_RESPONSE,
+    '{"voto": "CORRECTO", "confianza": 0.9, "razonamiento": "Caso $call: la acción es coherente con los hallazgos."}',
+]
+
+# Intervenciones distintas entre sí para que el detector de convergencia no corte en el primer turno
+DISCUSSION_RESPONSES = [
+    "Turno $call. La inteligencia artificial acelera el diagnóstico por imagen y reduce listas de espera.",
+    "Turno $call. Los sesgos de los datos de entrenamiento pueden perjudicar a pacientes minoritarios.",
+    "Turno $call. Proponemos una campaña en TikTok con embajadores viajeros y contenido en vídeo.",
+    "Turno $call. Las métricas clave serán conversión, retención y NPS por cohorte trimestral.",
+    "Turno $call. Una tarjeta multidivisa sin comisiones refuerza la propuesta de valor de la marca.",
+    "Turno $call. La privacidad y la regulación sanitaria exigen auditorías independientes.",
+]
+
+MEDICAL_CASE = ("Paciente de 58 años con dolor torácico opresivo de 30 minutos, diaforesis "
+                "y elevación del ST en derivaciones inferiores.")
+MEDICAL_ACTION = "Activar código infarto y trasladar a hemodinámica para angioplastia primaria."
+
+
+def _run_voting():
+    from voting import evaluate_medical_case
+    evaluate_medical_case(MEDICAL_CASE, MEDICAL_ACTION)
+
+
+def _run_debate():
+    from debate import DebateManager
+    DebateManager(max_rounds=5, on_event=None).run()
+
+
+def _run_initdebate():
+    from initdebate import run_debate
+    run_debate(verbose=False)
+
+
+def _run_groupchat():
+    import groupchat
+    for _ in groupchat.get_graph().stream(groupchat.create_initial_state(), stream_mode="updates"):
+        pass
+
+
+# Nombre -> (respuestas del LLM simulado, sesión)
+SCENARIOS: Dict[str, tuple] = {
+    "voting": (VOTE_RESPONSES, _run_voting),
+    "debate": (DISCUSSION_RESPONSES, _run_debate),
+    "initdebate": (DISCUSSION_RESPONSES, _run_initdebate),
+    "groupchat": (DISCUSSION_RESPONSES, _run_groupchat),
+}
+
+
+# Módulos de entrada cuya importación debe ser rápida y sin efectos secundarios
+IMPORT_MODULES = ["cli", "llms", "voting", "voting_service", "debate", "debate_runner", "initdebate",
+                  "groupchat", "telemetry"]
+# Dependencias que solo deberían cargarse al crear un grafo o un cliente
+HEAVY_MODULES = ("langgraph.graph", "langchain.agents", "langchain_openai", "langchain_ollama",
+                 "langchain_core.language_models", "rich")
+
+_IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure_import(module: str, repeat: int = 3) -> dict:
+    """Mejor tiempo de `import module` en `repeat` intérpretes nuevos y dependencias pesadas cargadas."""
+    code = _IMPORT_PROBE.format(module=module, heavy=HEAVY_MODULES)
+    here = os.path.dirname(os.path.abspath(__file__))
+    samples = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", code], cwd=here, capture_output=True, text=True, check=True)
+        samples.append(json.loads(output.stdout.strip().splitlines()[-1]))
+    return {"import_ms": _ms(min(sample["seconds"] for sample in samples)), "heavy_modules": samples[-1]["heavy"]}
+
+
+def run_import_benchmark(modules: List[str] = IMPORT_MODULES, repeat: int = 3) -> dict:
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "imports": {module: measure_import(module, repeat) for module in modules},
+    }
+
+
+def print_import_report(report: dict, budget_ms: Optional[float] = None) -> List[str]:
+    """Muestra la tabla y devuelve los módulos que superan `budget_ms`."""
+    over = []
+    print(f"{'módulo':<16}{'import_ms':>12}  dependencias pesadas")
+    for module, result in report["imports"].items():
+        flag = ""
+        if budget_ms is not None and result["import_ms"] > budget_ms:
+            over.append(module)
+            flag = "  ✗ supera el presupuesto"
+        print(f"{module:<16}{result['import_ms']:>12}  {', '.join(result['heavy_modules']) or '-'}{flag}")
+    return over
+
+
+def run_http_benchmark(requests: int = 200, concurrency: int = 16, clients: int = 8, latency: float = 0.005,
+                       providers: List[str] = ("openai", "ollama")) -> dict:
+    """
+    Llamadas reales de ChatOpenAI/ChatOllama contra StubLLMServer, con el pool
+    compartido ("shared") y con un cliente httpx por modelo ("per_client"):
+    `clients` modelos (distintas temperaturas) se reparten `requests` llamadas
+    en `concurrency` hilos. Las conexiones las cuenta el servidor.
+    """
+    import llms
+    from fake_llm import StubLLMServer
+
+    results = {}
+    with StubLLMServer(latency=latency) as server:
+        env = {"OPENAI_BASE_URL": f"{server.url}/v1", "OLLAMA_HOST": server.url,
+               "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "stub")}
+        previous = {name: os.environ.get(name) for name in env}
+        os.environ.update(env)
+        try:
+            for provider in providers:
+                model = "gpt-4o-mini" if provider == "openai" else "llama3.2"
+                for mode in ("shared", "per_client"):
+                    if mode == "shared":
+                        llms.enable_http_pool(max_connections=concurrency)
+                    else:
+                        llms.disable_http_pool()
+                    models = [llms.create_chat_model(model, round(i / clients, 3), provider) for i in range(clients)]
+                    connections = server.connections
+                    start = time.perf_counter()
+                    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                        list(executor.map(lambda i: models[i % clients].invoke("hola"), range(requests)))
+                    elapsed = time.perf_counter() - start
+                    pool = llms.get_http_pool(provider)
+                    results[f"{provider}/{mode}"] = {
+                        "requests_per_s": round(requests / elapsed, 1),
+                        "connections": server.connections - connections,
+                        "pool": pool.stats() if pool else None,
+                    }
+        finally:
+            llms.enable_http_pool()
+            for name, value in previous.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+    return {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "requests": requests, "concurrency": concurrency,
+            "clients": clients, "http": results}
+
+
+def print_http_report(report: dict):
+    print(f"{'escenario':<20}{'peticiones/s':>14}{'conexiones':>12}{'reutilizadas':>14}")
+    for name, result in report["http"].items():
+        reuse = result["pool"]["reuse_ratio"] if result["pool"] else None
+        print(f"{name:<20}{result['requests_per_s']:>14}{result['connections']:>12}"
+              f"{'-' if reuse is None else f'{reuse:.0%}':>14}")
+
+
+def percentile(samples: List[float], p: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo da en KiB, macOS en bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_scenario(name: str, sessions: int = 10, concurrency: int = 1, **model_kwargs) -> dict:
+    """
+    Ejecuta `sessions` sesiones del escenario, `concurrency` a la vez.
+    `model_kwargs` se pasa a FakeChatModel (latency, latency_distribution, ...).
+    """
+    responses, session = SCENARIOS[name]
+    created = []
+    lock = Lock()
+    # Modelos de la sesión en curso; LangGraph propaga el contexto a sus hilos
+    session_models = contextvars.ContextVar("session_models")
+
+    # Un modelo simulado por (modelo, temperatura) y sesión, como los clientes compartidos
+    # de llms.py; al no compartirse entre sesiones, cada una recibe siempre la misma secuencia
+    def factory(model, temperature, provider):
+        models = session_models.get()
+        with lock:
+            key = (provider, model, temperature)
+            if key not in models:
+                models[key] = FakeChatModel(responses=responses, **model_kwargs)
+                created.append(models[key])
+            return models[key]
+
+    def timed(_):
+        session_models.set({})
+        start = time.perf_counter()
+        session()
+        return time.perf_counter() - start
+
+    with override_chat_models(factory), contextlib.redirect_stdout(io.StringIO()):
+        timed(None)  # Calentamiento: importaciones y compilación de grafos fuera de la medida
+        warmup_calls = sum(model.calls for model in created)
+        cpu_start = time.process_time()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            latencies = list(pool.map(timed, range(sessions)))
+        wall = time.perf_counter() - start
+        cpu = time.process_time() - cpu_start
+
+    calls = sum(model.calls for model in created) - warmup_calls
+    return {
+        "sessions": sessions,
+        "concurrency": concurrency,
+        "wall_s": round(wall, 3),
+        "throughput_per_s": round(sessions / wall, 2) if wall else None,
+        "p50_ms": _ms(percentile(latencies, 50)),
+        "p95_ms": _ms(percentile(latencies, 95)),
+        "p99_ms": _ms(percentile(latencies, 99)),
+        "llm_calls_per_session": round(calls / sessions, 2) if sessions else 0,
+        "cpu_s": round(cpu, 3),
+        "cpu_ms_per_session": _ms(cpu / sessions) if sessions else None,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+def run_benchmark(scenarios: List[str], sessions: int, concurrency: int, **model_kwargs) -> dict:
+    results = {}
+    for name in scenarios:
+        print(f"▶ {name}...", file=sys.stderr)
+        results[name] = run_scenario(name, sessions, concurrency, **model_kwargs)
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": {"sessions": sessions, "concurrency": concurrency, **model_kwargs},
+        "results": results,
+    }
+
+
+def print_report(report: dict, baseline: Optional[dict] = None):
+    columns = ["throughput_per_s", "p50_ms", "p95_ms", "p99_ms", "llm_calls_per_session",
+               "cpu_ms_per_session", "peak_rss_mb"]
+    print(f"{'escenario':<12}" + "".join(f"{c:>22}" for c in columns))
+    for name, result in report["results"].items():
+        old = (baseline or {}).get("results", {}).get(name, {})
+        cells = []
+        for column in columns:
+            value = result[column]
+            cell = "-" if value is None else f"{value}"
+            if old.get(column) and value is not None:
+                cell += f" ({(value - old[column]) / old[column]:+.0%})"
+            cells.append(f"{cell:>22}")
+        print(f"{name:<12}" + "".join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de los agentes con un LLM simulado")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Lista separada por comas")
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.05, help="Segundos hasta el primer token")
+    parser.add_argument("--distribution", default="fixed", help="fixed, uniform, exponential o lognormal")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Guarda el informe en JSON")
+    parser.add_argument("--compare", help="Informe JSON previo con el que comparar")
+    parser.add_argument("--imports", action="store_true", help="Mide el tiempo de importación de los módulos")
+    parser.add_argument("--import-budget-ms", type=float, help="Falla si algún módulo tarda más en importarse")
+    parser.add_argument("--http", action="store_true",
+                        help="Compara el pool HTTP compartido con un cliente por modelo contra un servidor local")
+    args = parser.parse_args()
+
+    if args.http:
+        report = run_http_benchmark(requests=args.sessions * 20, concurrency=max(args.concurrency, 16))
+        print_http_report(report)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+        return
+
+    if args.imports:
+        report = run_import_benchmark()
+        over = print_import_report(report, args.import_budget_ms)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+        if over:
+            raise SystemExit(f"Importación por encima de {args.import_budget_ms} ms: {', '.join(over)}")
+        return
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"Escenarios desconocidos: {unknown}. Opciones: {list(SCENARIOS)}")
+
+    report = run_benchmark(
+        scenarios, args.sessions, args.concurrency,
+        latency=args.latency, latency_distribution=args.distribution, latency_jitter=args.jitter,
+        tokens_per_second=args.tokens_per_second, seed=args.seed,
+    )
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
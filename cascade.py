@@ -0,0 +1,105 @@
+"""Cascada de modelos: primero el modelo local barato, el alojado solo si hace falta.
+
+Cada nivel se prueba en orden. Si la respuesta no se acepta (vacía, no
+parseable, INDECISO, confianza baja... según el predicado `accept`) o el
+modelo falla, se escala al siguiente. La respuesta del último nivel se
+devuelve siempre. Se registran aciertos y latencia por nivel.
+"""
+
+import time
+from threading import Lock
+from typing import Any, Callable, List, Optional, Tuple
+
+
+def accept_non_empty(message) -> bool:
+    """Predicado por defecto para invoke(): cualquier respuesta con contenido."""
+    return bool(str(getattr(message, "content", "")).strip())
+
+
+class ModelCascade:
+    """
+    Enruta las llamadas por niveles de modelos, del más barato al más caro.
+
+    Args:
+        tiers: Lista de (nombre, modelo) en orden de escalado
+        accept: Predicado sobre la respuesta de invoke() para no escalar
+        min_confidence: Umbral de confianza que usan los predicados que lo necesiten
+    """
+
+    def __init__(self, tiers: List[Tuple[str, Any]], accept: Callable = accept_non_empty,
+                 min_confidence: float = 0.0):
+        if not tiers:
+            raise ValueError("La cascada necesita al menos un modelo")
+        self.tiers = tiers
+        self.accept = accept
+        self.min_confidence = min_confidence
+        self._lock = Lock()
+        self._stats = {name: {"calls": 0, "accepted": 0, "escalated": 0, "errors": 0, "latency_s": 0.0}
+                       for name, _ in tiers}
+
+    def _record(self, name: str, outcome: str, elapsed: float):
+        with self._lock:
+            stats = self._stats[name]
+            stats["calls"] += 1
+            stats[outcome] += 1
+            stats["latency_s"] += elapsed
+
+    def run(self, call: Callable[[Any, bool], Any], accept: Optional[Callable[[Any], bool]] = None):
+        """
+        Ejecuta `call(modelo, es_ultimo_nivel)` nivel a nivel hasta que
+        `accept(resultado)` sea verdadero. El último nivel no se evalúa.
+        """
+        accept = accept or self.accept
+        for index, (name, model) in enumerate(self.tiers):
+            final = index == len(self.tiers) - 1
+            start = time.perf_counter()
+            try:
+                result = call(model, final)
+            except Exception:
+                self._record(name, "errors", time.perf_counter() - start)
+                if final:
+                    raise
+                continue
+            if final or accept(result):
+                self._record(name, "accepted", time.perf_counter() - start)
+                return result
+            self._record(name, "escalated", time.perf_counter() - start)
+
+    async def arun(self, call: Callable, accept: Optional[Callable[[Any], bool]] = None):
+        """Versión asíncrona de run(); `call` devuelve un awaitable."""
+        accept = accept or self.accept
+        for index, (name, model) in enumerate(self.tiers):
+            final = index == len(self.tiers) - 1
+            start = time.perf_counter()
+            try:
+                result = await call(model, final)
+            except Exception:
+                self._record(name, "errors", time.perf_counter() - start)
+                if final:
+                    raise
+                continue
+            if final or accept(result):
+                self._record(name, "accepted", time.perf_counter() - start)
+                return result
+            self._record(name, "escalated", time.perf_counter() - start)
+
+    # Interfaz mínima de modelo de chat, para usar la cascada donde se espera un LLM
+    def invoke(self, messages, **kwargs):
+        return self.run(lambda model, _: model.invoke(messages, **kwargs))
+
+    async def ainvoke(self, messages, **kwargs):
+        return await self.arun(lambda model, _: model.ainvoke(messages, **kwargs))
+
+    def stats(self) -> dict:
+        """Por nivel: llamadas, aceptadas, escaladas, errores, tasa de acierto y latencia media."""
+        with self._lock:
+            total_requests = self._stats[self.tiers[0][0]]["calls"]
+            return {
+                name: {
+                    **{k: v for k, v in stats.items() if k != "latency_s"},
+                    "hit_rate": round(stats["accepted"] / stats["calls"], 3) if stats["calls"] else 0.0,
+                    "share_of_traffic": round(stats["accepted"] / total_requests, 3) if total_requests else 0.0,
+                    "avg_latency_ms": round(stats["latency_s"] / stats["calls"] * 1000, 1) if stats["calls"] else None,
+                }
+                for name, stats in self._stats.items()
+            }
@@ -0,0 +1,50 @@
+"""Punto de entrada único de los agentes.
+
+Uso:
+    python cli.py <comando> [opciones del comando]
+    python cli.py voting casos.jsonl --checkpoint checkpoints.sqlite
+    python cli.py groupchat --round --relevance
+
+Cada comando importa su módulo solo al ejecutarse, así que `python cli.py --help`
+no carga LangChain ni LangGraph.
+"""
+
+import importlib
+import sys
+
+# Comando -> (módulo con main(), descripción)
+COMMANDS = {
+    "voting": ("voting", "Votación multi-agente sobre casos médicos (lote JSONL)"),
+    "serve": ("voting_service", "Servicio HTTP de votación con micro-batching"),
+    "debate": ("debate", "Debate moderado entre dos agentes"),
+    "debates": ("debate_runner", "Muchos debates en paralelo desde un fichero de temas"),
+    "initdebate": ("initdebate", "Debate entre dos agentes creados con create_agent"),
+    "groupchat": ("groupchat", "Chat colaborativo de marketing"),
+    "benchmark": ("benchmark", "Benchmark con LLM simulado y tiempos de importación"),
+    "telemetry": ("telemetry", "Resumen de las trazas de telemetría"),
+}
+
+
+def usage() -> str:
+    lines = [f"Uso: {sys.argv[0]} <comando> [opciones]", "", "Comandos:"]
+    lines += [f"  {name:<12}{description}" for name, (_, description) in COMMANDS.items()]
+    lines += ["", "Opciones de cada comando: <comando> --help"]
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if not argv or argv[0] in ("-h", "--help"):
+        print(usage())
+        return
+    command, args = argv[0], argv[1:]
+    if command not in COMMANDS:
+        raise SystemExit(f"Comando desconocido: {command}\n\n{usage()}")
+    module = importlib.import_module(COMMANDS[command][0])
+    # Cada módulo analiza sys.argv con su propio argparse
+    sys.argv = [f"{sys.argv[0]} {command}", *args]
+    module.main()
+
+
+if __name__ == "__main__":
+    main()
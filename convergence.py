@@ -0,0 +1,120 @@
+"""Detector de convergencia compartido por debate.py, initdebate.py y groupchat.py.
+
+Decide si una sesión debe terminar mirando solo los últimos turnos:
+
+- "marker": el último turno contiene una frase de consenso ("ACUERDO:", ...).
+- "agreement": el último turno es muy parecido a la última postura de cada
+  uno de los demás participantes.
+- "stagnation": durante `patience` turnos seguidos cada participante repite
+  lo que ya dijo; las posturas han dejado de moverse.
+
+La similitud es TF-IDF + coseno sobre la ventana reciente (ver textsim.py),
+así que no depende de ningún modelo y no guarda estado: se puede evaluar en
+cualquier nodo del grafo a partir de la transcripción.
+"""
+
+from typing import Iterable, List, NamedTuple, Optional, Sequence
+
+from textsim import cosine, tfidf_vectors, tokenize
+from transcript import TurnLike, as_turn
+
+
+class Convergence(NamedTuple):
+    reason: str  # "marker", "agreement" o "stagnation"
+    score: float
+    turn: int    # Índice en la transcripción del turno que dispara la parada
+    role: str
+    detail: str
+
+    @property
+    def consensus(self) -> bool:
+        """Si la parada implica acuerdo (y no solo que el debate se estancó)."""
+        return self.reason in ("marker", "agreement")
+
+
+class ConvergenceDetector:
+    """
+    Args:
+        markers: Frases que declaran consenso explícito (sin distinguir mayúsculas)
+        marker_roles: Roles cuyas frases de consenso cuentan (None: cualquiera)
+        agree_threshold: Similitud con las posturas de los demás para dar acuerdo
+        repeat_threshold: Similitud con el turno anterior del mismo rol para considerarlo repetido
+        patience: Turnos repetidos seguidos para dar la sesión por estancada
+        min_turns: Turnos de participantes antes de evaluar similitud
+        window: Turnos recientes que se comparan
+        ignore_roles: Roles que no participan (moderador, objetivo inicial...)
+    """
+
+    def __init__(self, markers: Iterable[str] = (), marker_roles: Optional[Iterable[str]] = None,
+                 agree_threshold: float = 0.7, repeat_threshold: float = 0.75, patience: int = 2,
+                 min_turns: int = 4, window: int = 8, ignore_roles: Iterable[str] = ("moderator", "system", "user")):
+        self.markers = [marker.upper() for marker in markers]
+        self.marker_roles = set(marker_roles) if marker_roles is not None else None
+        self.agree_threshold = agree_threshold
+        self.repeat_threshold = repeat_threshold
+        self.patience = patience
+        self.min_turns = min_turns
+        self.window = window
+        self.ignore_roles = set(ignore_roles)
+
+    def has_marker(self, role: str, content: str) -> Optional[str]:
+        if self.marker_roles is not None and role not in self.marker_roles:
+            return None
+        upper = content.upper()
+        return next((marker for marker in self.markers if marker in upper), None)
+
+    def check(self, turns: Sequence[TurnLike]) -> Optional[Convergence]:
+        """Motivo para terminar tras el último turno de `turns`, o None si hay que seguir."""
+        if not turns:
+            return None
+        last_index = len(turns) - 1
+        role, content = as_turn(turns[last_index])
+        marker = self.has_marker(role, content)
+        if marker:
+            return Convergence("marker", 1.0, last_index, role, f"frase de consenso '{marker}'")
+
+        # Ventana de turnos de participantes, del más antiguo al último
+        recent = []
+        for index in range(last_index, -1, -1):
+            turn = as_turn(turns[index])
+            if turn.role not in self.ignore_roles:
+                recent.append((index, turn))
+                if len(recent) == self.window:
+                    break
+        recent.reverse()
+        if len(recent) < self.min_turns or recent[-1][0] != last_index:
+            return None
+
+        vectors = tfidf_vectors([tokenize(turn.content) for _, turn in recent])
+        return self._agreement(recent, vectors) or self._stagnation(recent, vectors)
+
+    def _agreement(self, recent: List, vectors: List) -> Optional[Convergence]:
+        index, last = recent[-1]
+        latest_by_role = {}
+        for position, (_, turn) in enumerate(recent[:-1]):
+            if turn.role != last.role:
+                latest_by_role[turn.role] = position
+        if not latest_by_role:
+            return None
+        score = min(cosine(vectors[-1], vectors[position]) for position in latest_by_role.values())
+        if score >= self.agree_threshold:
+            return Convergence("agreement", round(score, 3), index, last.role,
+                               f"postura similar a la de {', '.join(sorted(latest_by_role))}")
+        return None
+
+    def _stagnation(self, recent: List, vectors: List) -> Optional[Convergence]:
+        scores = []
+        for position in range(len(recent) - 1, -1, -1):
+            role = recent[position][1].role
+            previous = next((p for p in range(position - 1, -1, -1) if recent[p][1].role == role), None)
+            if previous is None:
+                break
+            score = cosine(vectors[position], vectors[previous])
+            if score < self.repeat_threshold:
+                break
+            scores.append(score)
+            if len(scores) == self.patience:
+                index, last = recent[-1]
+                return Convergence("stagnation", round(min(scores), 3), index, last.role,
+                                   f"{self.patience} turnos seguidos repitiendo la postura anterior")
+        return None
@@ -1,26 +1,51 @@
-from langchain_openai import ChatOpenAI
-from langchain_ollama import ChatOllama
-from dotenv import load_dotenv
-from typing import Optional, List, Dict, Tuple
+from llms import get_chat_model, get_routed_model
+from convergence import Convergence, ConvergenceDetector
+from memory import RollingMemory
+from rate_limit import classify_error
+from output import add_sink_arguments, format_event, sink_from_args
+from retrieval import TranscriptIndex
+from transcript import Transcript
+from typing import Callable, Optional, List, Dict, Tuple
+import argparse
+import traceback
+import uuid
+
+
+def print_event(event: Dict):
+    """Muestra en consola un evento del debate (comportamiento por defecto, síncrono)."""
+    print(format_event(event))
 
-load_dotenv()
 
 class DebateManager:
     """Gestiona un debate entre dos agentes de IA."""
     
-    def __init__(self, max_rounds: int = 5, model: str = "gpt-4o"):
+    def __init__(self, max_rounds: int = 5, model: str = "gpt-4o",
+                 on_event: Optional[Callable[[Dict], None]] = print_event, context_tokens: int = 800,
+                 detector: Optional[ConvergenceDetector] = None, session_id: Optional[str] = None):
         """
         Inicializa el gestor de debate.
         
         Args:
             max_rounds: Número máximo de rondas
             model: Modelo a utilizar ("gpt-4o" o "llama3.2")
+            on_event: Recibe cada evento del debate como dict (por defecto se
+                imprime en consola; None lo silencia). No debe bloquear.
+            context_tokens: Presupuesto de tokens del historial que ve cada agente
+            detector: Decide cuándo terminar (por defecto, "ACUERDO:" o posturas que convergen)
+            session_id: Identificador del debate en la telemetría (por defecto, uno aleatorio)
         """
         self.max_rounds = max_rounds
         self.model = model
-        self.conversation = []
+        self.session_id = session_id or uuid.uuid4().hex[:12]
+        self.on_event = on_event
+        self.conversation = Transcript()
         self.consensus_reached = False
         self.consensus_text = None
+        self.detector = detector or ConvergenceDetector(markers=("ACUERDO:",))
+        self.stop_reason: Optional[Convergence] = None
+        # El tema se pasa siempre; las intervenciones antiguas se resumen
+        # y se recuperan las más relevantes para el rol de quien habla
+        self.memory = RollingMemory(budget_tokens=context_tokens, pinned=1, index=TranscriptIndex())
         
         # Crear agentes
         self.agent_a = self._create_llm()
@@ -36,54 +61,124 @@ class DebateManager:
                         "Si llegas a consenso con el otro agente, comienza tu respuesta con 'ACUERDO:'")
     
     def _create_llm(self):
-        """Crea un modelo LLM."""
+        """
+        Crea un modelo LLM (compartido y con caché si está activada, ver llms.py).
+        Con la cascada activada, "gpt-4o" se usa solo cuando llama3.2 no responde.
+        """
         if self.model == "gpt-4o":
-            return ChatOpenAI(model_name="gpt-4o", temperature=0.7)
+            return get_routed_model("gpt-4o", temperature=0.7)
         else:
-            return ChatOllama(model="llama3.2", temperature=0.7)
+            return get_chat_model("llama3.2", temperature=0.7)
     
-    def _prepare_context(self, agent_name: str) -> str:
-        """Prepara el contexto del debate para que cada agente sepa qué pasó."""
+    def _prepare_context(self, agent_name: str, system_prompt: str = "") -> str:
+        """
+        Prepara el contexto del debate para que cada agente sepa qué pasó.
+        Los turnos antiguos se recuperan según su rol y el último argumento.
+        """
         if not self.conversation:
             return ""
         
-        context = "\n\nHistorial reciente:\n"
-        for msg in self.conversation[-4:]:
-            role = msg['role']
-            content = msg['content'][:150]
-            context += f"- [{role}]: {content}...\n"
-        
-        return context
+        query = f"{system_prompt} {self.conversation[-1].content}"
+        return "\n\n" + self.memory.context(self.conversation, query)
+
+    async def _aprepare_context(self, agent_name: str, system_prompt: str = "") -> str:
+        """Versión asíncrona de _prepare_context (el resumen puede llamar a un modelo)."""
+        if not self.conversation:
+            return ""
+
+        query = f"{system_prompt} {self.conversation[-1].content}"
+        return "\n\n" + await self.memory.acontext(self.conversation, query)
+    
+    def _emit(self, kind: str, **data):
+        """Envía un evento al manejador configurado."""
+        if self.on_event is not None:
+            self.on_event({"type": kind, **data})
+    
+    def _build_messages(self, agent_name: str, system_prompt: str, context: Optional[str] = None) -> List[Dict]:
+        """Construye los mensajes en el formato que espera ChatOpenAI/ChatOllama."""
+        if context is None:
+            context = self._prepare_context(agent_name, system_prompt)
+        user_message = f"Continúa el debate argumentando tu posición.{context}"
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_message}
+        ]
+    
+    def _run_config(self, agent_name: str) -> Dict:
+        """Nombre de la llamada y, si la telemetría está activa, su callback y session_id."""
+        from telemetry import with_telemetry
+        return with_telemetry({"run_name": agent_name}, session_id=self.session_id)
+
+    def _report_error(self, agent_name: str, error: Exception):
+        """
+        Publica el error. Los transitorios (429, 5xx, red) que siguen tras los
+        reintentos solo pierden el turno; los demás (credenciales, petición
+        inválida) se propagan, porque se repetirían en todos los turnos.
+        """
+        self._emit("agent_error", agent=agent_name, error=str(error), traceback=traceback.format_exc())
+        if classify_error(error) is None:
+            raise error
     
     def _get_agent_response(self, llm, agent_name: str, system_prompt: str) -> Optional[str]:
         """Obtiene la respuesta de un agente."""
         try:
-            context = self._prepare_context(agent_name)
-            user_message = f"Continúa el debate argumentando tu posición.{context}"
-            
-            # Construir los mensajes en el formato que espera ChatOpenAI/ChatOllama
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_message}
-            ]
-            
-            # Invocar el modelo
-            response = llm.invoke(messages)
+            response = llm.invoke(self._build_messages(agent_name, system_prompt), config=self._run_config(agent_name))
             content = response.content
-            
-            print(f"\n[{agent_name}]: {content}\n")
+            self._emit("message", agent=agent_name, content=content)
             return content
+        except Exception as e:
+            self._report_error(agent_name, e)
         
+        return None
+    
+    async def _aget_agent_response(self, llm, agent_name: str, system_prompt: str) -> Optional[str]:
+        """Versión asíncrona de _get_agent_response."""
+        try:
+            context = await self._aprepare_context(agent_name, system_prompt)
+            response = await llm.ainvoke(self._build_messages(agent_name, system_prompt, context),
+                                         config=self._run_config(agent_name))
+            content = response.content
+            self._emit("message", agent=agent_name, content=content)
+            return content
         except Exception as e:
-            print(f"Error al obtener respuesta de {agent_name}: {e}")
-            import traceback
-            traceback.print_exc()
+            self._report_error(agent_name, e)
         
         return None
     
-    def _check_for_consensus(self, content: str) -> bool:
-        """Verifica si hay consenso en el mensaje."""
-        return "ACUERDO:" in content.upper()
+    def _check_for_consensus(self) -> Optional[Convergence]:
+        """Verifica si hay consenso o si las posturas dejaron de moverse."""
+        return self.detector.check(self.conversation)
+    
+    def _turns(self):
+        """(llm, nombre, rol, prompt) de cada agente, en orden de intervención."""
+        return [
+            (self.agent_a, "🐰AGENTE A (BENEFICIOS)", "agent_A", self.prompt_a),
+            (self.agent_b, "🦊AGENTE B (RIESGOS)", "agent_B", self.prompt_b),
+        ]
+    
+    def _start(self, topic: Optional[str]) -> str:
+        if topic is None:
+            topic = "Discute sobre el impacto de la inteligencia artificial en la medicina humana."
+        self._emit("debate_start", topic=topic)
+        self.conversation.add("moderator", topic)
+        return topic
+    
+    def _record_response(self, agent_name: str, role: str, response: Optional[str]) -> bool:
+        """Guarda la respuesta y devuelve True si el debate debe terminar."""
+        if not response:
+            return False
+        self.conversation.add(role, response)
+        stop = self._check_for_consensus()
+        if stop is None:
+            return False
+        self.stop_reason = stop
+        if stop.consensus:
+            self.consensus_reached = True
+            self.consensus_text = response
+            self._emit("consensus_proposed", agent=agent_name, reason=stop.reason, detail=stop.detail)
+        else:
+            self._emit("stalled", agent=agent_name, reason=stop.reason, detail=stop.detail)
+        return True
     
     def run(self, topic: str = None) -> Tuple[bool, str]:
         """
@@ -95,72 +190,57 @@ class DebateManager:
         Returns:
             Tupla con (hay_consenso, conclusión)
         """
-        if topic is None:
-            topic = "Discute sobre el impacto de la inteligencia artificial en la medicina humana."
-        
-        print("\n" + "="*70)
-        print("🤜🤛 INICIANDO DEBATE")
-        print("="*70 + "\n")
-        
-        initial_message = {"role": "moderator", "content": topic}
-        self.conversation.append(initial_message)
-        print(f"[MODERADOR]: {topic}\n")
+        self._start(topic)
         
         # Rondas de debate
         for round_num in range(self.max_rounds):
-            print(f"\n{'='*70}\nRonda {round_num + 1}/{self.max_rounds}\n{'='*70}")
+            self._emit("round_start", round=round_num + 1, max_rounds=self.max_rounds)
             
-            # Agent A responde
-            response_a = self._get_agent_response(self.agent_a, "🐰AGENTE A (BENEFICIOS)", self.prompt_a)
-            if response_a:
-                self.conversation.append({"role": "agent_A", "content": response_a})
-                
-                if self._check_for_consensus(response_a):
-                    self.consensus_reached = True
-                    self.consensus_text = response_a
-                    print("✓ AGENTE A propone CONSENSO")
+            for llm, agent_name, role, prompt in self._turns():
+                response = self._get_agent_response(llm, agent_name, prompt)
+                if self._record_response(agent_name, role, response):
+                    return self._generate_final_summary()
+                if not response:
+                    # Si falla el agente A se pasa a la siguiente ronda
                     break
-            else:
-                print("✗ Error en respuesta de AGENTE A 🐰")
-                continue
+        
+        return self._generate_final_summary()
+    
+    async def arun(self, topic: str = None) -> Tuple[bool, str]:
+        """
+        Versión asíncrona de run(): no bloquea el event loop mientras espera
+        al modelo, así que muchos debates pueden correr a la vez (ver debate_runner.py).
+        """
+        self._start(topic)
+        
+        for round_num in range(self.max_rounds):
+            self._emit("round_start", round=round_num + 1, max_rounds=self.max_rounds)
             
-            # Agent B responde
-            response_b = self._get_agent_response(self.agent_b, "🦊AGENTE B (RIESGOS)", self.prompt_b)
-            if response_b:
-                self.conversation.append({"role": "agent_B", "content": response_b})
-                
-                if self._check_for_consensus(response_b):
-                    self.consensus_reached = True
-                    self.consensus_text = response_b
-                    print("✓ AGENTE B propone CONSENSO")
+            for llm, agent_name, role, prompt in self._turns():
+                response = await self._aget_agent_response(llm, agent_name, prompt)
+                if self._record_response(agent_name, role, response):
+                    return self._generate_final_summary()
+                if not response:
                     break
-            else:
-                print("✗ Error en respuesta de AGENTE B 🦊")
         
         return self._generate_final_summary()
     
     def _generate_final_summary(self) -> Tuple[bool, str]:
         """Genera un resumen final del debate."""
-        print("\n" + "="*70)
-        print("DEBATE CONCLUIDO")
-        print("="*70 + "\n")
-        
         if self.consensus_reached and self.consensus_text:
-            print("✓ SE ALCANZÓ CONSENSO\n")
-            print(f"CONCLUSIÓN:\n{self.consensus_text}\n")
+            self._emit("debate_end", consensus=True, conclusion=self.consensus_text)
             return True, self.consensus_text
-        else:
-            print("✗ NO SE ALCANZÓ CONSENSO\n")
-            print("ÚLTIMO ARGUMENTO DEL DEBATE:")
-            if self.conversation:
-                last_msg = self.conversation[-1]
-                print(f"[{last_msg['role']}]: {last_msg['content']}\n")
-                return False, last_msg['content']
-            return False, "Sin conclusión disponible"
+        
+        if self.conversation:
+            last_msg = self.conversation[-1]
+            self._emit("debate_end", consensus=False, conclusion=last_msg.content, last_role=last_msg.role)
+            return False, last_msg.content
+        self._emit("debate_end", consensus=False, conclusion="Sin conclusión disponible")
+        return False, "Sin conclusión disponible"
     
     def get_conversation_history(self) -> List[Dict]:
         """Retorna el historial completo del debate."""
-        return self.conversation
+        return self.conversation.as_dicts()
     
     def print_full_debate(self):
         """Imprime el debate completo formateado."""
@@ -169,32 +249,28 @@ class DebateManager:
         print("="*70 + "\n")
         
         for msg in self.conversation:
-            role = msg['role'].upper()
-            content = msg['content']
+            role = msg.role.upper()
+            content = msg.content
             print(f"[{role}]:\n{content}\n")
             print("-" * 70 + "\n")
 
 
 def main():
     """Función principal para ejecutar el debate."""
+    parser = argparse.ArgumentParser(description="Debate moderado entre dos agentes")
+    parser.add_argument("--topic", default="Discute sobre el impacto de la inteligencia artificial en la medicina humana.")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--model", default="gpt-4o", help="gpt-4o o llama3.2")
+    add_sink_arguments(parser)
+    args = parser.parse_args()
     
-    # Crear gestor de debate
-    debate_manager = DebateManager(
-        max_rounds=5,
-        model="gpt-4o"  # Cambiar a "llama3.2" si lo prefieres
-    )
-    
-    # Ejecutar debate
-    consensus, conclusion = debate_manager.run(
-        topic="Discute sobre el impacto de la inteligencia artificial en la medicina humana."
-    )
-    
-    # Mostrar resultado
-    print("\n" + "="*70)
-    print("RESULTADO FINAL")
-    print("="*70)
-    print(f"Consenso alcanzado: {'SÍ ✓' if consensus else 'NO ✗'}")
-    print(f"\nConclusión final:\n{conclusion}\n")
+    # Los eventos (intervenciones, consenso y resultado final) van al sink elegido
+    sink = sink_from_args(args)
+    try:
+        debate_manager = DebateManager(max_rounds=args.rounds, model=args.model, on_event=sink)
+        debate_manager.run(topic=args.topic)
+    finally:
+        sink.close()
     
     # Opcional: mostrar debate completo
     # debate_manager.print_full_debate()
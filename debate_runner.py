@@ -0,0 +1,144 @@
+"""Ejecuta muchos debates de DebateManager a la vez.
+
+Cada tema tiene su propio DebateManager (el estado del debate vive en la
+instancia), y un semáforo limita cuántos están esperando al modelo al mismo
+tiempo. Los clientes LLM son compartidos (ver llms.py). Los eventos de todos
+los debates van a una cola que consume una única tarea, así que mostrarlos
+nunca frena a los debates.
+
+Uso:
+    python debate_runner.py temas.txt --concurrency 16 --output debates.jsonl
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+from debate import DebateManager
+from output import add_sink_arguments, sink_from_args
+
+
+def print_progress(event: Dict):
+    """Consumidor por defecto: una línea por intervención y por debate terminado."""
+    prefix = f"[{event['index']}]"
+    if event["type"] == "message":
+        print(f"{prefix} {event['agent']}: {event['content'][:80]}")
+    elif event["type"] == "agent_error":
+        print(f"{prefix} ✗ Error en {event['agent']}: {event['error']}")
+    elif event["type"] == "stalled":
+        print(f"{prefix} ■ Estancado: {event['detail']}")
+    elif event["type"] == "debate_end":
+        print(f"{prefix} {'✓ CONSENSO' if event['consensus'] else '✗ SIN CONSENSO'}")
+
+
+async def _drain(queue: asyncio.Queue, handler: Callable[[Dict], None]):
+    while True:
+        event = await queue.get()
+        if event is None:
+            return
+        try:
+            handler(event)
+        except Exception as e:
+            print(f"Error en el manejador de eventos: {e}")
+
+
+async def run_debates(topics: Iterable[str], concurrency: int = 8, output: Optional[str] = None,
+                      max_rounds: int = 5, model: str = "gpt-4o",
+                      on_event: Optional[Callable[[Dict], None]] = print_progress) -> List[Dict]:
+    """
+    Ejecuta un debate por tema, como máximo `concurrency` a la vez.
+
+    Args:
+        topics: Temas de los debates
+        concurrency: Debates simultáneos
+        output: Ruta JSONL donde se escribe cada resultado al terminar (opcional)
+        max_rounds: Rondas máximas por debate
+        model: Modelo de los agentes ("gpt-4o" o "llama3.2")
+        on_event: Recibe los eventos de todos los debates, con su "index" (None los descarta)
+
+    Returns:
+        Resultados en el orden de los temas: index, topic, consensus,
+        conclusion, history, stop_reason, elapsed_s y error
+    """
+    topics = list(topics)
+    semaphore = asyncio.Semaphore(concurrency)
+    queue: asyncio.Queue = asyncio.Queue()
+    consumer = asyncio.create_task(_drain(queue, on_event)) if on_event else None
+    results: List[Optional[Dict]] = [None] * len(topics)
+    sink = open(output, "w", encoding="utf-8") if output else None
+
+    async def run_one(index: int, topic: str):
+        async with semaphore:
+            emit = (lambda event: queue.put_nowait({"index": index, **event})) if consumer else None
+            manager = None
+            start = time.perf_counter()
+            try:
+                # Si falla al crearse (modelo, cliente), el error queda en su tema y los demás siguen
+                manager = DebateManager(max_rounds=max_rounds, model=model, on_event=emit)
+                consensus, conclusion = await manager.arun(topic)
+                error = None
+            except Exception as e:
+                consensus, conclusion, error = False, None, repr(e)
+            result = {
+                "index": index,
+                "topic": topic,
+                "consensus": consensus,
+                "conclusion": conclusion,
+                "history": manager.get_conversation_history() if manager else [],
+                "stop_reason": manager.stop_reason._asdict() if manager and manager.stop_reason else None,
+                "elapsed_s": round(time.perf_counter() - start, 3),
+                "error": error,
+            }
+        results[index] = result
+        if sink:
+            sink.write(json.dumps(result, ensure_ascii=False) + "\n")
+            sink.flush()
+
+    try:
+        await asyncio.gather(*(run_one(i, topic) for i, topic in enumerate(topics)))
+    finally:
+        if consumer:
+            queue.put_nowait(None)
+            await consumer
+        if sink:
+            sink.close()
+    return results
+
+
+def load_topics(path: str) -> List[str]:
+    """Un tema por línea; se ignoran las líneas vacías y las que empiezan por #."""
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ejecuta muchos debates en paralelo")
+    parser.add_argument("topics", help="Fichero con un tema por línea")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--output", default="debates.jsonl")
+    parser.add_argument("--max-rounds", type=int, default=5)
+    parser.add_argument("--model", default="gpt-4o", help="gpt-4o o llama3.2")
+    parser.add_argument("--quiet", action="store_true", help="No muestra el progreso")
+    add_sink_arguments(parser, default=None)  # Sin --sink, una línea por evento (print_progress)
+    args = parser.parse_args()
+
+    sink = sink_from_args(args) if args.sink else None
+    start = time.perf_counter()
+    try:
+        results = asyncio.run(run_debates(
+            load_topics(args.topics), args.concurrency, args.output, args.max_rounds, args.model,
+            on_event=None if args.quiet else sink or print_progress,
+        ))
+    finally:
+        if sink:
+            sink.close()
+    agreed = sum(1 for r in results if r["consensus"])
+    failed = sum(1 for r in results if r["error"])
+    print(f"\n{len(results)} debates en {time.perf_counter() - start:.1f}s: "
+          f"{agreed} con consenso, {failed} con error. Resultados en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
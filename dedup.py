@@ -0,0 +1,212 @@
+"""Agrupación de casos casi duplicados para votar una sola vez por grupo.
+
+Los lotes traen muchas versiones reescritas del mismo caso ("Paciente de 65
+años con presión arterial elevada..." con pequeñas variaciones) que una caché
+exacta no reconoce. El texto del caso se canonicaliza (minúsculas, sin tildes
+ni puntuación), se resume con MinHash sobre n-gramas de caracteres y se busca
+en un índice LSH. Si el candidato más parecido supera el umbral de Jaccard,
+el caso pertenece a ese grupo; si no, abre uno nuevo.
+
+El veredicto se juzga sobre la acción, y ahí una palabra lo cambia todo ("No
+se prescribió..." frente a "Se prescribió...", un fármaco por otro), aunque
+los n-gramas apenas varíen. Por eso la acción no se compara por similitud:
+dentro de un grupo de casos, un veredicto solo se reutiliza si la acción
+tiene exactamente las mismas palabras significativas (las negaciones y las
+cifras cuentan siempre; el orden y los artículos, no). Cualquier otra acción
+se evalúa aparte.
+
+Las cifras (edades, tensiones, dosis) cambian el caso clínico, así que dos
+casos solo se agrupan si contienen exactamente los mismos números.
+
+Los veredictos que ya no interesan se olvidan con forget(): cuando un grupo
+de casos se queda sin veredictos, salen también sus textos, sus n-gramas y
+sus entradas del índice LSH, así que la memoria depende de los veredictos
+que se recuerdan y no del tamaño del lote.
+"""
+
+import hashlib
+import re
+from typing import Dict, FrozenSet, List, NamedTuple, Set, Tuple
+
+import numpy as np
+
+from textsim import STOPWORDS, normalize
+
+_NON_WORD = re.compile(r"[^a-z0-9ñ]+")
+_NUMBER = re.compile(r"\d+(?:[.,]\d+)?")
+_PRIME = np.uint64((1 << 61) - 1)
+_MASK = np.uint64((1 << 32) - 1)
+
+# Palabras que invierten el sentido de la acción; nunca se ignoran
+NEGATIONS = frozenset("no sin nunca ni tampoco jamas ningun ninguno ninguna nada not without never".split())
+
+
+def canonicalize(text: str) -> str:
+    """Minúsculas, sin tildes ni signos y con los espacios colapsados."""
+    return _NON_WORD.sub(" ", normalize(text)).strip()
+
+
+def shingles(text: str, k: int = 5) -> set:
+    """n-gramas de `k` caracteres del texto canónico."""
+    if len(text) <= k:
+        return {text}
+    return {text[i:i + k] for i in range(len(text) - k + 1)}
+
+
+def action_key(action: str) -> FrozenSet[str]:
+    """Palabras significativas de la acción: sin palabras vacías, pero con negaciones y cifras."""
+    return frozenset(word for word in canonicalize(action).split() if word in NEGATIONS or word not in STOPWORDS)
+
+
+def jaccard(a: set, b: set) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def _lsh_shape(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """(bandas, filas) cuyo umbral aproximado (1/b)^(1/r) queda justo por debajo de `threshold`."""
+    shapes = [(num_perm // rows, rows) for rows in range(1, num_perm + 1) if num_perm % rows == 0]
+    below = [shape for shape in shapes if (1 / shape[0]) ** (1 / shape[1]) <= threshold]
+    # Mejor algún candidato de más (se verifica con Jaccard exacto) que perder duplicados
+    return max(below, key=lambda shape: (1 / shape[0]) ** (1 / shape[1])) if below else shapes[0]
+
+
+class _Cluster(NamedTuple):
+    grams: set                 # n-gramas del primer caso del grupo
+    numbers: Tuple[str, ...]   # Cifras que contiene
+    band_keys: List[bytes]     # Entradas en el índice LSH
+    texts: Set[str]            # Textos canónicos asignados al grupo
+    verdicts: Set[int]         # Veredictos vivos del grupo
+
+
+class Assignment(NamedTuple):
+    cluster: int          # Número del veredicto (grupo de casos + acción), en orden de aparición
+    representative: str   # Id del caso que se evalúa por el grupo
+    similarity: float     # Jaccard del caso con el del representante (1.0 para el propio representante)
+    is_new: bool          # True si el caso abre el grupo y hay que evaluarlo
+
+
+class CaseClusterer:
+    """
+    Agrupación incremental de casos por similitud del caso y acción equivalente.
+
+    Args:
+        threshold: Jaccard mínimo (sobre n-gramas del caso) para considerar dos casos el mismo
+        num_perm: Permutaciones de MinHash
+        k: Tamaño de los n-gramas de caracteres
+        seed: Semilla de las permutaciones (la agrupación es determinista)
+    """
+
+    def __init__(self, threshold: float = 0.8, num_perm: int = 128, k: int = 5, seed: int = 1):
+        self.threshold = threshold
+        self.k = k
+        self.bands, self.rows = _lsh_shape(num_perm, threshold)
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(self.bands)]
+        self._exact: Dict[str, int] = {}
+        self._clusters: Dict[int, _Cluster] = {}
+        # (grupo de casos, acción) -> (número de veredicto, id del representante)
+        self._verdicts: Dict[Tuple[int, FrozenSet[str]], Tuple[int, str]] = {}
+        self._verdict_keys: Dict[int, Tuple[int, FrozenSet[str]]] = {}
+        self._next_cluster = 0
+        self._next_verdict = 0
+
+    def __len__(self) -> int:
+        """Veredictos distintos (casos que hay que evaluar)."""
+        return len(self._verdicts)
+
+    def _signature(self, grams: set) -> np.ndarray:
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(g.encode(), digest_size=4).digest(), "little") for g in grams),
+            dtype=np.uint64, count=len(grams),
+        )
+        # (a·x + b) mod p con x de 32 bits: a·x < 2^64, sin desbordamiento
+        permuted = (self._a[:, None] * hashes[None, :] % _PRIME + self._b[:, None]) % _PRIME
+        return (permuted & _MASK).min(axis=1)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def _case_cluster(self, case: str) -> Tuple[int, float]:
+        """(grupo del caso, Jaccard con su primer caso); abre un grupo si no hay ninguno parecido."""
+        text = canonicalize(case)
+        if text in self._exact:
+            return self._exact[text], 1.0
+
+        grams = shingles(text, self.k)
+        numbers = tuple(sorted(_NUMBER.findall(text)))
+        keys = self._band_keys(self._signature(grams))
+        best, best_similarity = None, 0.0
+        candidates = {cluster for band, key in enumerate(keys) for cluster in self._buckets[band].get(key, ())}
+        for cluster in sorted(candidates):
+            if self._clusters[cluster].numbers != numbers:
+                continue
+            similarity = jaccard(grams, self._clusters[cluster].grams)
+            if similarity > best_similarity:
+                best, best_similarity = cluster, similarity
+
+        if best is not None and best_similarity >= self.threshold:
+            self._exact[text] = best
+            self._clusters[best].texts.add(text)
+            return best, round(best_similarity, 3)
+
+        cluster = self._next_cluster
+        self._next_cluster += 1
+        self._clusters[cluster] = _Cluster(grams, numbers, keys, {text}, set())
+        self._exact[text] = cluster
+        for band, key in enumerate(keys):
+            self._buckets[band].setdefault(key, []).append(cluster)
+        return cluster, 1.0
+
+    def assign(self, case_id: str, case: str, action: str) -> Assignment:
+        """Asigna el caso a un veredicto existente (caso parecido y misma acción) o abre uno nuevo."""
+        cluster, similarity = self._case_cluster(case)
+        key = (cluster, action_key(action))
+        if key in self._verdicts:
+            verdict, representative = self._verdicts[key]
+            return Assignment(verdict, representative, similarity, False)
+        verdict = self._next_verdict
+        self._next_verdict += 1
+        self._verdicts[key] = (verdict, case_id)
+        self._verdict_keys[verdict] = key
+        self._clusters[cluster].verdicts.add(verdict)
+        return Assignment(verdict, case_id, 1.0, True)
+
+    def forget(self, verdict: int):
+        """
+        Olvida un veredicto: el siguiente caso equivalente abrirá uno nuevo. Si su
+        grupo de casos se queda sin veredictos, se borra también del índice.
+        """
+        key = self._verdict_keys.pop(verdict, None)
+        if key is None:
+            return
+        del self._verdicts[key]
+        cluster = self._clusters[key[0]]
+        cluster.verdicts.discard(verdict)
+        if cluster.verdicts:
+            return
+        del self._clusters[key[0]]
+        for text in cluster.texts:
+            del self._exact[text]
+        for band, band_key in enumerate(cluster.band_keys):
+            bucket = self._buckets[band][band_key]
+            bucket.remove(key[0])
+            if not bucket:
+                del self._buckets[band][band_key]
+
+
+def copy_verdict(result: dict, case: str, action: str, assignment: Assignment) -> dict:
+    """
+    Resultado de un miembro del grupo: el veredicto del representante con el caso
+    propio, también en el resumen de votación (que de otro modo mostraría el ajeno).
+    """
+    original = f"CASO: {result.get('case', '')}\nACCIÓN: {result.get('action', '')}\n"
+    note = (f"CASO: {case}\nACCIÓN: {action}\n"
+            f"(Veredicto reutilizado del caso {assignment.representative}, similitud {assignment.similarity})\n")
+    messages = [message.replace(original, note) if isinstance(message, str) else message
+                for message in result.get("messages", [])]
+    return {**result, "case": case, "action": action, "messages": messages,
+            "duplicate_of": assignment.representative, "similarity": assignment.similarity}
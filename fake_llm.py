@@ -0,0 +1,273 @@
+"""Modelo de chat simulado para probar los agentes sin llamar a ningún proveedor.
+
+FakeChatModel sustituye al cliente; StubLLMServer sustituye al proveedor (un
+servidor HTTP local con las APIs de OpenAI y Ollama) para probar los clientes
+reales y sus conexiones.
+"""
+
+import asyncio
+import itertools
+import json
+import math
+import random
+import re
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from string import Template
+from threading import Lock, Thread
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+DEFAULT_VOTE_RESPONSE = '{"voto": "CORRECTO", "confianza": 0.9, "razonamiento": "Respuesta simulada."}'
+
+
+# Distribuciones de latencia: (latencia, jitter, rng) -> segundos
+LATENCY_DISTRIBUTIONS = {
+    "fixed": lambda latency, jitter, rng: latency,
+    "uniform": lambda latency, jitter, rng: rng.uniform(latency * (1 - jitter), latency * (1 + jitter)),
+    "exponential": lambda latency, jitter, rng: rng.expovariate(1 / latency),
+    # Mediana = latency; jitter es la desviación del logaritmo (colas largas, como las APIs reales)
+    "lognormal": lambda latency, jitter, rng: rng.lognormvariate(math.log(latency), jitter),
+}
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Devuelve respuestas predefinidas (en ciclo) tras una latencia simulada.
+
+    Las respuestas pueden ser plantillas con $call (número de llamada),
+    $system (inicio del prompt de sistema) y $last (inicio del último mensaje).
+
+    Args:
+        responses: Textos que se devuelven por turnos
+        latency: Segundos hasta el primer token (media o mediana según la distribución)
+        latency_distribution: "fixed", "uniform", "exponential" o "lognormal"
+        latency_jitter: Dispersión de la distribución (fracción o sigma del logaritmo)
+        tokens_per_second: Velocidad de generación (0: instantánea)
+        seed: Semilla para que la latencia sea reproducible
+        n: Respuestas por llamada (como el parámetro n de OpenAI)
+    """
+
+    responses: List[str] = [DEFAULT_VOTE_RESPONSE]
+    latency: float = 0.0
+    latency_distribution: str = "fixed"
+    latency_jitter: float = 0.0
+    tokens_per_second: float = 0.0
+    seed: Optional[int] = None
+    n: int = 1
+
+    _cycle: Any = PrivateAttr(default=None)
+    _rng: Any = PrivateAttr(default=None)
+    _lock: Any = PrivateAttr(default_factory=Lock)
+    _calls: int = PrivateAttr(default=0)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    @property
+    def calls(self) -> int:
+        """Respuestas generadas hasta ahora (una por muestra si n > 1)."""
+        return self._calls
+
+    def _next_response(self, messages: List[BaseMessage]) -> str:
+        with self._lock:
+            if self._cycle is None:
+                self._cycle = itertools.cycle(self.responses)
+            self._calls += 1
+            template, call = next(self._cycle), self._calls
+        if "$" not in template:
+            return template
+        return Template(template).safe_substitute(
+            call=call,
+            system=str(messages[0].content)[:60] if messages else "",
+            last=str(messages[-1].content)[:60] if messages else "",
+        )
+
+    def _first_token_delay(self) -> float:
+        if not self.latency:
+            return 0.0
+        with self._lock:
+            if self._rng is None:
+                self._rng = random.Random(self.seed)
+            return max(0.0, LATENCY_DISTRIBUTIONS[self.latency_distribution](
+                self.latency, self.latency_jitter, self._rng))
+
+    def _token_delay(self) -> float:
+        return 1 / self.tokens_per_second if self.tokens_per_second else 0.0
+
+    def _result(self, messages: List[BaseMessage], n: int) -> tuple:
+        """(resultado, segundos de generación de los tokens)"""
+        texts = [self._next_response(messages) for _ in range(n)]
+        generation = max(len(_split_tokens(text)) for text in texts) * self._token_delay()
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text)) for text in texts]), generation
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs: Any) -> ChatResult:
+        result, generation = self._result(messages, kwargs.get("n", self.n))
+        delay = self._first_token_delay() + generation
+        if delay:
+            time.sleep(delay)
+        return result
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, **kwargs: Any) -> ChatResult:
+        result, generation = self._result(messages, kwargs.get("n", self.n))
+        delay = self._first_token_delay() + generation
+        if delay:
+            await asyncio.sleep(delay)
+        return result
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        delay = self._first_token_delay()
+        if delay:
+            time.sleep(delay)
+        for i, token in enumerate(_split_tokens(self._next_response(messages))):
+            if i and self.tokens_per_second:
+                time.sleep(self._token_delay())
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        delay = self._first_token_delay()
+        if delay:
+            await asyncio.sleep(delay)
+        for i, token in enumerate(_split_tokens(self._next_response(messages))):
+            if i and self.tokens_per_second:
+                await asyncio.sleep(self._token_delay())
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+
+def _split_tokens(text: str) -> List[str]:
+    """Trocea el texto en "tokens" (palabras con su espacio) para simular streaming."""
+    return re.findall(r"\S+\s*|\s+", text)
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        stub = self.server.stub
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        text = stub._next_response()
+        if stub.latency:
+            time.sleep(stub.latency)
+        if self.path.endswith("/chat/completions"):
+            status, payload = 200, _openai_payload(body, text)
+            content_type = "text/event-stream" if body.get("stream") else "application/json"
+        elif self.path.endswith("/api/chat"):
+            status, payload, content_type = 200, _ollama_payload(body, text), "application/x-ndjson"
+        else:
+            status, payload, content_type = 404, json.dumps({"error": f"Ruta desconocida: {self.path}"}), \
+                "application/json"
+        self.send_response(status)
+        data = payload.encode()
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def _openai_payload(body: dict, text: str) -> str:
+    base = {"id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "created": int(time.time()), "model": body.get("model", "stub")}
+    prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in body.get("messages", []))
+    usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(_split_tokens(text)),
+             "total_tokens": prompt_tokens + len(_split_tokens(text))}
+    if not body.get("stream"):
+        return json.dumps({**base, "object": "chat.completion", "usage": usage, "choices": [
+            {"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}]})
+    chunks = [{**base, "object": "chat.completion.chunk", "choices": [
+        {"index": 0, "delta": {"role": "assistant", "content": token}, "finish_reason": None}]}
+        for token in _split_tokens(text)]
+    chunks.append({**base, "object": "chat.completion.chunk", "usage": usage, "choices": [
+        {"index": 0, "delta": {}, "finish_reason": "stop"}]})
+    return "".join(f"data: {json.dumps(chunk)}\n\n" for chunk in chunks) + "data: [DONE]\n\n"
+
+
+def _ollama_payload(body: dict, text: str) -> str:
+    base = {"model": body.get("model", "stub"), "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}
+    final = {**base, "message": {"role": "assistant", "content": ""}, "done": True, "done_reason": "stop",
+             "prompt_eval_count": sum(len(str(m.get("content", "")).split()) for m in body.get("messages", [])),
+             "eval_count": len(_split_tokens(text))}
+    if not body.get("stream", True):
+        return json.dumps({**final, "message": {"role": "assistant", "content": text}}) + "\n"
+    lines = [{**base, "message": {"role": "assistant", "content": token}, "done": False}
+             for token in _split_tokens(text)]
+    return "".join(json.dumps(line) + "\n" for line in lines + [final])
+
+
+class _StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def process_request(self, request, client_address):
+        with self.stub._lock:
+            self.stub.connections += 1
+        super().process_request(request, client_address)
+
+
+class StubLLMServer:
+    """
+    Servidor HTTP local que responde como OpenAI (POST /v1/chat/completions,
+    también en streaming) y como Ollama (POST /api/chat), con keep-alive.
+    Cuenta las conexiones TCP aceptadas y las peticiones servidas.
+
+    Uso:
+        with StubLLMServer(latency=0.01) as server:
+            os.environ["OPENAI_BASE_URL"] = server.url + "/v1"
+            ...
+            print(server.connections, server.requests)
+
+    Args:
+        responses: Textos que se devuelven por turnos
+        latency: Segundos de espera antes de cada respuesta
+        host: Interfaz de escucha
+        port: Puerto (0 = uno libre)
+    """
+
+    def __init__(self, responses: Optional[List[str]] = None, latency: float = 0.0,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.responses = responses or [DEFAULT_VOTE_RESPONSE]
+        self.latency = latency
+        self.connections = 0
+        self.requests = 0
+        self._lock = Lock()
+        self._cycle = itertools.cycle(self.responses)
+        self._server = _StubHTTPServer((host, port), _StubHandler)
+        self._server.stub = self
+        self._thread: Optional[Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _next_response(self) -> str:
+        with self._lock:
+            self.requests += 1
+            return next(self._cycle)
+
+    def start(self) -> "StubLLMServer":
+        self._thread = Thread(target=self._server.serve_forever, name="stub-llm-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "StubLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -8,33 +8,84 @@
 
 # Flujo de Conversación:
 # El coordinador inicia, luego los 4 agentes hablan secuencialmente, con el coordinador sintetizando cada ronda.
+# En modo "round" los 4 agentes responden en paralelo sobre el mismo estado del chat y el coordinador sintetiza.
 # El chat termina cuando hay consenso o se alcanzan 8 turnos.
+# Con stream_marketing_chat / astream_marketing_chat (o --stream) las respuestas llegan token a token.
 # Estructura de Estado:
 # Utiliza ChatState para mantener historial, contar turnos y rastrear cuál es el siguiente agente. El enrutador (router_node)
 # dirige la conversación de forma inteligente. """
 
-import os
-import json
-from typing import Annotated, Any, Literal
-from langchain_openai import ChatOpenAI
-from langgraph.graph import StateGraph, START, END
-from langgraph.types import StreamWriter
+import argparse
+import operator
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Annotated, AsyncIterator, Iterator, Literal
+from langgraph.constants import START, END
 from typing_extensions import TypedDict
-from langchain_core.messages import HumanMessage, AIMessage, BaseMessage
-from dotenv import load_dotenv
-load_dotenv()
+from convergence import ConvergenceDetector
+from llms import get_chat_model
+from memory import RollingMemory, estimate_tokens
+from output import TextSink, add_sink_arguments, sink_from_args
+from retrieval import TranscriptIndex
+from speaker_selection import add_counts, compile_tasks, count_task_hits, open_tasks, rank_speakers
+from transcript import Transcript, Turn, append_turns
 
-# Configurar modelo
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.7)
+# Configurar modelo (cliente compartido y con caché si está activada, ver llms.py)
+def get_llm():
+    return get_chat_model("gpt-4o-mini", temperature=0.7)
+
+# Tokens de historial que ve cada agente: el objetivo, un resumen y los últimos turnos
+CONTEXT_TOKENS = 1200
+
+# Sesiones con índice de recuperación en memoria, por nodo (las menos recientes se descartan)
+MAX_SESSION_INDEXES = 256
+
+SPECIALISTS = ["creative", "analyst", "brand_expert", "market_specialist"]
+
+# "sequential": un agente tras otro; "round": los especialistas en paralelo y luego el coordinador
+CHAT_MODES = ("sequential", "round")
+
+# "fixed": ciclo fijo de especialistas; "relevance": habla quien puede cubrir tareas abiertas
+ROUTING_MODES = ("fixed", "relevance")
+
+# Tareas del objetivo y palabras clave que indican que se están tratando
+TASKS = {
+    "canales": ["canal", "instagram", "tiktok", "redes sociales", "youtube", "app", "email", "influencer", "whatsapp"],
+    "propuesta_valor": ["propuesta de valor", "diferencia", "beneficio", "posicionamiento", "promesa", "valor unico"],
+    "productos": ["producto", "tarjeta", "cuenta", "seguro", "comision", "divisa", "cashback", "prestamo"],
+    "contenido": ["contenido", "campaña", "activaci", "evento", "storytelling", "video", "embajador"],
+    "metricas": ["metrica", "kpi", "conversion", "retencion", "roi", "adquisicion", "nps", "engagement"],
+}
+
+# Afinidad de cada especialista por cada tarea
+TASK_AFFINITY = {
+    "creative": {"contenido": 1.0, "canales": 0.8, "propuesta_valor": 0.4},
+    "analyst": {"metricas": 1.0, "productos": 0.5, "canales": 0.3},
+    "brand_expert": {"propuesta_valor": 1.0, "contenido": 0.5},
+    "market_specialist": {"productos": 0.8, "canales": 0.7, "propuesta_valor": 0.5},
+}
+
+_TASK_PATTERNS = compile_tasks(TASKS)
+
+# El chat termina cuando el coordinador declara el plan o cuando las posturas convergen o se estancan
+CONVERGENCE = ConvergenceDetector(markers=("PLAN LISTO Y CONSENSUADO",), marker_roles=("coordinator",))
 
 # Definir estado del grafo
+# chat_history es de solo-añadir: los nodos devuelven únicamente su turno nuevo
 class ChatState(TypedDict):
-    messages: list
     next_agent: str
-    chat_history: list
+    chat_history: Annotated[Transcript, append_turns]
     final_plan: str
-    turn_count: int
+    turn_count: Annotated[int, operator.add]  # Los nodos devuelven 1 por turno
     max_turns: int
+    summary: str     # Resumen incremental de los turnos que ya salieron de la ventana
+    summarized: int  # Cuántos turnos de chat_history están en el resumen
+    coverage: Annotated[dict, add_counts]  # Menciones de cada tarea en las respuestas de los especialistas
+    skipped: Annotated[list, operator.add]  # Especialistas que el ciclo fijo habría llamado y se saltaron
+    tokens: Annotated[int, operator.add]  # Tokens estimados (prompt + respuesta) de todos los turnos
+    stop_reason: dict  # Por qué terminó el chat antes de max_turns (ver convergence.py)
 
 # Prompts para cada agente
 SYSTEM_PROMPTS = {
@@ -74,18 +125,160 @@ SYSTEM_PROMPTS = {
         Aporta perspectivas sobre qué realmente motiva a los jóvenes viajeros."""
     }
 
-def create_agent_node(agent_name: str):
-    """Factory para crear nodos de agentes"""
-    def agent_node(state: dict) -> dict:
-        system_prompt = SYSTEM_PROMPTS[agent_name]
-        
-        # Contexto del chat
+def _next_in_cycle(agent_name: str) -> str:
+    current_index = SPECIALISTS.index(agent_name) if agent_name in SPECIALISTS else -1
+    return SPECIALISTS[(current_index + 1) % len(SPECIALISTS)]
+
+def select_by_relevance(last: str, coverage: dict):
+    """
+    Siguiente orador según las tareas abiertas. Devuelve (agente, saltados).
+    Si ningún especialista tiene algo que aportar, el coordinador cierra el plan.
+    """
+    fixed = _next_in_cycle(last)
+    ranked = rank_speakers(SPECIALISTS, coverage, TASK_AFFINITY, last)
+    if ranked:
+        chosen = ranked[0]
+    elif last != "coordinator":
+        chosen = "coordinator"
+    else:
+        chosen = fixed
+    
+    skipped = []
+    if chosen in SPECIALISTS:
+        agent = fixed
+        while agent != chosen:
+            skipped.append(agent)
+            agent = _next_in_cycle(agent)
+    return chosen, skipped
+
+def _stream_tokens() -> bool:
+    """True si la ejecución pidió los tokens (configurable["stream_tokens"])."""
+    from langgraph.config import get_config
+    try:
+        return bool(get_config().get("configurable", {}).get("stream_tokens"))
+    except RuntimeError:  # Nodo llamado fuera de un grafo
+        return False
+
+def _session_id():
+    """thread_id de la ejecución actual, o None si no hay (o el nodo se llamó fuera de un grafo)."""
+    from langgraph.config import get_config
+    try:
+        return get_config().get("configurable", {}).get("thread_id")
+    except RuntimeError:
+        return None
+
+class SessionIndexes:
+    """
+    Un TranscriptIndex por sesión (thread_id). El grafo compilado se cachea
+    y lo comparten todas las sesiones: con un solo índice por nodo, sesiones
+    alternas lo reconstruirían entero en cada cambio. Sin thread_id se usa un
+    índice nuevo por llamada.
+    """
+    
+    def __init__(self, max_sessions: int = MAX_SESSION_INDEXES):
+        self.max_sessions = max_sessions
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, session_id) -> TranscriptIndex:
+        if session_id is None:
+            return TranscriptIndex()
+        with self._lock:
+            index = self._indexes.pop(session_id, None)
+            if index is None:
+                index = TranscriptIndex()
+            self._indexes[session_id] = index
+            while len(self._indexes) > self.max_sessions:
+                self._indexes.popitem(last=False)
+            return index
+
+def turn_id(state: dict, agent_name: str, in_round: bool = False, routing: str = "fixed") -> int:
+    """
+    Número del turno que `agent_name` empieza a partir de `state`: turn_count + 1
+    y, en una ronda, más su posición entre los especialistas lanzados, porque
+    hablan a la vez. Así no se repite dentro de una sesión.
+    """
+    turn = state.get("turn_count", 0) + 1
+    if in_round and agent_name in SPECIALISTS:
+        speakers = create_round_router(routing)(state)
+        if isinstance(speakers, list) and agent_name in speakers:
+            turn += speakers.index(agent_name)
+    return turn
+
+class TokenMeter:
+    """
+    Publica en el stream "custom" del grafo los fragmentos de una respuesta
+    (turn_start, token..., turn_metrics) y mide el tiempo hasta el primer
+    token y los tokens/s. Los tokens son los que informa el proveedor o, si
+    no los da, el número de fragmentos.
+    """
+    
+    def __init__(self, agent: str, turn: int):
+        from langgraph.config import get_stream_writer
+        self.agent = agent
+        self.turn = turn
+        self._writer = get_stream_writer()
+        self._parts = []
+        self._output_tokens = None
+        self._start = time.perf_counter()
+        self._first = None
+        self._writer({"type": "turn_start", "agent": agent, "turn": turn})
+    
+    def add(self, chunk):
+        if chunk.usage_metadata:
+            self._output_tokens = chunk.usage_metadata.get("output_tokens")
+        if not chunk.content:
+            return
+        if self._first is None:
+            self._first = time.perf_counter()
+        self._parts.append(chunk.content)
+        self._writer({"type": "token", "agent": self.agent, "turn": self.turn, "content": chunk.content})
+    
+    def finish(self) -> str:
+        """Publica las métricas del turno y devuelve la respuesta completa."""
+        end = time.perf_counter()
+        tokens = self._output_tokens or len(self._parts)
+        generating = end - self._first if self._first is not None else 0.0
+        self._writer({
+            "type": "turn_metrics",
+            "agent": self.agent,
+            "turn": self.turn,
+            "ttft_ms": round((self._first - self._start) * 1000, 1) if self._first is not None else None,
+            "tokens": tokens,
+            "tokens_per_s": round(tokens / generating, 1) if generating > 0 else None,
+            "duration_ms": round((end - self._start) * 1000, 1),
+        })
+        return "".join(self._parts)
+
+def create_agent_node(agent_name: str, in_round: bool = False, routing: str = "fixed"):
+    """
+    Factory para crear nodos de agentes.
+    
+    Con in_round=True el especialista comparte superpaso con los demás: solo
+    devuelve su turno, y el coordinador guarda la memoria y decide el siguiente paso.
+    Con routing="relevance" el siguiente orador se elige por las tareas abiertas.
+    Si la ejecución lo pide (stream_tokens, ver stream_marketing_chat) la respuesta
+    se recibe en streaming y cada fragmento se publica en el stream "custom".
+    """
+    # Índice por sesión; se pone al día con los turnos nuevos en cada llamada
+    indexes = SessionIndexes()
+    
+    def prepare_memory(state: dict):
+        """
+        Memoria del turno, consulta de recuperación (rol, tareas abiertas y último
+        turno) y tareas abiertas. El contexto se pide con memory.context o acontext.
+        """
         chat_history = state.get("chat_history", [])
-        chat_context = "\n".join([
-            f"{msg.get('role', 'unknown').upper()}: {msg.get('content', '')}"
-            for msg in chat_history[-6:]  # Últimos 3 intercambios
-        ])
-        
+        memory = RollingMemory(budget_tokens=CONTEXT_TOKENS, pinned=1, index=indexes.get(_session_id()),
+                               summary=state.get("summary", ""), folded=state.get("summarized", 0))
+        pending = open_tasks(state.get("coverage", {}), TASKS) if routing == "relevance" else []
+        query = " ".join([SYSTEM_PROMPTS[agent_name], *(" ".join(TASKS[task]) for task in pending),
+                          chat_history[-1].content if chat_history else ""])
+        return memory, query, pending
+    
+    def build_prompt(state: dict, chat_context: str, pending: list) -> list:
+        # Contexto del chat: objetivo, resumen, turnos antiguos relevantes para el rol y últimos turnos
+        system_prompt = SYSTEM_PROMPTS[agent_name]
         turn_count = state.get("turn_count", 0)
         
         # Construcción del prompt
@@ -100,6 +293,10 @@ def create_agent_node(agent_name: str):
                 2. Guía la discusión hacia el siguiente aspecto importante
                 3. Si el plan está completo y hay consenso, declara: "PLAN LISTO Y CONSENSUADO"
                 4. De lo contrario, sugiere qué aspecto abordar a continuación"""
+            if routing == "relevance":
+                user_prompt += f"""
+
+                TAREAS AÚN ABIERTAS: {", ".join(pending) if pending else "ninguna (declara el plan si hay consenso)"}"""
         else:
             user_prompt = f"""CHAT ACTUAL:
                 {chat_context}
@@ -112,37 +309,72 @@ def create_agent_node(agent_name: str):
                 3. Sugiere acciones concretas si es relevante
                 4. Sé conciso pero sustancial (2-3 párrafos)"""
         
-        # Llamar al modelo
-        response = llm.invoke([
+        return [
             {"type": "system", "content": system_prompt},
             {"type": "user", "content": user_prompt}
-        ])
-        
-        agent_response = response.content
-        
-        # Actualizar historial
-        new_history = chat_history + [
-            {"role": agent_name, "content": agent_response}
         ]
+    
+    def build_update(state: dict, messages: list, memory: RollingMemory, agent_response: str) -> dict:
+        chat_history = state.get("chat_history", [])
+        
+        # El coordinador repasa lo pendiente: solo cuentan las aportaciones de los especialistas
+        hits = count_task_hits(agent_response, _TASK_PATTERNS) if agent_name in SPECIALISTS else {}
+        turn = Turn(agent_name, agent_response)
+        update = {
+            "chat_history": [turn],
+            "turn_count": 1,
+            "coverage": hits,
+            "tokens": estimate_tokens(messages[0]["content"] + messages[1]["content"] + agent_response),
+        }
+        if in_round:
+            return update
         
         # Determinar siguiente agente
-        if agent_name == "coordinator" and "PLAN LISTO Y CONSENSUADO" in agent_response:
+        stop = CONVERGENCE.check(append_turns(chat_history, turn))
+        if stop is not None:
             next_agent_name = "END"
+            update["stop_reason"] = stop._asdict()
+        elif routing == "relevance":
+            next_agent_name, skipped = select_by_relevance(agent_name, add_counts(state.get("coverage"), hits))
+            update["skipped"] = skipped
         else:
-            agents_cycle = ["creative", "analyst", "brand_expert", "market_specialist"]
-            current_index = agents_cycle.index(agent_name) if agent_name in agents_cycle else -1
-            next_agent_name = agents_cycle[(current_index + 1) % len(agents_cycle)]
+            next_agent_name = _next_in_cycle(agent_name)
         
-        return {
-            "messages": state.get("messages", []) + [AIMessage(content=agent_response)],
-            "chat_history": new_history,
+        update.update({
             "next_agent": next_agent_name,
-            "turn_count": turn_count + 1,
-            "max_turns": state.get("max_turns", 8),
-            "final_plan": agent_response if next_agent_name == "END" else state.get("final_plan", "")
-        }
+            "summary": memory.summary,
+            "summarized": memory.folded,
+        })
+        if next_agent_name == "END":
+            update["final_plan"] = agent_response
+        return update
     
-    return agent_node
+    def agent_node(state: dict) -> dict:
+        memory, query, pending = prepare_memory(state)
+        messages = build_prompt(state, memory.context(state.get("chat_history", []), query), pending)
+        if _stream_tokens():
+            meter = TokenMeter(agent_name, turn_id(state, agent_name, in_round, routing))
+            for chunk in get_llm().stream(messages):
+                meter.add(chunk)
+            agent_response = meter.finish()
+        else:
+            agent_response = get_llm().invoke(messages).content
+        return build_update(state, messages, memory, agent_response)
+    
+    async def aagent_node(state: dict) -> dict:
+        memory, query, pending = prepare_memory(state)
+        messages = build_prompt(state, await memory.acontext(state.get("chat_history", []), query), pending)
+        if _stream_tokens():
+            meter = TokenMeter(agent_name, turn_id(state, agent_name, in_round, routing))
+            async for chunk in get_llm().astream(messages):
+                meter.add(chunk)
+            agent_response = meter.finish()
+        else:
+            agent_response = (await get_llm().ainvoke(messages)).content
+        return build_update(state, messages, memory, agent_response)
+    
+    from langchain_core.runnables import RunnableLambda
+    return RunnableLambda(agent_node, afunc=aagent_node, name=agent_name)
 
 def router_node(state: dict) -> Literal["creative", "analyst", "brand_expert", "market_specialist", "coordinator", END]:
     """Router que dirige al siguiente agente"""
@@ -158,32 +390,101 @@ def router_node(state: dict) -> Literal["creative", "analyst", "brand_expert", "
     
     return next_agent
 
-# Construir el grafo
-graph_builder = StateGraph(ChatState)
+def create_round_router(routing: str = "fixed"):
+    def round_router(state: dict):
+        """
+        Tras el coordinador, lanza en paralelo a los especialistas que caben en
+        max_turns, reservando un turno para que el coordinador sintetice la ronda.
+        """
+        remaining = state.get("max_turns", 8) - state.get("turn_count", 0)
+        if remaining <= 0 or state.get("next_agent", "END") == "END":
+            return END
+        speakers = SPECIALISTS
+        if routing == "relevance":
+            speakers = rank_speakers(SPECIALISTS, state.get("coverage", {}), TASK_AFFINITY)
+            if not speakers:
+                # Todo cubierto: el coordinador vuelve a hablar para cerrar el plan
+                return "coordinator"
+        if remaining < 2:
+            return END
+        return speakers[:remaining - 1]
+    
+    return round_router
+
+def routing_report(state: dict) -> dict:
+    """Turnos y tokens usados, y los ahorrados si el chat terminó antes de max_turns."""
+    turns = state.get("turn_count", 0)
+    max_turns = state.get("max_turns", 8)
+    tokens = state.get("tokens", 0)
+    stop = state.get("stop_reason") or {}
+    turns_saved = max_turns - turns if stop else 0
+    return {
+        "turns": turns,
+        "max_turns": max_turns,
+        "consensus": stop.get("reason") in ("marker", "agreement"),
+        "stop_reason": stop.get("reason"),
+        "skipped": len(state.get("skipped", [])),
+        "tokens": tokens,
+        "turns_saved": turns_saved,
+        "estimated_tokens_saved": round(turns_saved * tokens / turns) if turns else 0,
+        "open_tasks": open_tasks(state.get("coverage", {}), TASKS),
+    }
+
+def build_graph(mode: str = "sequential", routing: str = "fixed", checkpointer=None):
+    """
+    Construye y compila el grafo del chat en modo "sequential" o "round",
+    con enrutado "fixed" o "relevance". Con `checkpointer` (ver checkpoint.py)
+    cada sesión se guarda por thread_id y puede reanudarse.
+    """
+    if mode not in CHAT_MODES:
+        raise ValueError(f"Modo desconocido: {mode}. Opciones: {list(CHAT_MODES)}")
+    if routing not in ROUTING_MODES:
+        raise ValueError(f"Enrutado desconocido: {routing}. Opciones: {list(ROUTING_MODES)}")
+    in_round = mode == "round"
+    
+    from langgraph.graph import StateGraph
+    graph_builder = StateGraph(ChatState)
+    
+    # Agregar nodos de agentes
+    for agent_name in SPECIALISTS:
+        graph_builder.add_node(agent_name, create_agent_node(agent_name, in_round, routing))
+    graph_builder.add_node("coordinator", create_agent_node("coordinator", routing=routing))
+    
+    # Conexiones del grafo
+    graph_builder.add_edge(START, "coordinator")
+    if in_round:
+        # Los especialistas de una ronda terminan en el mismo superpaso,
+        # así que el coordinador se ejecuta una sola vez con todas las respuestas
+        graph_builder.add_conditional_edges("coordinator", create_round_router(routing),
+                                            SPECIALISTS + ["coordinator", END])
+        for agent_name in SPECIALISTS:
+            graph_builder.add_edge(agent_name, "coordinator")
+    else:
+        graph_builder.add_conditional_edges("coordinator", router_node)
+        for agent_name in SPECIALISTS:
+            graph_builder.add_conditional_edges(agent_name, router_node)
+    
+    return graph_builder.compile(checkpointer=checkpointer)
+
+_graph = None
 
-# Agregar nodos de agentes
-graph_builder.add_node("creative", create_agent_node("creative"))
-graph_builder.add_node("analyst", create_agent_node("analyst"))
-graph_builder.add_node("brand_expert", create_agent_node("brand_expert"))
-graph_builder.add_node("market_specialist", create_agent_node("market_specialist"))
-graph_builder.add_node("coordinator", create_agent_node("coordinator"))
 
-# Conexiones del grafo
-graph_builder.add_edge(START, "coordinator")
-graph_builder.add_conditional_edges("coordinator", router_node)
-graph_builder.add_conditional_edges("creative", router_node)
-graph_builder.add_conditional_edges("analyst", router_node)
-graph_builder.add_conditional_edges("brand_expert", router_node)
-graph_builder.add_conditional_edges("market_specialist", router_node)
+def get_graph():
+    """Grafo por defecto (secuencial, enrutado fijo), compilado la primera vez que se pide."""
+    global _graph
+    if _graph is None:
+        _graph = build_graph()
+    return _graph
 
-# Compilar grafo
-graph = graph_builder.compile()
+
+def __getattr__(name: str):
+    # `groupchat.graph` sigue funcionando, pero ya no se compila al importar el módulo
+    if name == "graph":
+        return get_graph()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Ejecutar el sistema multiagente
-def run_marketing_chat():
-    """Ejecutar la sesión de chat colaborativo"""
-    
-    initial_prompt = """OBJETIVO: Diseñar un plan de marketing para un banco ficticio dirigido a jóvenes viajeros (18-35 años).
+INITIAL_PROMPT = """OBJETIVO: Diseñar un plan de marketing para un banco ficticio dirigido a jóvenes viajeros (18-35 años).
 
 CONTEXTO: 
 - Los clientes objetivo son millennials y Gen Z que viajan frecuentemente
@@ -200,48 +501,208 @@ TAREAS A ABORDAR:
 
 Colaboren para crear un plan integral y consensuado."""
 
-    initial_state = {
-        "messages": [HumanMessage(content=initial_prompt)],
-        "chat_history": [{"role": "system", "content": initial_prompt}],
+def create_initial_state(initial_prompt: str = INITIAL_PROMPT, max_turns: int = 8) -> dict:
+    """Estado inicial de una sesión de chat"""
+    return {
+        "chat_history": [Turn("system", initial_prompt)],
         "next_agent": "coordinator",
         "turn_count": 0,
-        "max_turns": 8,
-        "final_plan": ""
+        "max_turns": max_turns,
+        "final_plan": "",
+        "summary": "",
+        "summarized": 0,
+        "coverage": {},
+        "skipped": [],
+        "tokens": 0,
+        "stop_reason": {}
     }
+
+class _ChatSession:
+    """
+    Una sesión del chat lista para ejecutarse: grafo, configuración y, con
+    `checkpoint`, la base donde se guarda. events()/aevents() la ejecutan
+    emitiendo eventos; `state` es el último estado completo.
+    """
+    
+    def __init__(self, mode: str, routing: str, checkpoint: str = None, session_id: str = None,
+                 stream_tokens: bool = False):
+        from telemetry import with_telemetry
+        self.session_id = session_id or uuid.uuid4().hex[:12]
+        self.state = create_initial_state(INITIAL_PROMPT)
+        self.stream_tokens = stream_tokens
+        self.in_round = mode == "round"
+        self.routing = routing
+        # El thread_id identifica la sesión en el checkpointer y en los índices de recuperación
+        configurable = {"stream_tokens": stream_tokens, "thread_id": self.session_id}
+        self.config = with_telemetry({"configurable": configurable}, session_id=self.session_id)
+        self.metrics = {}
+        self.saver = None
+        if checkpoint:
+            from checkpoint import open_checkpointer
+            self.saver = open_checkpointer(checkpoint)
+            self.graph = build_graph(mode, routing, self.saver)
+        elif (mode, routing) == ("sequential", "fixed"):
+            self.graph = get_graph()
+        else:
+            self.graph = build_graph(mode, routing)
     
-    print("=" * 80)
-    print("SISTEMA MULTIAGENTE: CHAT COLABORATIVO DE MARKETING")
-    print("=" * 80)
-    print(f"\n📋 OBJETIVO:\n{initial_prompt}\n")
-    print("=" * 80)
-    print("Iniciando sesión de chat colaborativo...\n")
-    
-    # Ejecutar el grafo
-    for output in graph.stream(initial_state, stream_mode="updates"):
-        for node, state in output.items():
-            if node != "__start__":
-                agent_name = node
-                response = state["messages"][-1].content if state["messages"] else ""
-                
-                # Mostrar respuesta formateada
-                print(f"\n🤖 {agent_name.upper().replace('_', ' ')}")
-                print("-" * 40)
-                print(response)
-                print()
-    
-    return state
+    def _start_event(self, status: str) -> dict:
+        messages = {
+            "done": f"La sesión {self.session_id} ya había terminado; se muestra su resultado.",
+            "interrupted": f"Reanudando la sesión {self.session_id} desde el último nodo terminado...",
+            "new": f"Iniciando sesión de chat colaborativo {self.session_id}...",
+        }
+        return {"type": "chat_start", "session_id": self.session_id, "objective": INITIAL_PROMPT,
+                "status": messages[status]}
+    
+    def _input(self, status: str):
+        return None if status == "interrupted" else self.state
+    
+    def _translate(self, stream_mode: str, output) -> list:
+        """Eventos de un elemento del stream del grafo ("custom", "updates" o "values")."""
+        if stream_mode == "values":
+            self.state = output
+            return []
+        if stream_mode == "custom":
+            if output.get("type") == "turn_metrics":
+                self.metrics.setdefault(output["agent"], []).append(output)
+            return [{**output, "session_id": self.session_id}]
+        # "updates" llega antes que el "values" de su superpaso: state aún es el anterior
+        return [
+            {"type": "turn", "session_id": self.session_id, "agent": node,
+             "turn": turn_id(self.state, node, self.in_round, self.routing),
+             "content": update["chat_history"][-1].content, "streamed": self.stream_tokens}
+            for node, update in output.items()
+            if node != "__start__" and update and update.get("chat_history")
+        ]
+    
+    def _end_event(self) -> dict:
+        state = self.state
+        return {
+            "type": "chat_end",
+            "session_id": self.session_id,
+            "turn_count": state.get("turn_count", 0),
+            "history": [{"role": turn.role, "content": turn.content} for turn in state["chat_history"]],
+            "report": routing_report(state),
+            "stop_reason": state.get("stop_reason") or None,
+            "metrics": agent_metrics(self.metrics),
+        }
+    
+    def events(self) -> Iterator[dict]:
+        status = "new"
+        if self.saver is not None:
+            from checkpoint import session_status
+            status = session_status(self.graph, self.config)
+        try:
+            yield self._start_event(status)
+            if status == "done":
+                self.state = self.graph.get_state(self.config).values
+            else:
+                stream = self.graph.stream(self._input(status), self.config,
+                                           stream_mode=["custom", "updates", "values"])
+                for stream_mode, output in stream:
+                    yield from self._translate(stream_mode, output)
+            yield self._end_event()
+        finally:
+            if self.saver is not None:
+                self.saver.close()
+    
+    async def aevents(self) -> AsyncIterator[dict]:
+        status = "new"
+        if self.saver is not None:
+            from checkpoint import asession_status
+            status = await asession_status(self.graph, self.config)
+        try:
+            yield self._start_event(status)
+            if status == "done":
+                self.state = (await self.graph.aget_state(self.config)).values
+            else:
+                stream = self.graph.astream(self._input(status), self.config,
+                                            stream_mode=["custom", "updates", "values"])
+                async for stream_mode, output in stream:
+                    for event in self._translate(stream_mode, output):
+                        yield event
+            yield self._end_event()
+        finally:
+            if self.saver is not None:
+                self.saver.close()
+
+def agent_metrics(turn_metrics: dict) -> dict:
+    """Por agente: turnos, tiempo medio hasta el primer token, tokens y tokens/s medios."""
+    summary = {}
+    for agent, turns in turn_metrics.items():
+        ttfts = [turn["ttft_ms"] for turn in turns if turn["ttft_ms"] is not None]
+        rates = [turn["tokens_per_s"] for turn in turns if turn["tokens_per_s"] is not None]
+        summary[agent] = {
+            "turns": len(turns),
+            "ttft_ms": round(sum(ttfts) / len(ttfts), 1) if ttfts else None,
+            "tokens": sum(turn["tokens"] for turn in turns),
+            "tokens_per_s": round(sum(rates) / len(rates), 1) if rates else None,
+        }
+    return summary
+
+def stream_marketing_chat(mode: str = "sequential", routing: str = "fixed", checkpoint: str = None,
+                          session_id: str = None, stream_tokens: bool = True) -> Iterator[dict]:
+    """
+    Ejecuta la sesión (ver run_marketing_chat) entregando sus eventos según ocurren:
+    
+        chat_start                                 al empezar
+        turn_start, token..., turn_metrics         por turno, con stream_tokens
+        turn                                       al terminar cada nodo
+        chat_end                                   al acabar, con "metrics" por agente
+    
+    Los eventos de un turno llevan "agent" y "turn", que lo identifica dentro de
+    la sesión: turn_count + 1 al empezar y, en modo "round", más la posición del
+    especialista en la ronda (ver turn_id), así que los especialistas que hablan
+    a la vez no comparten número. turn_metrics trae ttft_ms, tokens, tokens_per_s
+    y duration_ms. Todos llevan el session_id.
+    """
+    yield from _ChatSession(mode, routing, checkpoint, session_id, stream_tokens).events()
+
+async def astream_marketing_chat(mode: str = "sequential", routing: str = "fixed", checkpoint: str = None,
+                                 session_id: str = None, stream_tokens: bool = True) -> AsyncIterator[dict]:
+    """Versión async de stream_marketing_chat (los agentes llaman al modelo con astream)."""
+    async for event in _ChatSession(mode, routing, checkpoint, session_id, stream_tokens).aevents():
+        yield event
+
+def run_marketing_chat(mode: str = "sequential", routing: str = "fixed", checkpoint: str = None,
+                       session_id: str = None, on_event=None, stream_tokens: bool = False):
+    """
+    Ejecutar la sesión de chat colaborativo ("sequential" o "round"; enrutado "fixed" o "relevance").
+    Con `checkpoint` (ruta SQLite) la sesión `session_id` se guarda tras cada nodo: si
+    se interrumpió, se reanuda desde el último nodo terminado; si ya acabó, no se repite.
+    `on_event` recibe los eventos de stream_marketing_chat (ver output.py); por
+    defecto se muestran como texto. Con `stream_tokens` también los de cada token.
+    """
+    sink = on_event if on_event is not None else TextSink()
+    session = _ChatSession(mode, routing, checkpoint, session_id, stream_tokens)
+    try:
+        for event in session.events():
+            sink(event)
+    finally:
+        if on_event is None:
+            sink.close()
+    
+    return session.state
+
+def main():
+    """Ejecuta una sesión desde la línea de comandos y muestra el resumen."""
+    parser = argparse.ArgumentParser(description="Chat colaborativo de marketing")
+    parser.add_argument("--round", action="store_true", help="Especialistas en paralelo por ronda")
+    parser.add_argument("--relevance", action="store_true", help="Turnos según las tareas pendientes")
+    parser.add_argument("--checkpoint", help="Base SQLite donde guardar la sesión para poder reanudarla")
+    parser.add_argument("--session", help="Identificador de la sesión a crear o reanudar")
+    parser.add_argument("--stream", action="store_true", help="Muestra las respuestas token a token")
+    add_sink_arguments(parser)
+    args = parser.parse_args()
+    sink = sink_from_args(args)
+    try:
+        run_marketing_chat("round" if args.round else "sequential", "relevance" if args.relevance else "fixed",
+                           checkpoint=args.checkpoint, session_id=args.session, on_event=sink,
+                           stream_tokens=args.stream)
+    finally:
+        sink.close()
+
 
 if __name__ == "__main__":
-    final_state = run_marketing_chat()
-    
-    print("\n" + "=" * 80)
-    print("SESIÓN COMPLETADA")
-    print("=" * 80)
-    print(f"Total de turnos: {final_state.get('turn_count', 0)}")
-    print("\n📝 RESUMEN DEL CHAT COLABORATIVO:")
-    print("-" * 80)
-    
-    chat_history = final_state.get('chat_history', [])
-    for msg in chat_history:
-        print(f"\n[{msg['role'].upper()}]")
-        print(msg['content'][:500] + "..." if len(msg['content']) > 500 else msg['content'])
\ No newline at end of file
+    main()
@@ -0,0 +1,192 @@
+"""Conexiones HTTP compartidas por todos los clientes de LLM.
+
+Cada ChatOpenAI/ChatOllama trae su propio cliente httpx y, con él, su propio
+pool: con varios modelos, temperaturas o debates a la vez, cada uno abre sus
+conexiones y paga su handshake TLS. Aquí hay un único pool por endpoint
+(esquema, host y puerto) que comparten todos los clientes que llms.py crea,
+con keep-alive, HTTP/2 si está instalado h2 y un máximo de conexiones.
+
+Cada pool cuenta peticiones, conexiones abiertas y handshakes TLS, así que
+se puede comprobar cuántas peticiones reutilizaron una conexión:
+
+    from llms import get_http_pools
+    for pool in get_http_pools().values():
+        print(pool.stats())
+"""
+
+import asyncio
+import threading
+import weakref
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+DEFAULT_MAX_CONNECTIONS = 64
+DEFAULT_KEEPALIVE_EXPIRY = 30.0
+DEFAULT_TIMEOUT = httpx.Timeout(600.0, connect=5.0)
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def http2_available() -> bool:
+    """True si está instalado h2 (httpx[http2])."""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def endpoint_key(url: str) -> str:
+    """Origen de una URL (esquema://host:puerto): las conexiones se comparten por origen."""
+    parts = urlsplit(url if "://" in url else f"http://{url}")
+    scheme = parts.scheme or "http"
+    return f"{scheme}://{parts.hostname}:{parts.port or _DEFAULT_PORTS.get(scheme, 80)}"
+
+
+class _PerLoopTransport(httpx.AsyncBaseTransport):
+    """Las conexiones asyncio pertenecen a su bucle de eventos: un pool asíncrono por bucle."""
+
+    def __init__(self, limits: httpx.Limits, http2: bool):
+        self.limits = limits
+        self.http2 = http2
+        self._lock = threading.Lock()
+        self._transports = weakref.WeakKeyDictionary()
+
+    def _current(self) -> httpx.AsyncHTTPTransport:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transport = self._transports.get(loop)
+            if transport is None:
+                transport = self._transports[loop] = httpx.AsyncHTTPTransport(limits=self.limits, http2=self.http2)
+            return transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._current().handle_async_request(request)
+
+    async def aclose(self):
+        with self._lock:
+            transport = self._transports.pop(asyncio.get_running_loop(), None)
+        if transport is not None:
+            await transport.aclose()
+
+
+class HTTPPool:
+    """
+    Pool de conexiones de un endpoint, con transporte síncrono y asíncrono.
+
+    Args:
+        endpoint: Origen al que se conecta (ver endpoint_key)
+        max_connections: Conexiones simultáneas como máximo
+        max_keepalive_connections: Conexiones ociosas que se mantienen abiertas (por defecto, todas)
+        keepalive_expiry: Segundos que una conexión ociosa sigue abierta
+        http2: Negociar HTTP/2 (None = si está instalado h2)
+        timeout: Timeout de httpx por defecto de los clientes
+    """
+
+    def __init__(self, endpoint: str, max_connections: int = DEFAULT_MAX_CONNECTIONS,
+                 max_keepalive_connections: Optional[int] = None,
+                 keepalive_expiry: float = DEFAULT_KEEPALIVE_EXPIRY, http2: Optional[bool] = None,
+                 timeout: httpx.Timeout = DEFAULT_TIMEOUT):
+        self.endpoint = endpoint
+        self.http2 = http2_available() if http2 is None else http2
+        self.timeout = timeout
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections if max_keepalive_connections is None
+            else max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._lock = threading.Lock()
+        self._transport: Optional[httpx.HTTPTransport] = None
+        self._async_transport = _PerLoopTransport(self.limits, self.http2)
+        self._requests = 0
+        self._connections = 0
+        self._tls_handshakes = 0
+        self._versions: Dict[str, int] = {}
+
+    # --- Contadores (los alimentan los event hooks y el trace de httpcore) ---
+
+    def _on_trace(self, event: str):
+        if event == "connection.connect_tcp.complete":
+            with self._lock:
+                self._connections += 1
+        elif event == "connection.start_tls.complete":
+            with self._lock:
+                self._tls_handshakes += 1
+
+    def _on_request(self, request: httpx.Request):
+        with self._lock:
+            self._requests += 1
+        request.extensions["trace"] = lambda event, info: self._on_trace(event)
+
+    def _on_response(self, response: httpx.Response):
+        with self._lock:
+            self._versions[response.http_version] = self._versions.get(response.http_version, 0) + 1
+
+    async def _aon_trace(self, event: str, info: dict):
+        self._on_trace(event)
+
+    async def _aon_request(self, request: httpx.Request):
+        with self._lock:
+            self._requests += 1
+        request.extensions["trace"] = self._aon_trace
+
+    async def _aon_response(self, response: httpx.Response):
+        self._on_response(response)
+
+    # --- Transportes y clientes ---
+
+    @property
+    def transport(self) -> httpx.HTTPTransport:
+        with self._lock:
+            if self._transport is None:
+                self._transport = httpx.HTTPTransport(limits=self.limits, http2=self.http2)
+            return self._transport
+
+    @property
+    def async_transport(self) -> httpx.AsyncBaseTransport:
+        return self._async_transport
+
+    def client_kwargs(self) -> dict:
+        """Argumentos de httpx.Client para usar el pool (p. ej. los sync_client_kwargs de ChatOllama)."""
+        return {"transport": self.transport,
+                "event_hooks": {"request": [self._on_request], "response": [self._on_response]}}
+
+    def async_client_kwargs(self) -> dict:
+        return {"transport": self.async_transport,
+                "event_hooks": {"request": [self._aon_request], "response": [self._aon_response]}}
+
+    def client(self) -> httpx.Client:
+        """Cliente httpx nuevo sobre las conexiones compartidas."""
+        return httpx.Client(timeout=self.timeout, **self.client_kwargs())
+
+    def async_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(timeout=self.timeout, **self.async_client_kwargs())
+
+    def stats(self) -> dict:
+        """Peticiones, conexiones abiertas, handshakes TLS y fracción de peticiones que reutilizaron conexión."""
+        with self._lock:
+            reused = max(0, self._requests - self._connections)
+            return {
+                "endpoint": self.endpoint,
+                "http2": self.http2,
+                "max_connections": self.limits.max_connections,
+                "requests": self._requests,
+                "connections": self._connections,
+                "tls_handshakes": self._tls_handshakes,
+                "reused": reused,
+                "reuse_ratio": round(reused / self._requests, 3) if self._requests else None,
+                "http_versions": dict(self._versions),
+            }
+
+    def close(self):
+        """Cierra las conexiones síncronas (las asíncronas del bucle actual se cierran con aclose())."""
+        with self._lock:
+            transport, self._transport = self._transport, None
+        if transport is not None:
+            transport.close()
+
+    async def aclose(self):
+        await self._async_transport.aclose()
@@ -1,59 +1,112 @@
-from langchain_openai import ChatOpenAI
-from langchain_ollama import ChatOllama
-from langchain.agents import create_agent
-from dotenv import load_dotenv
-from utils import format_messages, format_message_content
-load_dotenv()
-
-AGREED = False
-
-agent_a = create_agent(
-    model=ChatOpenAI(model_name="gpt-4o", temperature=0.5),
-    #model=ChatOllama(model="llama3.2", temperature=0.5),
-    system_prompt="Eres un agente de IA que destaca fuertemente los BENEFICIOS de la IA en la atención médica humana."
-)
-agent_b = create_agent(
-    model=ChatOpenAI(model_name="gpt-4o", temperature=0.5),
-    #model=ChatOllama(model="llama3.2", temperature=0.5),
-    system_prompt="Eres un agente de IA que destaca fuertemente los RIESGOS de la IA en la atención médica humana."
-)
-conversation = []  # shared conversation log (list of messages)
+"""Debate entre dos agentes (beneficios frente a riesgos de la IA en medicina).
+
+Uso: python initdebate.py [--rounds N] [--prompt TEXTO] [--sink rich|text|jsonl|quiet]
+"""
+
+import argparse
+import uuid
+
+from convergence import ConvergenceDetector
+from llms import get_chat_model
+from output import add_sink_arguments, get_sink, sink_from_args
+
 # Initial prompt to start the debate
-initial_prompt = "Discute sobre el impacto de la inteligencia artificial en la medicina humana. " \
+INITIAL_PROMPT = "Discute sobre el impacto de la inteligencia artificial en la medicina humana. " \
 "Si llegas a concenso con otro agente o con el usuario, indica lo propio al escribir en el chat 'AGREED: [tu conclusión]'. "
-conversation.append({"role": "user", "content": initial_prompt})
 
 # Debate rounds
 MAX_ROUNDS = 5
-for round in range(MAX_ROUNDS):
-    # Agent A responds to Agent B
-    response_a = agent_a.invoke(conversation[-1])["messages"]
-    print(format_messages(response_a))
-    conversation.append({"role": "agent_A", "content": response_a[-1].content})
-    # Check for consensus or termination keyword
-    if "AGREED" in response_a[-1].content.upper():
-        AGREED = True
-        break  # Agent A signaled agreement (just an example condition)
-    # Agent B responds to Agent A
-    response_b = agent_b.invoke(conversation[-1])["messages"]
-    print(format_messages(response_b))
-    conversation.append({"role": "agent_B", "content": response_b[-1].content})
-    print(format_messages(response_b))
-    if "AGREED" in response_b[-1].content.upper():
-        AGREED = True
-        break
-
-print("\n========================= DEBATE CONCLUIDO =========================\n")
-
-# After debate, decide final answer:
-final_answer = None
-if "AGREED" in response_a[-1].content.upper() or "AGREED" in response_b[-1].content.upper():
-    # If any agent explicitly agreed, use that as consensus (assuming they state it)
-    print("AGREED. EL CONCENSO ES:")
-    final_answer = conversation[-1]["content"]
-else:
-    # Otherwise, for simplicity, take the last statement by Agent B as the final answer
-    print("NO HAY CONCENSO. ULTIMA DECLARACIÓN FUE:")
-    final_answer = conversation[-1]["content"]
-
-print("FINAL ANSWER: ", final_answer)
\ No newline at end of file
+
+
+def create_agents():
+    """Crea los dos agentes (se llama en cada debate para respetar override_chat_models)."""
+    from langchain.agents import create_agent
+    agent_a = create_agent(
+        model=get_chat_model("gpt-4o", temperature=0.5),
+        #model=get_chat_model("llama3.2", temperature=0.5),
+        system_prompt="Eres un agente de IA que destaca fuertemente los BENEFICIOS de la IA en la atención médica humana."
+    )
+    agent_b = create_agent(
+        model=get_chat_model("gpt-4o", temperature=0.5),
+        #model=get_chat_model("llama3.2", temperature=0.5),
+        system_prompt="Eres un agente de IA que destaca fuertemente los RIESGOS de la IA en la atención médica humana."
+    )
+    return agent_a, agent_b
+
+
+def _reply(agent, conversation, session_id=None):
+    """El agente responde al último mensaje del log compartido."""
+    from telemetry import with_telemetry
+    message = {"role": "user", "content": conversation[-1]["content"]}
+    return agent.invoke({"messages": [message]}, with_telemetry(None, session_id=session_id))["messages"]
+
+
+def run_debate(initial_prompt: str = INITIAL_PROMPT, max_rounds: int = MAX_ROUNDS, verbose: bool = True,
+               on_event=None):
+    """
+    Ejecuta el debate entre los dos agentes.
+
+    Args:
+        on_event: Recibe los eventos message y debate_end (ver output.py). Por defecto,
+            paneles de rich si `verbose` y nada si no.
+
+    Returns:
+        (agreed, final_answer, conversation, stop) donde stop es el motivo de
+        parada (frase "AGREED" o posturas que convergen/se estancan) o None
+    """
+    sink = on_event if on_event is not None else get_sink("rich" if verbose else "quiet")
+    agent_a, agent_b = create_agents()
+    session_id = uuid.uuid4().hex[:12]
+    detector = ConvergenceDetector(markers=("AGREED",))
+    agreed = False
+    stop = None
+    conversation = []  # shared conversation log (list of messages)
+    conversation.append({"role": "user", "content": initial_prompt})
+
+    try:
+        for round in range(max_rounds):
+            # Agent A responds to Agent B, then Agent B to Agent A; stop on consensus or convergence
+            for role, agent in (("agent_A", agent_a), ("agent_B", agent_b)):
+                content = _reply(agent, conversation, session_id)[-1].content
+                sink({"type": "message", "agent": role, "content": content})
+                conversation.append({"role": role, "content": content})
+                stop = detector.check(conversation)
+                if stop:
+                    break
+            if stop:
+                agreed = stop.consensus
+                break
+
+        # After debate, decide final answer: the consensus if any agent explicitly agreed,
+        # otherwise (for simplicity) the last statement
+        final_answer = conversation[-1]["content"]
+        sink({
+            "type": "debate_end",
+            "consensus": agreed,
+            "conclusion": final_answer,
+            "last_role": conversation[-1]["role"],
+            "stop_reason": stop.reason if stop else None,
+            "stop_detail": stop.detail if stop else None,
+        })
+    finally:
+        if on_event is None:
+            sink.close()
+
+    return agreed, final_answer, conversation, stop
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Debate entre dos agentes con detección de consenso")
+    parser.add_argument("--rounds", type=int, default=MAX_ROUNDS)
+    parser.add_argument("--prompt", default=INITIAL_PROMPT)
+    add_sink_arguments(parser, default="rich")
+    args = parser.parse_args()
+    sink = sink_from_args(args)
+    try:
+        run_debate(args.prompt, args.rounds, on_event=sink)
+    finally:
+        sink.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""Caché de respuestas LLM direccionada por contenido.
+
+Dos niveles:
+    1. Memoria: LRU con límite de entradas y TTL opcional.
+    2. SQLite: persistente entre ejecuciones (opcional).
+
+La clave es un hash SHA-256 del modelo, sus parámetros (temperatura, etc.) y la
+lista de mensajes normalizada. Se integra con LangChain como BaseCache, así
+que cualquier modelo de chat creado con `cache=LLMCache(...)` la usa sin
+cambiar las llamadas a `invoke`.
+"""
+
+import hashlib
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Optional, Sequence
+
+from langchain_core.caches import BaseCache
+from langchain_core.messages import message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, Generation
+
+# Campos que cambian entre llamadas idénticas y no deben afectar a la clave
+_VOLATILE_KEYS = {"id", "run_id"}
+
+
+def _strip_volatile(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: _strip_volatile(v) for k, v in value.items() if k not in _VOLATILE_KEYS}
+    if isinstance(value, list):
+        return [_strip_volatile(v) for v in value]
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Normaliza el prompt serializado por LangChain (orden de claves, ids, espacios)."""
+    try:
+        data = json.loads(prompt)
+    except (json.JSONDecodeError, TypeError):
+        return prompt.strip()
+    return json.dumps(_strip_volatile(data), sort_keys=True, ensure_ascii=False)
+
+
+def make_cache_key(prompt: str, llm_string: str) -> str:
+    """Hash del modelo + parámetros + mensajes normalizados."""
+    payload = llm_string + "\x00" + normalize_prompt(prompt)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _dump_generations(generations: Sequence[Generation]) -> str:
+    items = []
+    for gen in generations:
+        if isinstance(gen, ChatGeneration):
+            items.append({"message": message_to_dict(gen.message), "info": gen.generation_info})
+        else:
+            items.append({"text": gen.text, "info": gen.generation_info})
+    return json.dumps(items, ensure_ascii=False)
+
+
+def _load_generations(payload: str) -> list:
+    generations = []
+    for item in json.loads(payload):
+        if "message" in item:
+            message = messages_from_dict([item["message"]])[0]
+            generations.append(ChatGeneration(message=message, generation_info=item.get("info")))
+        else:
+            generations.append(Generation(text=item["text"], generation_info=item.get("info")))
+    return generations
+
+
+class LLMCache(BaseCache):
+    """
+    Caché de dos niveles (LRU en memoria + SQLite) compatible con LangChain.
+
+    Args:
+        path: Archivo SQLite para el nivel persistente (None = solo memoria)
+        max_entries: Máximo de entradas en memoria
+        ttl: Segundos de validez de una entrada (None = sin caducidad)
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = 1024, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._memory: OrderedDict = OrderedDict()
+        self._lock = Lock()
+        self.hits_memory = 0
+        self.hits_sqlite = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl is not None and time.time() - created_at > self.ttl
+
+    def _remember(self, key: str, generations: list, created_at: float):
+        self._memory[key] = (generations, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+        key = make_cache_key(prompt, llm_string)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                generations, created_at = entry
+                if not self._expired(created_at):
+                    self._memory.move_to_end(key)
+                    self.hits_memory += 1
+                    return generations
+                del self._memory[key]
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and not self._expired(row[1]):
+                    generations = _load_generations(row[0])
+                    self._remember(key, generations, row[1])
+                    self.hits_sqlite += 1
+                    return generations
+
+            self.misses += 1
+            return None
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        key = make_cache_key(prompt, llm_string)
+        created_at = time.time()
+        with self._lock:
+            self._remember(key, list(return_val), created_at)
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, value, created_at) VALUES (?, ?, ?)",
+                    (key, _dump_generations(return_val), created_at),
+                )
+                self._conn.commit()
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM llm_cache")
+                self._conn.commit()
+
+    def stats(self) -> dict:
+        """Contadores de aciertos/fallos por nivel."""
+        hits = self.hits_memory + self.hits_sqlite
+        total = hits + self.misses
+        return {
+            "hits_memory": self.hits_memory,
+            "hits_sqlite": self.hits_sqlite,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries_memory": len(self._memory),
+            "hit_rate": round(hits / total, 3) if total else 0.0,
+        }
@@ -0,0 +1,364 @@
+"""Fábrica compartida de modelos de chat.
+
+Los clientes se crean la primera vez que se piden y se reutilizan en adelante,
+de modo que importar un módulo no abre conexiones ni lee el .env.
+
+Caché de respuestas (opcional, ver llm_cache.py):
+    enable_llm_cache("llm_cache.sqlite")      # desde código
+    LLM_CACHE=llm_cache.sqlite python debate.py  # desde el entorno
+
+Por defecto la caché solo se aplica a modelos con temperatura 0; para cachear
+también muestreos con temperatura > 0 hay que pedirlo con
+allow_nondeterministic=True (o LLM_CACHE_ALLOW_NONDETERMINISTIC=1).
+
+Cascada local -> alojado (opcional, ver cascade.py):
+    enable_cascade("llama3.2", min_confidence=0.6)
+    LLM_CASCADE=llama3.2 python voting.py
+
+Con la cascada activa, get_routed_model() devuelve un ModelCascade que prueba
+primero el modelo local y solo escala al alojado cuando hace falta.
+
+Límite de llamadas por proveedor (opcional, ver rate_limit.py):
+    enable_rate_limit("openai", rpm=500, tpm=200_000, state_path="/tmp/llm_rate.json")
+    LLM_RPM=500 LLM_TPM=200000 LLM_RATE_LIMIT_STATE=/tmp/llm_rate.json python voting.py
+
+Los procesos que usen el mismo state_path comparten el límite. Las variables
+de entorno se aplican a OpenAI.
+
+Conexiones HTTP (ver http_pool.py): todos los clientes de un mismo endpoint
+comparten un pool con keep-alive, así que las conexiones (y los handshakes TLS)
+se reutilizan entre modelos, temperaturas y debates:
+    enable_http_pool(max_connections=128, http2=True)
+    LLM_HTTP_MAX_CONNECTIONS=128 LLM_HTTP2=1 python voting.py
+    LLM_HTTP_POOL=0 python voting.py  # un cliente httpx por modelo, como LangChain
+"""
+
+import os
+from contextlib import contextmanager
+from threading import Lock
+from typing import Callable, Optional
+
+from dotenv import load_dotenv
+
+_clients = {}
+_lock = Lock()
+_env_loaded = False
+_override: Optional[Callable] = None
+_cache = None
+_cache_allow_nondeterministic = False
+_cascade_config: Optional[dict] = None
+_cascades = {}
+_rate_limiters = {}
+_http_pool_config: Optional[dict] = {}
+_http_pools = {}
+_pool_lock = Lock()  # Aparte de _lock: los pools se crean mientras get_chat_model lo tiene
+
+# Endpoint por defecto de cada proveedor (las variables de entorno son las de sus SDK)
+DEFAULT_ENDPOINTS = {
+    "openai": ("OPENAI_BASE_URL", "https://api.openai.com/v1"),
+    "ollama": ("OLLAMA_HOST", "http://127.0.0.1:11434"),
+}
+
+
+def _ensure_env():
+    """Carga el .env una sola vez, justo antes de crear el primer cliente."""
+    global _env_loaded
+    if not _env_loaded:
+        load_dotenv()
+        _env_loaded = True
+        if _cache is None and os.getenv("LLM_CACHE"):
+            _set_cache(os.getenv("LLM_CACHE"), os.getenv("LLM_CACHE_ALLOW_NONDETERMINISTIC") == "1")
+        if _cascade_config is None and os.getenv("LLM_CASCADE"):
+            _set_cascade(os.getenv("LLM_CASCADE"), float(os.getenv("LLM_CASCADE_MIN_CONFIDENCE", "0.6")))
+        if "openai" not in _rate_limiters and (os.getenv("LLM_RPM") or os.getenv("LLM_TPM")):
+            _set_rate_limit(
+                "openai",
+                rpm=float(os.getenv("LLM_RPM")) if os.getenv("LLM_RPM") else None,
+                tpm=float(os.getenv("LLM_TPM")) if os.getenv("LLM_TPM") else None,
+                state_path=os.getenv("LLM_RATE_LIMIT_STATE"),
+                max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "64")),
+            )
+        if os.getenv("LLM_HTTP_POOL") == "0":
+            _set_http_pool(None)
+        elif os.getenv("LLM_HTTP_MAX_CONNECTIONS") or os.getenv("LLM_HTTP2"):
+            _set_http_pool({
+                "max_connections": int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "64")),
+                "http2": os.getenv("LLM_HTTP2") == "1" if os.getenv("LLM_HTTP2") else None,
+            })
+
+
+def _set_cache(path: Optional[str], allow_nondeterministic: bool, **cache_kwargs):
+    global _cache, _cache_allow_nondeterministic
+    from llm_cache import LLMCache
+    _cache = LLMCache(path, **cache_kwargs)
+    _cache_allow_nondeterministic = allow_nondeterministic
+    return _cache
+
+
+def enable_llm_cache(path: Optional[str] = "llm_cache.sqlite", max_entries: int = 1024,
+                     ttl: Optional[float] = None, allow_nondeterministic: bool = False):
+    """
+    Activa la caché compartida para todos los clientes creados con este módulo.
+
+    Args:
+        path: Archivo SQLite persistente (None = solo memoria)
+        max_entries: Tamaño del LRU en memoria
+        ttl: Validez de cada entrada en segundos (None = sin caducidad)
+        allow_nondeterministic: Cachear también llamadas con temperatura > 0
+
+    Returns:
+        La instancia de LLMCache, para consultar sus estadísticas con .stats()
+    """
+    cache = _set_cache(path, allow_nondeterministic, max_entries=max_entries, ttl=ttl)
+    # Los clientes existentes se crearon sin caché
+    clear_chat_models()
+    return cache
+
+
+def disable_llm_cache():
+    """Desactiva la caché para los clientes que se creen a partir de ahora."""
+    global _cache
+    _cache = None
+    clear_chat_models()
+
+
+def get_llm_cache():
+    """Caché activa (o None), p. ej. para leer get_llm_cache().stats()."""
+    return _cache
+
+
+def _cache_for(temperature: float):
+    """None = comportamiento por defecto de LangChain, False = sin caché."""
+    if _cache is None:
+        return None
+    if temperature > 0 and not _cache_allow_nondeterministic:
+        return False
+    return _cache
+
+
+def _set_cascade(local_model: str, min_confidence: float):
+    global _cascade_config
+    _cascade_config = {"local_model": local_model, "min_confidence": min_confidence}
+    _cascades.clear()
+
+
+def enable_cascade(local_model: str = "llama3.2", min_confidence: float = 0.6):
+    """
+    Enruta las llamadas de get_routed_model() por una cascada: primero
+    `local_model` (Ollama) y, si su respuesta no se acepta, el modelo alojado.
+
+    Args:
+        local_model: Modelo local del primer nivel
+        min_confidence: Confianza mínima para aceptar la respuesta local
+            (la usan los agentes que miden confianza, como voting.py)
+    """
+    _set_cascade(local_model, min_confidence)
+
+
+def disable_cascade():
+    global _cascade_config
+    _cascade_config = None
+    _cascades.clear()
+
+
+def get_cascades() -> dict:
+    """Cascadas creadas, para consultar sus estadísticas con .stats()."""
+    return dict(_cascades)
+
+
+def get_routed_model(model: str = "gpt-4o-mini", temperature: float = 0.7):
+    """
+    Modelo a usar por un agente: la cascada local -> `model` si está activada,
+    o directamente el cliente compartido de `model`.
+    """
+    _ensure_env()
+    if _cascade_config is None:
+        return get_chat_model(model, temperature)
+
+    key = (model, temperature)
+    with _lock:
+        cascade = _cascades.get(key)
+    if cascade is None:
+        from cascade import ModelCascade
+        local_model = _cascade_config["local_model"]
+        cascade = ModelCascade(
+            [(local_model, get_chat_model(local_model, temperature)), (model, get_chat_model(model, temperature))],
+            min_confidence=_cascade_config["min_confidence"],
+        )
+        with _lock:
+            cascade = _cascades.setdefault(key, cascade)
+    return cascade
+
+
+def _set_rate_limit(provider: str, **limiter_kwargs):
+    from rate_limit import RateLimiter
+    limiter = _rate_limiters[provider] = RateLimiter(name=provider, **limiter_kwargs)
+    return limiter
+
+
+def enable_rate_limit(provider: str = "openai", rpm: Optional[float] = None, tpm: Optional[float] = None,
+                      state_path: Optional[str] = None, max_concurrency: int = 64, max_retries: int = 6):
+    """
+    Limita todas las llamadas a `provider` (peticiones y tokens por minuto),
+    con concurrencia adaptativa y reintentos ante 429 y errores transitorios.
+
+    Args:
+        provider: "openai" u "ollama"
+        rpm: Peticiones por minuto (None = sin límite)
+        tpm: Tokens por minuto (None = sin límite)
+        state_path: Fichero para compartir el límite entre procesos del host
+        max_concurrency: Techo de llamadas en vuelo
+        max_retries: Reintentos por llamada
+
+    Returns:
+        El RateLimiter, para consultar sus estadísticas con .stats()
+    """
+    limiter = _set_rate_limit(provider, rpm=rpm, tpm=tpm, state_path=state_path,
+                              max_concurrency=max_concurrency, max_retries=max_retries)
+    # Los clientes existentes se crearon sin límite
+    clear_chat_models()
+    return limiter
+
+
+def disable_rate_limit(provider: str = "openai"):
+    """Quita el límite de `provider` para los clientes que se creen a partir de ahora."""
+    _rate_limiters.pop(provider, None)
+    clear_chat_models()
+
+
+def get_rate_limiters() -> dict:
+    """Limitadores activos por proveedor, para consultar sus estadísticas con .stats()."""
+    return dict(_rate_limiters)
+
+
+def _set_http_pool(config: Optional[dict]):
+    global _http_pool_config
+    with _pool_lock:
+        _http_pool_config = config
+        _http_pools.clear()
+
+
+def enable_http_pool(max_connections: int = 64, max_keepalive_connections: Optional[int] = None,
+                     keepalive_expiry: float = 30.0, http2: Optional[bool] = None):
+    """
+    Comparte un pool de conexiones por endpoint entre todos los clientes (activo por defecto).
+
+    Args:
+        max_connections: Conexiones simultáneas por endpoint
+        max_keepalive_connections: Conexiones ociosas que se conservan (None = todas)
+        keepalive_expiry: Segundos que se conserva una conexión ociosa
+        http2: Negociar HTTP/2 (None = si está instalado h2)
+    """
+    _set_http_pool({"max_connections": max_connections, "max_keepalive_connections": max_keepalive_connections,
+                    "keepalive_expiry": keepalive_expiry, "http2": http2})
+    # Los clientes existentes usan los pools anteriores
+    clear_chat_models()
+
+
+def disable_http_pool():
+    """Cada cliente que se cree a partir de ahora abrirá sus propias conexiones."""
+    _set_http_pool(None)
+    clear_chat_models()
+
+
+def get_http_pool(provider: str = "openai", url: Optional[str] = None):
+    """Pool compartido del endpoint de `provider` (o de `url`); None si están desactivados."""
+    _ensure_env()
+    if _http_pool_config is None:
+        return None
+    from http_pool import HTTPPool, endpoint_key
+    env, default = DEFAULT_ENDPOINTS[provider]
+    endpoint = endpoint_key(url or os.getenv(env) or default)
+    with _pool_lock:
+        pool = _http_pools.get(endpoint)
+        if pool is None:
+            pool = _http_pools[endpoint] = HTTPPool(endpoint, **_http_pool_config)
+    return pool
+
+
+def get_http_pools() -> dict:
+    """Pools por endpoint, para consultar sus estadísticas con .stats()."""
+    return dict(_http_pools)
+
+
+def infer_provider(model: str) -> str:
+    """Deduce el proveedor a partir del nombre del modelo."""
+    return "openai" if model.startswith(("gpt", "o1", "o3", "o4")) else "ollama"
+
+
+def create_chat_model(model: str, temperature: float = 0.7, provider: Optional[str] = None):
+    """Crea un cliente nuevo (sin reutilizar) para el modelo indicado."""
+    provider = provider or infer_provider(model)
+    _ensure_env()
+
+    cache = _cache_for(temperature)
+    limiter = _rate_limiters.get(provider)
+    pool = get_http_pool(provider) if provider in DEFAULT_ENDPOINTS else None
+
+    if provider == "openai":
+        from langchain_openai import ChatOpenAI
+        kwargs = {"http_client": pool.client(), "http_async_client": pool.async_client()} if pool else {}
+        if limiter is None:
+            return ChatOpenAI(model=model, temperature=temperature, cache=cache, **kwargs)
+        from rate_limit import rate_limited
+        # Los reintentos los hace el limitador, que así ve cada 429 y ajusta la concurrencia
+        return rate_limited(ChatOpenAI, limiter)(model=model, temperature=temperature, cache=cache, max_retries=0,
+                                                 **kwargs)
+    if provider == "ollama":
+        from langchain_ollama import ChatOllama
+        chat_class = ChatOllama
+        if limiter is not None:
+            from rate_limit import rate_limited
+            chat_class = rate_limited(ChatOllama, limiter)
+        kwargs = {"sync_client_kwargs": pool.client_kwargs(),
+                  "async_client_kwargs": pool.async_client_kwargs()} if pool else {}
+        return chat_class(model=model, temperature=temperature, cache=cache, **kwargs)
+    raise ValueError(f"Proveedor desconocido: {provider}")
+
+
+def get_chat_model(model: str = "gpt-4o-mini", temperature: float = 0.7, provider: Optional[str] = None):
+    """
+    Devuelve el cliente compartido para (proveedor, modelo, temperatura).
+
+    Args:
+        model: Nombre del modelo ("gpt-4o-mini", "gpt-4o", "llama3.2", ...)
+        temperature: Temperatura de muestreo
+        provider: "openai" u "ollama"; si se omite se deduce del modelo
+    """
+    provider = provider or infer_provider(model)
+    if _override is not None:
+        return _override(model=model, temperature=temperature, provider=provider)
+
+    key = (provider, model, temperature)
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = create_chat_model(model, temperature, provider)
+    return client
+
+
+@contextmanager
+def override_chat_models(factory: Callable):
+    """
+    Sustituye temporalmente todos los clientes por los que cree `factory`.
+
+    Útil para pruebas y benchmarks con un modelo simulado:
+
+        with override_chat_models(lambda **kw: FakeChatModel()):
+            evaluate_medical_case(...)
+    """
+    global _override
+    previous = _override
+    _override = factory
+    try:
+        yield
+    finally:
+        _override = previous
+
+
+def clear_chat_models():
+    """Descarta los clientes compartidos (se recrean en el siguiente uso)."""
+    with _lock:
+        _clients.clear()
@@ -0,0 +1,169 @@
+"""Memoria de conversación con presupuesto de tokens.
+
+Los turnos recientes se pasan literales; los anteriores se resumen en un texto
+que se actualiza de forma incremental: cada turno se incorpora al resumen una
+sola vez, cuando sale de la ventana reciente, y el resumen se guarda en vez de
+regenerarse. Así el contexto de cada turno tiene un tamaño casi constante por
+larga que sea la sesión.
+
+Con un índice (ver retrieval.py) y una consulta, se añaden además los turnos
+antiguos más relevantes para quien va a hablar.
+
+El estado de la memoria es solo (summary, folded), de modo que puede vivir en
+el estado de un grafo de LangGraph y reconstruirse en cada nodo.
+
+Desde código asíncrono se usa acontext(): un resumidor con LLM bloquea
+mientras el modelo responde, así que ahí se ejecuta en un hilo.
+"""
+
+import asyncio
+import re
+from typing import Callable, List, Optional
+
+from transcript import TurnLike, as_turn
+
+# Aproximación habitual: ~4 caracteres por token
+CHARS_PER_TOKEN = 4
+
+# (resumen_actual, rol, contenido, max_tokens) -> resumen_nuevo
+Summarizer = Callable[[str, str, str, int], str]
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def clip_tokens(text: str, max_tokens: int) -> str:
+    """Recorta el texto a unos `max_tokens` tokens."""
+    limit = max_tokens * CHARS_PER_TOKEN
+    return text if len(text) <= limit else text[:max(0, limit - 3)].rstrip() + "..."
+
+
+def _first_sentence(text: str) -> str:
+    text = " ".join(text.split())
+    match = re.match(r"(.+?[.!?])(\s|$)", text)
+    return match.group(1) if match else text
+
+
+def extractive_summarizer(summary: str, role: str, content: str, max_tokens: int) -> str:
+    """
+    Añade la primera frase del turno al resumen, sin llamar a ningún modelo.
+    Si se pasa de `max_tokens`, descarta las líneas más antiguas.
+    """
+    lines = summary.splitlines() if summary else []
+    lines.append(f"- [{role}]: {clip_tokens(_first_sentence(content), max(8, max_tokens // 6))}")
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+def llm_summarizer(llm) -> Summarizer:
+    """
+    Resumidor que pide al modelo actualizar el resumen con el nuevo turno.
+    La llamada es bloqueante: en código asíncrono, usa RollingMemory.acontext.
+    """
+    def summarize(summary: str, role: str, content: str, max_tokens: int) -> str:
+        response = llm.invoke([
+            {"role": "system", "content": "Mantienes el resumen de una conversación. "
+                                          "Conserva decisiones, propuestas y desacuerdos; omite lo repetido."},
+            {"role": "user", "content": f"RESUMEN ACTUAL:\n{summary or '(vacío)'}\n\n"
+                                        f"NUEVA INTERVENCIÓN [{role}]:\n{content}\n\n"
+                                        f"Devuelve el resumen actualizado en menos de {max_tokens * 3 // 4} palabras."},
+        ])
+        return clip_tokens(response.content.strip(), max_tokens)
+    return summarize
+
+
+class RollingMemory:
+    """
+    Construye el contexto de un turno a partir del historial completo.
+
+    Args:
+        budget_tokens: Tokens máximos del contexto (resumen + turnos recientes)
+        summary_tokens: Parte del presupuesto reservada al resumen
+        min_recent: Turnos recientes que se incluyen siempre (recortados si hace falta)
+        pinned: Primeros turnos que se incluyen siempre literales (p. ej. el objetivo)
+        summarizer: Función que incorpora un turno al resumen
+        summary: Resumen acumulado hasta ahora
+        folded: Cuántos turnos del historial ya están en el resumen
+        index: TranscriptIndex para recuperar turnos antiguos relevantes (opcional)
+        retrieve_k: Turnos antiguos que se recuperan
+        retrieval_tokens: Parte del presupuesto reservada a los turnos recuperados
+    """
+
+    def __init__(self, budget_tokens: int = 800, summary_tokens: int = 250, min_recent: int = 2,
+                 pinned: int = 0, summarizer: Summarizer = extractive_summarizer,
+                 summary: str = "", folded: int = 0, index=None, retrieve_k: int = 3,
+                 retrieval_tokens: int = 250):
+        self.budget_tokens = budget_tokens
+        self.summary_tokens = summary_tokens
+        self.min_recent = min_recent
+        self.pinned = pinned
+        self.summarizer = summarizer
+        self.summary = summary
+        self.folded = max(folded, pinned)
+        self.index = index
+        self.retrieve_k = retrieve_k
+        self.retrieval_tokens = retrieval_tokens
+
+    def _window_start(self, history: List[TurnLike], budget: int) -> int:
+        """Primer índice de la ventana reciente que cabe en `budget`."""
+        start = len(history)
+        used = 0
+        while start > self.pinned:
+            cost = estimate_tokens(_render_turn(history[start - 1]))
+            if used + cost > budget and len(history) - start >= self.min_recent:
+                break
+            used += cost
+            start -= 1
+        # La ventana nunca retrocede: lo que ya está resumido no se repite literal
+        return max(start, self.folded)
+
+    def context(self, history: List[TurnLike], query: Optional[str] = None) -> str:
+        """
+        Contexto para el siguiente turno; incorpora al resumen los turnos que
+        salen de la ventana. `query` (rol + tema actual) activa la recuperación.
+        """
+        pinned = history[:self.pinned]
+        budget = self.budget_tokens - self.summary_tokens - sum(estimate_tokens(_render_turn(t)) for t in pinned)
+        retrieve = self.index is not None and bool(query) and self.retrieve_k > 0
+        if retrieve:
+            budget -= self.retrieval_tokens
+        start = self._window_start(history, max(budget, 0))
+
+        for turn in history[self.folded:start]:
+            role, content = as_turn(turn)
+            self.summary = self.summarizer(self.summary, role, content, self.summary_tokens)
+        self.folded = max(self.folded, start)
+
+        recent = [_render_turn(turn) for turn in history[start:]]
+        if sum(estimate_tokens(text) for text in recent) > budget:
+            per_turn = max(budget, 0) // len(recent)
+            recent = [clip_tokens(text, per_turn) for text in recent]
+        parts = [_render_turn(turn) for turn in pinned]
+        if self.summary:
+            parts.append(f"Resumen de lo anterior:\n{self.summary}")
+        if retrieve:
+            found = self.index.sync_search(history, query, self.retrieve_k, self.pinned, start)
+            if found:
+                per_turn = self.retrieval_tokens // len(found)
+                parts.append("Turnos anteriores relevantes:\n" + "\n".join(
+                    clip_tokens(_render_turn(history[i]), per_turn) for i in found
+                ))
+        if recent:
+            parts.append("Historial reciente:\n" + "\n".join(recent))
+        return "\n\n".join(parts)
+
+    async def acontext(self, history: List[TurnLike], query: Optional[str] = None) -> str:
+        """
+        context() sin bloquear el bucle de eventos: si el resumidor no es el
+        extractivo (p. ej. llm_summarizer), se ejecuta en un hilo.
+        """
+        if self.summarizer is extractive_summarizer:
+            return self.context(history, query)
+        return await asyncio.to_thread(self.context, history, query)
+
+
+def _render_turn(turn: TurnLike) -> str:
+    role, content = as_turn(turn)
+    return f"- [{role}]: {content}"
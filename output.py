@@ -0,0 +1,253 @@
+"""Salida de los puntos de entrada: los agentes emiten eventos, un sink los muestra.
+
+Un evento es un dict con "type" y sus datos (ver format_event). Un sink es
+cualquier callable sink(evento) con close(), así que se puede pasar donde se
+espera un on_event (p. ej. DebateManager). Emitir nunca espera a la consola:
+
+    rich    Paneles de rich, renderizados en un hilo aparte
+    text    Texto plano con escritura agrupada
+    jsonl   Un evento JSON por línea (fichero o stdout)
+    quiet   Descarta todo
+
+Uso:
+    sink = get_sink("rich")
+    DebateManager(on_event=sink).run()
+    sink.close()  # vacía lo pendiente
+"""
+
+import json
+import queue
+import sys
+import threading
+import time
+from typing import Callable, Dict, Optional, TextIO
+
+RULE = "=" * 70
+
+
+def format_event(event: Dict) -> str:
+    """Texto de un evento de cualquiera de los puntos de entrada."""
+    kind = event["type"]
+    prefix = f"[{event['index']}] " if "index" in event else ""
+    if kind == "debate_start":
+        text = f"\n{RULE}\n🤜🤛 INICIANDO DEBATE\n{RULE}\n\n[MODERADOR]: {event['topic']}\n"
+    elif kind == "round_start":
+        text = f"\n{RULE}\nRonda {event['round']}/{event['max_rounds']}\n{RULE}"
+    elif kind == "turn" and event.get("streamed"):
+        return ""  # Ya se mostró token a token
+    elif kind in ("message", "turn"):
+        text = f"\n[{event['agent']}]: {event['content']}\n"
+    elif kind == "turn_start":
+        text = f"\n[{event['agent']}] (turno {event['turn']}):"
+    elif kind == "token":
+        return event["content"]
+    elif kind == "turn_metrics":
+        text = (f"\n⏱ {event['ttft_ms']} ms hasta el primer token · {event['tokens']} tokens · "
+                f"{event['tokens_per_s']} tokens/s")
+    elif kind == "agent_error":
+        text = (f"Error al obtener respuesta de {event['agent']}: {event['error']}\n"
+                f"{event.get('traceback', '')}✗ Error en respuesta de {event['agent']}")
+    elif kind == "consensus_proposed":
+        text = f"✓ {event['agent']} propone CONSENSO ({event['detail']})"
+    elif kind == "stalled":
+        text = f"■ Debate estancado tras {event['agent']}: {event['detail']}"
+    elif kind == "debate_end":
+        lines = [f"\n{RULE}\nDEBATE CONCLUIDO\n{RULE}\n"]
+        if event.get("stop_detail"):
+            lines.append(f"Motivo de parada: {event['stop_reason']} ({event['stop_detail']})")
+        if event["consensus"]:
+            lines.append(f"✓ SE ALCANZÓ CONSENSO\n\nCONCLUSIÓN:\n{event['conclusion']}\n")
+        else:
+            lines.append("✗ NO SE ALCANZÓ CONSENSO\n\nÚLTIMO ARGUMENTO DEL DEBATE:")
+            role = f"[{event['last_role']}]: " if event.get("last_role") else ""
+            lines.append(f"{role}{event['conclusion']}\n")
+        text = "\n".join(lines)
+    elif kind == "chat_start":
+        text = (f"{'=' * 80}\nSISTEMA MULTIAGENTE: CHAT COLABORATIVO DE MARKETING\n{'=' * 80}\n"
+                f"\n📋 OBJETIVO:\n{event['objective']}\n\n{'=' * 80}\n{event['status']}\n")
+    elif kind == "chat_end":
+        text = _format_chat_end(event)
+    elif kind == "case_result":
+        text = f"\n{'=' * 60}\nCASO {event['index'] + 1} EVALUADO\n{'=' * 60}\n" + "\n".join(map(str, event["messages"]))
+        if event.get("error"):
+            text += f"\nError: {event['error']}"
+        return text
+    else:
+        text = f"[{kind}] " + json.dumps({k: v for k, v in event.items() if k != "type"}, ensure_ascii=False)
+    return prefix + text
+
+
+def _format_chat_end(event: Dict) -> str:
+    report = event["report"]
+    lines = [f"\n{'=' * 80}", "SESIÓN COMPLETADA", "=" * 80, f"Total de turnos: {event['turn_count']}",
+             "\n📝 RESUMEN DEL CHAT COLABORATIVO:", "-" * 80]
+    for turn in event["history"]:
+        content = turn["content"]
+        lines += [f"\n[{turn['role'].upper()}]", content[:500] + "..." if len(content) > 500 else content]
+    lines += ["\n📊 TURNOS Y TOKENS:",
+              f"Turnos: {report['turns']}/{report['max_turns']} | Saltados: {report['skipped']} | "
+              f"Tokens estimados: {report['tokens']} | Ahorro: {report['turns_saved']} turnos "
+              f"(~{report['estimated_tokens_saved']} tokens)"]
+    stop = event.get("stop_reason")
+    if stop:
+        lines.append(f"Fin anticipado ({stop['reason']}, similitud {stop['score']}): {stop['detail']}")
+    if report["open_tasks"]:
+        lines.append(f"Tareas sin cubrir: {', '.join(report['open_tasks'])}")
+    if event.get("metrics"):
+        lines.append("\n⏱ STREAMING POR AGENTE:")
+        for agent, metrics in event["metrics"].items():
+            lines.append(f"{agent}: {metrics['turns']} turnos | primer token {metrics['ttft_ms']} ms | "
+                         f"{metrics['tokens']} tokens | {metrics['tokens_per_s']} tokens/s")
+    return "\n".join(lines)
+
+
+class QuietSink:
+    """Descarta los eventos."""
+
+    def __call__(self, event: Dict):
+        pass
+
+    def close(self):
+        pass
+
+
+class TextSink:
+    """
+    Texto plano. Las líneas se acumulan y se escriben de una vez cada
+    `flush_interval` segundos o `flush_lines` eventos, y siempre al cerrar.
+    Los tokens se escriben seguidos, sin salto de línea.
+    """
+
+    def __init__(self, stream: Optional[TextIO] = None, flush_interval: float = 0.2, flush_lines: int = 64,
+                 formatter: Callable[[Dict], str] = format_event):
+        self.stream = stream or sys.stdout
+        self.flush_interval = flush_interval
+        self.flush_lines = flush_lines
+        self.formatter = formatter
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __call__(self, event: Dict):
+        text = self.formatter(event)
+        if not text:
+            return
+        with self._lock:
+            self._buffer.append(text if event["type"] == "token" else text + "\n")
+            if (len(self._buffer) >= self.flush_lines
+                    or time.monotonic() - self._last_flush >= self.flush_interval):
+                self._flush()
+
+    def _flush(self):
+        if self._buffer:
+            self.stream.write("".join(self._buffer))
+            self.stream.flush()
+            self._buffer.clear()
+        self._last_flush = time.monotonic()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        self.flush()
+
+
+class JsonlSink:
+    """Un evento JSON por línea, con marca de tiempo. Sin ruta escribe en stdout."""
+
+    def __init__(self, path: Optional[str] = None):
+        self._owned = path is not None
+        self.stream = open(path, "a", encoding="utf-8") if path else sys.stdout
+        self._lock = threading.Lock()
+
+    def __call__(self, event: Dict):
+        line = json.dumps({"ts": time.time(), **event}, ensure_ascii=False, default=str)
+        with self._lock:
+            self.stream.write(line + "\n")
+
+    def close(self):
+        with self._lock:
+            self.stream.flush()
+            if self._owned:
+                self.stream.close()
+
+
+class ThreadedSink:
+    """
+    Entrega los eventos a `sink` desde un hilo propio: quien emite solo
+    encola, aunque renderizar sea lento. close() espera a vaciar la cola.
+    """
+
+    def __init__(self, sink: Callable[[Dict], None]):
+        self.sink = sink
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="output-sink", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            event = self._queue.get()
+            if event is None:
+                return
+            try:
+                self.sink(event)
+            except Exception as e:
+                print(f"Error en el sink de salida: {e}", file=sys.stderr)
+
+    def __call__(self, event: Dict):
+        self._queue.put(event)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        if hasattr(self.sink, "close"):
+            self.sink.close()
+
+
+class RichRenderer:
+    """Intervenciones en paneles de rich y el resto como texto; pensado para ir dentro de ThreadedSink."""
+
+    def __init__(self):
+        from rich.console import Console
+        from rich.panel import Panel
+        self.console = Console()
+        self._panel = Panel
+
+    def __call__(self, event: Dict):
+        text = format_event(event)
+        if event["type"] == "token":
+            self.console.print(text, end="", markup=False, highlight=False)
+        elif not text:
+            return
+        elif event["type"] in ("message", "turn"):
+            title = event["agent"].upper().replace("_", " ")
+            self.console.print(self._panel(event["content"], title=f"🤖 {title}", border_style="green"))
+        else:
+            self.console.print(text, markup=False, highlight=False)
+
+
+# Nombre -> fábrica del sink (`path` solo lo usa jsonl)
+SINKS = {
+    "rich": lambda path=None: ThreadedSink(RichRenderer()),
+    "text": lambda path=None: TextSink(),
+    "jsonl": lambda path=None: JsonlSink(path),
+    "quiet": lambda path=None: QuietSink(),
+}
+
+
+def get_sink(kind: str = "text", path: Optional[str] = None):
+    """Crea un sink por nombre: "rich", "text", "jsonl" (en `path` o stdout) o "quiet"."""
+    if kind not in SINKS:
+        raise ValueError(f"Salida desconocida: {kind}. Opciones: {list(SINKS)}")
+    return SINKS[kind](path)
+
+
+def add_sink_arguments(parser, default: str = "text"):
+    """Añade --sink y --events a un argparse."""
+    parser.add_argument("--sink", choices=list(SINKS), default=default, help="Formato de salida")
+    parser.add_argument("--events", help="Fichero para --sink jsonl (por defecto, stdout)")
+
+
+def sink_from_args(args):
+    return get_sink(args.sink, args.events)
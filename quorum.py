@@ -0,0 +1,150 @@
+"""Políticas de quórum y urna de votos para el coordinador.
+
+La urna recibe los votos a medida que los especialistas los publican y decide
+en cuanto el resultado ya no puede cambiar, para que los especialistas que
+siguen generando puedan cancelarse.
+
+Un voto puede ser un veredicto ("CORRECTO") o una distribución ponderada
+({"CORRECTO": 0.8, "INCORRECTO": 0.2}) cuando el especialista tomó varias
+muestras. Cada especialista aporta como máximo un voto de peso total 1.
+"""
+
+import asyncio
+from threading import Event, Lock
+from typing import Dict, Iterable, List, Optional, Union
+
+MIXED_DECISION = "ANÁLISIS MIXTO"
+
+# Margen para comparar sumas de pesos en coma flotante
+_EPS = 1e-9
+
+# Nombre -> ¿el apoyo ponderado de un veredicto alcanza el quórum sobre `total`?
+QUORUM_POLICIES = {
+    "majority": lambda support, total: support > total / 2 + _EPS,
+    "supermajority": lambda support, total: support >= 2 * total / 3 - _EPS,
+    "unanimity": lambda support, total: support >= total - _EPS,
+}
+
+DEFAULT_QUORUM = "unanimity"
+
+Vote = Union[str, Dict[str, float]]
+
+
+def validate_policy(policy: str):
+    if policy not in QUORUM_POLICIES:
+        raise ValueError(f"Política de quórum desconocida: {policy}. Opciones: {list(QUORUM_POLICIES)}")
+
+
+def top_vote(vote: Vote) -> str:
+    """Veredicto más votado de una distribución (o el propio veredicto)."""
+    return vote if isinstance(vote, str) else max(vote, key=vote.get)
+
+
+def decide(votes: Dict[str, Vote], total: int, policy: str = DEFAULT_QUORUM) -> Optional[str]:
+    """
+    Decisión que ya no puede cambiar, o None si aún depende de votos pendientes.
+
+    - Un veredicto cuyo apoyo ponderado alcanza el quórum gana.
+    - Si ningún veredicto puede alcanzarlo ni con todos los pendientes, MIXED_DECISION.
+
+    La unanimidad se evalúa sobre el veredicto principal de cada especialista:
+    una muestra discrepante rebaja su confianza, no rompe el consenso.
+    """
+    validate_policy(policy)
+    meets = QUORUM_POLICIES[policy]
+    support = {}
+    for vote in votes.values():
+        if policy == "unanimity":
+            vote = top_vote(vote)
+        weights = {vote: 1.0} if isinstance(vote, str) else vote
+        for verdict, weight in weights.items():
+            support[verdict] = support.get(verdict, 0.0) + weight
+
+    leader = max(support, key=support.get, default=None)
+    if leader is not None and meets(support[leader], total):
+        return leader
+
+    remaining = total - len(votes)
+    if not meets(support.get(leader, 0.0) + remaining, total):
+        return MIXED_DECISION
+    return None
+
+
+def weighted_support(votes: Dict[str, Vote]) -> Dict[str, float]:
+    """Suma de pesos por veredicto, normalizada a fracciones del total recibido."""
+    support = {}
+    for vote in votes.values():
+        weights = {vote: 1.0} if isinstance(vote, str) else vote
+        for verdict, weight in weights.items():
+            support[verdict] = support.get(verdict, 0.0) + weight
+    total = sum(support.values())
+    return {verdict: round(weight / total, 3) for verdict, weight in support.items()} if total else {}
+
+
+class Ballot:
+    """
+    Urna de una evaluación. Es segura entre hilos (graph.invoke ejecuta los
+    especialistas en paralelo en un pool) y avisa de la decisión con un evento
+    asyncio (graph.ainvoke) o con eventos de hilos suscritos (graph.invoke)
+    para cancelar de inmediato.
+
+    Args:
+        specialists: Claves de todos los especialistas que votan
+        policy: Nombre de la política de quórum
+    """
+
+    def __init__(self, specialists: Iterable[str], policy: str = DEFAULT_QUORUM):
+        self.specialists = list(specialists)
+        self.policy = policy
+        validate_policy(policy)
+        self.votes: Dict[str, Vote] = {}
+        self.decision: Optional[str] = None
+        self.cancelled = []
+        self._lock = Lock()
+        self._event: Optional[asyncio.Event] = None
+        self._subscribers: List[Event] = []
+
+    @property
+    def is_decided(self) -> bool:
+        return self.decision is not None
+
+    def cast(self, key: str, vote: Vote) -> Optional[str]:
+        """Registra un voto y devuelve la decisión si ya está fijada."""
+        with self._lock:
+            self.votes.setdefault(key, vote)
+            if self.decision is None:
+                self.decision = decide(self.votes, len(self.specialists), self.policy)
+                if self.decision is not None:
+                    if self._event is not None:
+                        self._event.set()
+                    for event in self._subscribers:
+                        event.set()
+            return self.decision
+
+    def should_stop(self, key: str) -> bool:
+        """True si el especialista aún no votó y su voto ya no cambia nada."""
+        return self.decision is not None and key not in self.votes
+
+    def mark_cancelled(self, key: str):
+        with self._lock:
+            if key not in self.cancelled:
+                self.cancelled.append(key)
+
+    def subscribe(self, event: Event):
+        """Activa `event` (de threading) cuando se fije la decisión, o ya si lo está."""
+        with self._lock:
+            if self.decision is None:
+                self._subscribers.append(event)
+                return
+        event.set()
+
+    async def wait_decided(self):
+        """Espera (en el event loop actual) hasta que haya decisión."""
+        if self._event is None:
+            self._event = asyncio.Event()
+            if self.decision is not None:
+                self._event.set()
+        await self._event.wait()
+
+    def pending(self) -> list:
+        return [key for key in self.specialists if key not in self.votes]
@@ -0,0 +1,486 @@
+"""Limitador compartido de peticiones y tokens por minuto para las llamadas al LLM.
+
+Tres mecanismos:
+    1. Cubetas de peticiones (RPM) y tokens (TPM) que se rellenan de forma continua.
+       Con `state_path` viven en un fichero JSON protegido con flock, así que
+       todos los procesos del mismo host comparten el mismo límite.
+    2. Concurrencia adaptativa AIMD: el número de llamadas en vuelo sube de
+       forma aditiva mientras todo va bien y se reduce a la mitad con cada 429.
+    3. Reintentos con backoff exponencial y jitter completo para 429, 5xx y
+       errores de red; un Retry-After del proveedor pausa a todos los procesos.
+
+Se aplica a los modelos de chat con `rate_limited(ChatOpenAI, limiter)`, que
+antepone RateLimitedMixin a la clase (ver llms.enable_rate_limit).
+"""
+
+import asyncio
+import json
+import os
+import random
+import time
+import warnings
+from threading import Condition, Lock
+from typing import Any, Callable, ClassVar, Dict, Optional
+
+from langchain_core.language_models import BaseChatModel
+
+from memory import estimate_tokens
+
+try:
+    import fcntl
+except ImportError:  # Windows: el límite solo se comparte dentro del proceso
+    fcntl = None
+
+# Tokens de respuesta que se reservan si la llamada no fija max_tokens
+DEFAULT_COMPLETION_TOKENS = 256
+
+THROTTLE_STATUS = {429}
+TRANSIENT_STATUS = {500, 502, 503, 504, 529}
+TRANSIENT_ERRORS = {"APITimeoutError", "APIConnectionError", "InternalServerError", "ServiceUnavailableError",
+                    "ConnectError", "ConnectTimeout", "ReadTimeout", "RemoteProtocolError"}
+
+
+def _status(error: BaseException) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def classify_error(error: BaseException) -> Optional[str]:
+    """"throttled" (429), "transient" (5xx, red, timeout) o None si no se debe reintentar."""
+    status = _status(error)
+    name = type(error).__name__
+    text = str(error).lower()
+    if status in THROTTLE_STATUS or "ratelimit" in name.lower() or "rate limit" in text or "too many requests" in text:
+        return "throttled"
+    if status in TRANSIENT_STATUS or name in TRANSIENT_ERRORS or isinstance(error, (TimeoutError, ConnectionError)):
+        return "transient"
+    return None
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Segundos de espera que indica el proveedor en las cabeceras de la respuesta, si los hay."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+class _LocalState:
+    """Estado de las cubetas en memoria (un solo proceso)."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._state: Dict[str, dict] = {}
+
+    def update(self, fn: Callable[[dict], Any]) -> Any:
+        with self._lock:
+            return fn(self._state)
+
+
+class _FileState:
+    """Estado de las cubetas en un fichero JSON, con flock para compartirlo entre procesos."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = Lock()
+
+    def update(self, fn: Callable[[dict], Any]) -> Any:
+        with self._lock, open(self.path, "a+", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                raw = f.read()
+                try:
+                    state = json.loads(raw) if raw.strip() else {}
+                except json.JSONDecodeError:
+                    state = {}
+                result = fn(state)
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                f.flush()
+                return result
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class RateLimiter:
+    """
+    Límite de RPM/TPM compartido, concurrencia AIMD y reintentos.
+
+    Args:
+        rpm: Peticiones por minuto (None = sin límite)
+        tpm: Tokens por minuto, prompt + respuesta (None = sin límite)
+        name: Clave del límite dentro del fichero compartido (p. ej. el proveedor)
+        state_path: Fichero donde se comparten las cubetas entre procesos (None = solo este proceso)
+        max_concurrency: Techo de llamadas en vuelo
+        initial_concurrency: Llamadas en vuelo permitidas al empezar
+        min_concurrency: Suelo al que puede bajar tras los 429
+        max_retries: Reintentos por llamada antes de propagar el error
+        base_delay: Espera base del backoff exponencial, en segundos
+        max_delay: Espera máxima entre reintentos
+    """
+
+    def __init__(self, rpm: Optional[float] = None, tpm: Optional[float] = None, name: str = "default",
+                 state_path: Optional[str] = None, max_concurrency: int = 64, initial_concurrency: int = 8,
+                 min_concurrency: int = 1, max_retries: int = 6, base_delay: float = 0.5, max_delay: float = 30.0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        if state_path and fcntl is None:
+            warnings.warn("fcntl no disponible: el límite de llamadas solo se comparte dentro del proceso")
+            state_path = None
+        self._state = _FileState(state_path) if state_path else _LocalState()
+        self._limit = float(max(min_concurrency, min(initial_concurrency, max_concurrency)))
+        self._in_flight = 0
+        self._slots = Condition()
+        # Esperas de aacquire: (bucle, futuro) que _exit despierta al liberar un hueco
+        self._async_waiters = []
+        self._stats = {"calls": 0, "retries": 0, "throttled": 0, "errors": 0, "waited_s": 0.0}
+
+    # Cubetas (compartidas)
+    def _reserve(self, tokens: int) -> float:
+        """Reserva una petición y `tokens` si hay saldo; si no, devuelve cuánto esperar."""
+        tokens = min(tokens, self.tpm) if self.tpm else tokens
+
+        def take(state: dict) -> float:
+            now = time.time()
+            bucket = state.setdefault(self.name, {"requests": self.rpm or 0, "tokens": self.tpm or 0,
+                                                  "updated": now, "pause_until": 0})
+            elapsed = max(0.0, now - bucket["updated"])
+            bucket["updated"] = now
+            if self.rpm:
+                bucket["requests"] = min(self.rpm, bucket["requests"] + elapsed * self.rpm / 60)
+            if self.tpm:
+                bucket["tokens"] = min(self.tpm, bucket["tokens"] + elapsed * self.tpm / 60)
+            wait = max(0.0, bucket["pause_until"] - now)
+            if self.rpm and bucket["requests"] < 1:
+                wait = max(wait, (1 - bucket["requests"]) * 60 / self.rpm)
+            if self.tpm and bucket["tokens"] < tokens:
+                wait = max(wait, (tokens - bucket["tokens"]) * 60 / self.tpm)
+            if wait == 0:
+                bucket["requests"] -= 1 if self.rpm else 0
+                bucket["tokens"] -= tokens if self.tpm else 0
+            return wait
+
+        return self._state.update(take)
+
+    def settle(self, reserved: int, used: int):
+        """Ajusta la cubeta de tokens con lo que de verdad consumió la llamada."""
+        if not self.tpm or used == reserved:
+            return
+
+        def adjust(state: dict):
+            bucket = state.get(self.name)
+            if bucket is not None:
+                bucket["tokens"] = min(self.tpm, bucket["tokens"] + reserved - used)
+
+        self._state.update(adjust)
+
+    def pause(self, seconds: float):
+        """Detiene las llamadas de todos los procesos durante `seconds` (p. ej. por un Retry-After)."""
+        def hold(state: dict):
+            bucket = state.setdefault(self.name, {"requests": self.rpm or 0, "tokens": self.tpm or 0,
+                                                  "updated": time.time(), "pause_until": 0})
+            bucket["pause_until"] = max(bucket["pause_until"], time.time() + seconds)
+
+        self._state.update(hold)
+
+    # Concurrencia AIMD (por proceso)
+    def _enter(self):
+        with self._slots:
+            while self._in_flight >= int(self._limit):
+                self._slots.wait()
+            self._in_flight += 1
+
+    def _exit(self, outcome: str):
+        with self._slots:
+            self._in_flight -= 1
+            self._stats["calls"] += 1
+            if outcome == "throttled":
+                self._stats["throttled"] += 1
+                self._limit = max(self.min_concurrency, self._limit / 2)
+            elif outcome == "ok":
+                # +1 llamada en vuelo por cada "ventana" completa sin errores
+                self._limit = min(self.max_concurrency, self._limit + 1 / self._limit)
+            elif outcome != "closed":
+                # "closed": quien llamó cerró el stream o canceló; no dice nada del proveedor
+                self._stats["errors"] += 1
+            self._slots.notify_all()
+            waiters, self._async_waiters = self._async_waiters, []
+        for loop, waiter in waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, waiter)
+            except RuntimeError:  # Bucle ya cerrado
+                pass
+
+    def _backoff(self, attempt: int, error: BaseException, kind: str) -> float:
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        hinted = retry_after(error)
+        if hinted is not None:
+            delay = max(delay, hinted)
+            if kind == "throttled":
+                self.pause(hinted)
+        with self._slots:
+            self._stats["retries"] += 1
+        return delay
+
+    def _should_retry(self, attempt: int, error: BaseException) -> Optional[str]:
+        kind = classify_error(error)
+        return kind if kind and attempt < self.max_retries else None
+
+    def acquire(self, tokens: int = 0):
+        """Espera turno en las cubetas y un hueco de concurrencia."""
+        while True:
+            wait = self._reserve(tokens)
+            if not wait:
+                break
+            self._stats["waited_s"] += wait
+            time.sleep(wait)
+        self._enter()
+
+    async def aacquire(self, tokens: int = 0):
+        while True:
+            wait = self._reserve(tokens)
+            if not wait:
+                break
+            self._stats["waited_s"] += wait
+            await asyncio.sleep(wait)
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._slots:
+                if self._in_flight < int(self._limit):
+                    self._in_flight += 1
+                    return
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+            try:
+                await waiter
+            finally:
+                with self._slots:
+                    if (loop, waiter) in self._async_waiters:
+                        self._async_waiters.remove((loop, waiter))
+
+    def call(self, fn: Callable[[], Any], tokens: int = 0, on_retry: Optional[Callable] = None) -> Any:
+        """Ejecuta `fn()` respetando el límite y reintentando los errores recuperables."""
+        attempt = 0
+        while True:
+            self.acquire(tokens)
+            try:
+                result = fn()
+            except Exception as e:
+                kind = self._should_retry(attempt, e)
+                self._exit(classify_error(e) or "error")
+                if kind is None:
+                    raise
+                delay = self._backoff(attempt, e, kind)
+                if on_retry:
+                    on_retry(attempt, e, delay)
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self._exit("ok")
+            return result
+
+    async def acall(self, fn: Callable[[], Any], tokens: int = 0, on_retry: Optional[Callable] = None) -> Any:
+        """Versión asíncrona de call(); `fn()` devuelve un awaitable."""
+        attempt = 0
+        while True:
+            await self.aacquire(tokens)
+            try:
+                result = await fn()
+            except asyncio.CancelledError:
+                self._exit("closed")
+                raise
+            except Exception as e:
+                kind = self._should_retry(attempt, e)
+                self._exit(classify_error(e) or "error")
+                if kind is None:
+                    raise
+                delay = self._backoff(attempt, e, kind)
+                if on_retry:
+                    on_retry(attempt, e, delay)
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self._exit("ok")
+            return result
+
+    def stream(self, fn: Callable[[], Any], tokens: int = 0, on_retry: Optional[Callable] = None):
+        """
+        Itera `fn()` ocupando un hueco durante todo el stream. Solo se reintenta
+        si el error llega antes del primer fragmento (después ya no es idempotente).
+        """
+        attempt = 0
+        while True:
+            self.acquire(tokens)
+            outcome = "error"
+            started = False
+            try:
+                for chunk in fn():
+                    started = True
+                    yield chunk
+                outcome = "ok"
+                return
+            except GeneratorExit:
+                # El consumidor cerró el stream antes de tiempo: no es un fallo del proveedor
+                outcome = "closed"
+                raise
+            except Exception as e:
+                error = e
+                kind = None if started else self._should_retry(attempt, e)
+                outcome = classify_error(e) or "error"
+                if kind is None:
+                    raise
+            finally:
+                self._exit(outcome)
+            delay = self._backoff(attempt, error, kind)
+            if on_retry:
+                on_retry(attempt, error, delay)
+            time.sleep(delay)
+            attempt += 1
+
+    async def astream(self, fn: Callable[[], Any], tokens: int = 0, on_retry: Optional[Callable] = None):
+        """Versión asíncrona de stream(); `fn()` devuelve un iterador asíncrono."""
+        attempt = 0
+        while True:
+            await self.aacquire(tokens)
+            outcome = "error"
+            started = False
+            try:
+                async for chunk in fn():
+                    started = True
+                    yield chunk
+                outcome = "ok"
+                return
+            except (GeneratorExit, asyncio.CancelledError):
+                outcome = "closed"
+                raise
+            except Exception as e:
+                error = e
+                kind = None if started else self._should_retry(attempt, e)
+                outcome = classify_error(e) or "error"
+                if kind is None:
+                    raise
+            finally:
+                self._exit(outcome)
+            delay = self._backoff(attempt, error, kind)
+            if on_retry:
+                on_retry(attempt, error, delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def stats(self) -> dict:
+        """Llamadas, reintentos, 429, errores, espera acumulada y concurrencia actual."""
+        with self._slots:
+            return {**self._stats, "waited_s": round(self._stats["waited_s"], 3),
+                    "concurrency_limit": int(self._limit), "in_flight": self._in_flight}
+
+
+def _wake(waiter: asyncio.Future):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+def _estimate_request_tokens(model, messages, kwargs: dict) -> int:
+    prompt = sum(estimate_tokens(str(message.content)) for message in messages)
+    completion = kwargs.get("max_tokens") or getattr(model, "max_tokens", None) or DEFAULT_COMPLETION_TOKENS
+    return prompt + completion
+
+
+def _used_tokens(result) -> Optional[int]:
+    usage = getattr(result.generations[0].message, "usage_metadata", None) if result.generations else None
+    return usage.get("total_tokens") if usage else None
+
+
+def _retry_reporter(run_manager):
+    """Anota cada reintento en la telemetría de la llamada, si está activa."""
+    from telemetry import get_telemetry_handler
+
+    def report(attempt, error, delay):
+        handler = get_telemetry_handler()
+        if handler is not None and run_manager is not None:
+            handler.record_retry(run_manager.run_id)
+
+    return report
+
+
+class RateLimitedMixin:
+    """
+    Se antepone a una clase de modelo de chat de LangChain para que todas sus
+    llamadas (invoke, stream y sus variantes async) pasen por `call_limiter`
+    (distinto del campo rate_limiter de LangChain, que solo espacia peticiones).
+    """
+
+    call_limiter: ClassVar[RateLimiter]
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens = _estimate_request_tokens(self, messages, kwargs)
+        result = self.call_limiter.call(
+            lambda: super(RateLimitedMixin, self)._generate(messages, stop, run_manager, **kwargs),
+            tokens, _retry_reporter(run_manager),
+        )
+        used = _used_tokens(result)
+        if used is not None:
+            self.call_limiter.settle(tokens, used)
+        return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        tokens = _estimate_request_tokens(self, messages, kwargs)
+        result = await self.call_limiter.acall(
+            lambda: super(RateLimitedMixin, self)._agenerate(messages, stop, run_manager, **kwargs),
+            tokens, _retry_reporter(run_manager),
+        )
+        used = _used_tokens(result)
+        if used is not None:
+            self.call_limiter.settle(tokens, used)
+        return result
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        yield from self.call_limiter.stream(
+            lambda: super(RateLimitedMixin, self)._stream(messages, stop, run_manager, **kwargs),
+            _estimate_request_tokens(self, messages, kwargs), _retry_reporter(run_manager),
+        )
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        async for chunk in self.call_limiter.astream(
+            lambda: super(RateLimitedMixin, self)._astream(messages, stop, run_manager, **kwargs),
+            _estimate_request_tokens(self, messages, kwargs), _retry_reporter(run_manager),
+        ):
+            yield chunk
+
+
+_classes: Dict[tuple, type] = {}
+_classes_lock = Lock()
+
+
+def rate_limited(cls: type, limiter: RateLimiter) -> type:
+    """
+    Subclase de `cls` con RateLimitedMixin delante. Conserva el nombre de la
+    clase (las claves de la caché de LangChain no cambian) y, si `cls` no
+    implementa alguna variante, deja la de BaseChatModel para que LangChain
+    siga eligiendo la misma ruta (p. ej. invoke en vez de stream).
+    """
+    key = (cls, id(limiter))
+    with _classes_lock:
+        if key not in _classes:
+            namespace = {"call_limiter": limiter, "__annotations__": {"call_limiter": ClassVar[RateLimiter]},
+                         "__module__": cls.__module__, "__qualname__": cls.__qualname__}
+            for method in ("_agenerate", "_stream", "_astream"):
+                if getattr(cls, method) is getattr(BaseChatModel, method):
+                    namespace[method] = getattr(BaseChatModel, method)
+            _classes[key] = type(cls.__name__, (RateLimitedMixin, cls), namespace)
+        return _classes[key]
@@ -0,0 +1,113 @@
+"""Índice BM25 local e incremental sobre la transcripción.
+
+Sirve para dar a cada agente los K turnos antiguos más relevantes para su
+rol y para lo que se está discutiendo, en vez de solo los últimos N. El
+índice se actualiza con cada turno nuevo (solo se tokeniza ese turno) y la
+búsqueda es vectorizada con NumPy: por debajo del milisegundo para sesiones
+de cientos de turnos.
+"""
+
+from collections import Counter
+from threading import Lock
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from textsim import tokenize
+from transcript import TurnLike, as_turn
+
+
+class TranscriptIndex:
+    """
+    Índice BM25 de los turnos de una transcripción.
+
+    Args:
+        k1: Saturación de la frecuencia del término
+        b: Peso de la normalización por longitud
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        self._postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        self._lengths = np.zeros(64, dtype=np.float64)
+        self._last = None
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def add(self, turn: TurnLike):
+        """Indexa un turno nuevo al final."""
+        turn = as_turn(turn)
+        terms = Counter(tokenize(turn.content))
+        doc = self.size
+        if doc == len(self._lengths):
+            self._lengths = np.concatenate([self._lengths, np.zeros(len(self._lengths))])
+        self._lengths[doc] = sum(terms.values())
+        for term, count in terms.items():
+            docs, counts = self._postings.setdefault(term, ([], []))
+            docs.append(doc)
+            counts.append(count)
+        self._last = turn
+        self.size += 1
+
+    def sync(self, turns: Sequence[TurnLike]):
+        """
+        Indexa los turnos de `turns` que aún no están. Si `turns` no continúa
+        lo ya indexado (otra sesión, o se reanudó desde un checkpoint), se reindexa.
+        """
+        with self._lock:
+            self._sync(turns)
+
+    def _sync(self, turns: Sequence[TurnLike]):
+        if self.size > len(turns) or (self.size and as_turn(turns[self.size - 1]) != self._last):
+            self.reset()
+        for index in range(self.size, len(turns)):
+            self.add(turns[index])
+
+    def scores(self, query: str) -> np.ndarray:
+        """Puntuación BM25 de cada turno indexado para la consulta."""
+        n = self.size
+        scores = np.zeros(n)
+        if not n:
+            return scores
+        lengths = self._lengths[:n]
+        norm = self.k1 * (1 - self.b + self.b * lengths / max(lengths.mean(), 1e-9))
+        for term in set(tokenize(query)):
+            if term not in self._postings:
+                continue
+            docs, counts = self._postings[term]
+            docs = np.asarray(docs)
+            tf = np.asarray(counts, dtype=np.float64)
+            idf = np.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            scores[docs] += idf * tf * (self.k1 + 1) / (tf + norm[docs])
+        return scores
+
+    def search(self, query: str, k: int = 3, start: int = 0, stop: int = None) -> List[int]:
+        """Índices de los `k` turnos más relevantes en [start, stop), en orden cronológico."""
+        with self._lock:
+            return self._search(query, k, start, stop)
+
+    def sync_search(self, turns: Sequence[TurnLike], query: str, k: int = 3, start: int = 0,
+                    stop: int = None) -> List[int]:
+        """
+        sync(turns) y search(...) en una sola operación: si el índice se comparte,
+        otra transcripción no puede colarse entre la actualización y la búsqueda.
+        """
+        with self._lock:
+            self._sync(turns)
+            return self._search(query, k, start, stop)
+
+    def _search(self, query: str, k: int, start: int, stop: int = None) -> List[int]:
+        scores = self.scores(query)
+        stop = self.size if stop is None else min(stop, self.size)
+        if k <= 0 or stop <= start:
+            return []
+        candidates = scores[start:stop]
+        top = np.argsort(-candidates, kind="stable")[:k]
+        return sorted(int(i) + start for i in top if candidates[i] > 0)
@@ -0,0 +1,66 @@
+"""Selección del siguiente orador por relevancia, sin llamar al modelo.
+
+Cada tarea del objetivo tiene unas palabras clave. Tras cada turno se cuentan
+las que aparecen en la respuesta; una tarea con suficientes menciones se da
+por cubierta. El siguiente orador es el agente con más afinidad por las tareas
+que siguen abiertas, así que quien no tiene nada nuevo que aportar no habla.
+"""
+
+import re
+from typing import Dict, Iterable, List, Optional
+
+from textsim import normalize
+
+# Menciones a partir de las cuales una tarea se considera cubierta
+COVERED_HITS = 3
+
+
+def compile_tasks(tasks: Dict[str, List[str]]) -> Dict[str, re.Pattern]:
+    """Una expresión por tarea; las claves casan como prefijo de palabra ("activaci" -> "activaciones")."""
+    return {
+        task: re.compile(r"\b(" + "|".join(re.escape(normalize(k)) for k in keywords) + r")")
+        for task, keywords in tasks.items()
+    }
+
+
+def count_task_hits(text: str, patterns: Dict[str, re.Pattern]) -> Dict[str, int]:
+    """Palabras clave distintas de cada tarea que aparecen en el texto."""
+    text = normalize(text)
+    hits = {task: len(set(pattern.findall(text))) for task, pattern in patterns.items()}
+    return {task: n for task, n in hits.items() if n}
+
+
+def add_counts(current: Optional[Dict[str, int]], update: Optional[Dict[str, int]]) -> Dict[str, int]:
+    """Reductor de LangGraph que suma contadores por clave."""
+    merged = dict(current or {})
+    for key, value in (update or {}).items():
+        merged[key] = merged.get(key, 0) + value
+    return merged
+
+
+def open_tasks(coverage: Dict[str, int], tasks: Iterable[str], threshold: int = COVERED_HITS) -> List[str]:
+    return [task for task in tasks if coverage.get(task, 0) < threshold]
+
+
+def relevance(agent: str, coverage: Dict[str, int], affinity: Dict[str, Dict[str, float]],
+              threshold: int = COVERED_HITS) -> float:
+    """Afinidad del agente por lo que falta de cada tarea abierta."""
+    return sum(
+        weight * (1 - coverage.get(task, 0) / threshold)
+        for task, weight in affinity.get(agent, {}).items()
+        if coverage.get(task, 0) < threshold
+    )
+
+
+def rank_speakers(candidates: List[str], coverage: Dict[str, int], affinity: Dict[str, Dict[str, float]],
+                  last: Optional[str] = None, threshold: int = COVERED_HITS) -> List[str]:
+    """
+    Candidatos con algo que aportar, de más a menos relevante. A igual
+    puntuación se respeta el orden del ciclo a partir de `last`, y `last` no
+    repite turno.
+    """
+    start = candidates.index(last) + 1 if last in candidates else 0
+    cycle = candidates[start:] + candidates[:start]
+    scored = [(relevance(agent, coverage, affinity, threshold), -i, agent)
+              for i, agent in enumerate(cycle) if agent != last]
+    return [agent for score, _, agent in sorted(scored, reverse=True) if score > 0]
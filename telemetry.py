@@ -0,0 +1,317 @@
+"""Telemetría por nodo y por llamada al LLM, exportada como trazas JSONL.
+
+Un callback de LangChain registra, para cada nodo de LangGraph y cada llamada
+a un modelo de chat: tiempo, tiempo hasta el primer token, tokens de prompt,
+de respuesta y cacheados, reintentos y coste estimado. Cada registro lleva
+session_id / case_id (de los metadatos de la ejecución) y se escribe en un
+fichero JSONL con rotación.
+
+Uso:
+    enable_telemetry("telemetry/traces.jsonl")         # o LLM_TELEMETRY=ruta en el .env
+    graph.invoke(state, with_telemetry(config, case_id="42"))
+    python telemetry.py summary telemetry/traces.jsonl  # nodos más lentos y caros
+"""
+
+import argparse
+import glob
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from logging.handlers import RotatingFileHandler
+from threading import Lock
+from typing import Dict, List, Optional
+from uuid import UUID
+
+from dotenv import load_dotenv
+from langchain_core.callbacks import BaseCallbackHandler
+
+from memory import estimate_tokens
+
+# USD por millón de tokens: (prompt, prompt cacheado, respuesta). Los modelos locales no cuestan.
+PRICES = {
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "o3-mini": (1.10, 0.55, 4.40),
+}
+
+_handler: Optional["TelemetryHandler"] = None
+_env_checked = False
+
+
+def estimate_cost(model: Optional[str], prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+    prices = PRICES.get(model or "")
+    if prices is None:
+        # Variantes con fecha ("gpt-4o-2024-08-06"): el prefijo más largo que coincida
+        matches = [name for name in PRICES if (model or "").startswith(name)]
+        prices = PRICES[max(matches, key=len)] if matches else (0.0, 0.0, 0.0)
+    prompt_price, cached_price, completion_price = prices
+    return ((prompt_tokens - cached_tokens) * prompt_price + cached_tokens * cached_price
+            + completion_tokens * completion_price) / 1_000_000
+
+
+class JsonlExporter:
+    """Escribe un registro JSON por línea y rota el fichero al llegar a `max_bytes`."""
+
+    def __init__(self, path: str = "telemetry/traces.jsonl", max_bytes: int = 10 * 1024 * 1024, backups: int = 5):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._logger = logging.getLogger(f"telemetry.{os.path.abspath(path)}")
+        self._logger.propagate = False
+        self._logger.setLevel(logging.INFO)
+        if not self._logger.handlers:
+            handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._logger.addHandler(handler)
+
+    def export(self, record: dict):
+        self._logger.info(json.dumps(record, ensure_ascii=False, default=str))
+
+
+class TelemetryHandler(BaseCallbackHandler):
+    """
+    Callback que mide nodos de LangGraph y llamadas a modelos de chat.
+
+    Args:
+        exporter: Destino de los registros (cualquier objeto con export(dict))
+    """
+
+    def __init__(self, exporter):
+        self.exporter = exporter
+        self._runs: Dict[UUID, dict] = {}
+        self._lock = Lock()
+
+    def _open(self, run_id: UUID, parent_run_id: Optional[UUID], kind: str, name: str,
+              metadata: Optional[dict], **extra):
+        metadata = metadata or {}
+        with self._lock:
+            self._runs[run_id] = {
+                "kind": kind,
+                "name": name,
+                "run_id": str(run_id),
+                "parent_run_id": str(parent_run_id) if parent_run_id else None,
+                "session_id": metadata.get("session_id"),
+                "case_id": metadata.get("case_id"),
+                "node": metadata.get("langgraph_node"),
+                "retries": 0,
+                "_start": time.perf_counter(),
+                **extra,
+            }
+
+    def _close(self, run_id: UUID, error: Optional[BaseException] = None, **fields):
+        with self._lock:
+            record = self._runs.pop(run_id, None)
+        if record is None:
+            return
+        record["duration_ms"] = round((time.perf_counter() - record.pop("_start")) * 1000, 2)
+        record.pop("_prompt_estimate", None)
+        record["ts"] = time.time()
+        record["status"] = "error" if error else "ok"
+        if error:
+            record["error"] = repr(error)
+        record.update(fields)
+        self.exporter.export(record)
+
+    # Nodos de LangGraph: la cadena cuyo nombre coincide con el nodo de sus metadatos
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        if node and kwargs.get("name") == node:
+            self._open(run_id, parent_run_id, "node", node, metadata)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._close(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._close(run_id, error)
+
+    # Llamadas a modelos de chat
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        metadata = metadata or {}
+        model = metadata.get("ls_model_name") or (serialized or {}).get("kwargs", {}).get("model_name")
+        prompt = sum(estimate_tokens(str(m.content)) for batch in messages for m in batch)
+        name = kwargs.get("name") or (serialized or {}).get("name") or "chat_model"
+        self._open(run_id, parent_run_id, "llm", name, metadata,
+                   model=model, ttft_ms=None, _prompt_estimate=prompt)
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        with self._lock:
+            record = self._runs.get(run_id)
+            if record is not None and record["ttft_ms"] is None:
+                record["ttft_ms"] = round((time.perf_counter() - record["_start"]) * 1000, 2)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            record = self._runs.get(run_id)
+        if record is None:
+            return
+        usage = _usage(response)
+        estimated = usage is None
+        if estimated:
+            completion = sum(estimate_tokens(g.text) for gens in response.generations for g in gens)
+            usage = {"prompt_tokens": record.get("_prompt_estimate", 0), "completion_tokens": completion,
+                     "cached_tokens": 0}
+        cost = estimate_cost(record.get("model"), **usage)
+        self._close(run_id, **usage, estimated_tokens=estimated, cost_usd=round(cost, 8))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._close(run_id, error)
+
+    def on_retry(self, retry_state, *, run_id, parent_run_id=None, **kwargs):
+        with self._lock:
+            for key in (run_id, parent_run_id):
+                if key in self._runs:
+                    self._runs[key]["retries"] += 1
+                    return
+
+    def record_retry(self, run_id: Optional[UUID]):
+        """Para reintentos hechos fuera de LangChain (p. ej. el limitador de llms.py)."""
+        with self._lock:
+            if run_id in self._runs:
+                self._runs[run_id]["retries"] += 1
+
+
+def _usage(response) -> Optional[dict]:
+    """Tokens reales de la respuesta (usage_metadata o llm_output), o None si el proveedor no los da."""
+    totals = {"prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+    found = False
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                found = True
+                totals["prompt_tokens"] += usage.get("input_tokens", 0)
+                totals["completion_tokens"] += usage.get("output_tokens", 0)
+                totals["cached_tokens"] += (usage.get("input_token_details") or {}).get("cache_read", 0) or 0
+    if found:
+        return totals
+    token_usage = (response.llm_output or {}).get("token_usage")
+    if token_usage:
+        return {
+            "prompt_tokens": token_usage.get("prompt_tokens", 0),
+            "completion_tokens": token_usage.get("completion_tokens", 0),
+            "cached_tokens": (token_usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0) or 0,
+        }
+    return None
+
+
+def enable_telemetry(path: str = "telemetry/traces.jsonl", max_bytes: int = 10 * 1024 * 1024,
+                     backups: int = 5) -> TelemetryHandler:
+    """Activa la telemetría global; with_telemetry() la añade a cada ejecución."""
+    global _handler, _env_checked
+    _handler = TelemetryHandler(JsonlExporter(path, max_bytes, backups))
+    _env_checked = True
+    return _handler
+
+
+def disable_telemetry():
+    global _handler, _env_checked
+    _handler = None
+    _env_checked = True
+
+
+def _ensure_env():
+    """La primera vez, activa la telemetría si el .env define LLM_TELEMETRY=ruta."""
+    global _env_checked
+    if not _env_checked:
+        _env_checked = True
+        load_dotenv()
+        if os.getenv("LLM_TELEMETRY"):
+            enable_telemetry(os.getenv("LLM_TELEMETRY"))
+
+
+def get_telemetry_handler() -> Optional[TelemetryHandler]:
+    return _handler
+
+
+def with_telemetry(config: Optional[dict] = None, **tags) -> Optional[dict]:
+    """
+    Añade el callback de telemetría y las etiquetas (session_id, case_id...)
+    a la configuración de una ejecución. Sin telemetría activa la devuelve tal cual.
+    """
+    _ensure_env()
+    if _handler is None:
+        return config
+    config = dict(config or {})
+    callbacks = config.get("callbacks") or []
+    config["callbacks"] = list(callbacks) + [_handler]
+    config["metadata"] = {**config.get("metadata", {}), **{k: v for k, v in tags.items() if v is not None}}
+    return config
+
+
+def load_records(paths: List[str]) -> List[dict]:
+    """Lee los registros de los ficheros indicados y de sus rotaciones (.1, .2...)."""
+    files = []
+    for pattern in paths:
+        for path in glob.glob(pattern) or [pattern]:
+            files += sorted(glob.glob(f"{path}.[0-9]*"), reverse=True) + [path]
+    records = []
+    for path in dict.fromkeys(files):
+        if not os.path.exists(path):
+            continue
+        with open(path, encoding="utf-8") as f:
+            records += [json.loads(line) for line in f if line.strip()]
+    return records
+
+
+def summarize(records: List[dict]) -> List[dict]:
+    """Agrega por nodo: ejecuciones, tiempo total/medio/p95, errores, llamadas al LLM, tokens y coste."""
+    nodes = defaultdict(lambda: {"runs": 0, "errors": 0, "durations": [], "llm_calls": 0, "retries": 0,
+                                 "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0,
+                                 "cost_usd": 0.0, "ttft": []})
+    for record in records:
+        if record.get("kind") == "node":
+            stats = nodes[record["name"]]
+            stats["runs"] += 1
+            stats["durations"].append(record["duration_ms"])
+            stats["errors"] += record["status"] == "error"
+        elif record.get("kind") == "llm":
+            stats = nodes[record.get("node") or f"(llamada) {record['name']}"]
+            stats["llm_calls"] += 1
+            stats["retries"] += record.get("retries", 0)
+            for key in ("prompt_tokens", "completion_tokens", "cached_tokens", "cost_usd"):
+                stats[key] += record.get(key) or 0
+            if record.get("ttft_ms") is not None:
+                stats["ttft"].append(record["ttft_ms"])
+            if not record.get("node"):
+                stats["durations"].append(record["duration_ms"])
+                stats["runs"] += 1
+
+    rows = []
+    for name, stats in nodes.items():
+        durations = sorted(stats.pop("durations"))
+        ttft = sorted(stats.pop("ttft"))
+        rows.append({
+            "node": name,
+            **stats,
+            "total_ms": round(sum(durations), 1),
+            "mean_ms": round(sum(durations) / len(durations), 1) if durations else None,
+            "p95_ms": durations[min(len(durations) - 1, int(0.95 * len(durations)))] if durations else None,
+            "ttft_p50_ms": ttft[len(ttft) // 2] if ttft else None,
+            "cost_usd": round(stats["cost_usd"], 6),
+        })
+    return sorted(rows, key=lambda row: row["total_ms"], reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resumen de las trazas de telemetría")
+    sub = parser.add_subparsers(dest="command", required=True)
+    summary = sub.add_parser("summary", help="Nodos más lentos y caros de todas las ejecuciones")
+    summary.add_argument("paths", nargs="+", help="Ficheros JSONL (se incluyen sus rotaciones)")
+    summary.add_argument("--top", type=int, default=20)
+    summary.add_argument("--json", action="store_true", help="Salida en JSON")
+    args = parser.parse_args()
+
+    rows = summarize(load_records(args.paths))[:args.top]
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+        return
+    columns = ["runs", "total_ms", "mean_ms", "p95_ms", "ttft_p50_ms", "llm_calls", "retries",
+               "prompt_tokens", "completion_tokens", "cached_tokens", "cost_usd", "errors"]
+    print(f"{'nodo':<28}" + "".join(f"{c:>18}" for c in columns))
+    for row in rows:
+        print(f"{row['node'][:27]:<28}" + "".join(f"{'-' if row[c] is None else row[c]:>18}" for c in columns))
+
+
+if __name__ == "__main__":
+    main()
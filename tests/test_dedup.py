@@ -0,0 +1,100 @@
+"""CaseClusterer y la deduplicación de evaluate_medical_cases contra un LLM simulado."""
+
+import asyncio
+
+import voting
+from dedup import CaseClusterer
+from fake_llm import FakeChatModel
+from llms import override_chat_models
+
+CASE = "Paciente de 65 años con presión arterial elevada (160/100) y diabetes tipo 2"
+ACTION = "Se prescribió un betabloqueante y se recomendó cambios en la dieta"
+
+
+class FailingModel(FakeChatModel):
+    """FakeChatModel que falla si el prompt contiene `fail_on`."""
+
+    fail_on: str = ""
+
+    def _check(self, messages):
+        if self.fail_on and self.fail_on in messages[0].content:
+            raise RuntimeError("fallo simulado")
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        self._check(messages)
+        yield from super()._stream(messages, stop, run_manager, **kwargs)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        self._check(messages)
+        async for chunk in super()._astream(messages, stop, run_manager, **kwargs):
+            yield chunk
+
+
+def evaluate(cases, model, **kwargs):
+    async def run():
+        with override_chat_models(lambda **_: model):
+            return dict([item async for item in voting.evaluate_medical_cases(cases, dedup=0.8, **kwargs)])
+
+    return asyncio.run(run())
+
+
+def test_near_duplicates_share_a_verdict():
+    clusterer = CaseClusterer(threshold=0.8)
+    first = clusterer.assign("1", CASE, ACTION)
+    rewritten = clusterer.assign(
+        "2", "paciente de 65 anos con presion arterial elevada 160/100 y diabetes tipo 2!",
+        "Se recomendó cambios en la dieta y se prescribió un betabloqueante",
+    )
+    assert first.is_new
+    assert not rewritten.is_new
+    assert rewritten.cluster == first.cluster
+    assert rewritten.representative == "1"
+    assert rewritten.similarity >= 0.8
+
+
+def test_different_numbers_or_negated_action_do_not_match():
+    clusterer = CaseClusterer(threshold=0.8)
+    first = clusterer.assign("1", CASE, ACTION)
+    older = clusterer.assign("2", CASE.replace("65", "85"), ACTION)
+    negated = clusterer.assign("3", CASE, "No " + ACTION[0].lower() + ACTION[1:])
+    other_drug = clusterer.assign("4", CASE, ACTION.replace("betabloqueante", "IECA"))
+    assert all(assignment.is_new for assignment in (older, negated, other_drug))
+    assert len({first.cluster, older.cluster, negated.cluster, other_drug.cluster}) == 4
+
+
+def test_forget_drops_the_cluster_from_the_index():
+    clusterer = CaseClusterer(threshold=0.8)
+    first = clusterer.assign("1", CASE, ACTION)
+    clusterer.forget(first.cluster)
+    assert len(clusterer) == 0
+    assert not clusterer._exact and not clusterer._clusters
+    assert not any(clusterer._buckets)
+    again = clusterer.assign("2", CASE, ACTION)
+    assert again.is_new and again.representative == "2"
+
+
+def test_duplicates_copy_the_representative_verdict():
+    model = FakeChatModel()
+    cases = [{"id": str(i), "case": CASE + "." * i, "action": ACTION} for i in range(4)]
+    results = evaluate(cases, model)
+    assert [results[i]["final_decision"] for i in range(4)] == ["CORRECTO"] * 4
+    assert [results[i].get("duplicate_of") for i in range(4)] == [None, "0", "0", "0"]
+    assert model.calls == len(voting.SPECIALISTS)
+
+
+def test_evicted_representative_is_replaced_by_the_next_duplicate(monkeypatch):
+    monkeypatch.setattr(voting, "DEDUP_MAX_REPRESENTATIVES", 1)
+    other = {"id": "otro", "case": "Niña de 8 años con fiebre y dolor de oído", "action": "Se pautó amoxicilina"}
+    cases = [{"id": "a", "case": CASE, "action": ACTION}, other, {"id": "b", "case": CASE + ".", "action": ACTION}]
+    results = evaluate(cases, FakeChatModel(), concurrency=1)
+    # "otro" expulsó del LRU el veredicto de "a": "b" se evalúa en su lugar
+    assert results[2].get("duplicate_of") is None
+    assert results[2]["final_decision"] == "CORRECTO"
+
+
+def test_failed_representative_is_not_copied():
+    model = FailingModel(fail_on="primero")
+    cases = [{"id": str(i), "case": CASE + " primero" + "." * i, "action": ACTION} for i in range(3)]
+    results = evaluate(cases, model)
+    assert all(results[i]["final_decision"] == "ERROR" for i in range(3))
+    assert all(results[i].get("duplicate_of") is None for i in range(3))
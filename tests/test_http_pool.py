@@ -0,0 +1,48 @@
+"""HTTPPool contra el servidor OpenAI simulado: las peticiones reutilizan conexiones."""
+
+import asyncio
+
+from fake_llm import StubLLMServer
+from http_pool import HTTPPool, endpoint_key
+
+BODY = {"model": "stub", "messages": [{"role": "user", "content": "hola"}]}
+
+
+def test_sync_clients_share_one_connection():
+    with StubLLMServer() as server:
+        pool = HTTPPool(endpoint_key(server.url), http2=False)
+        try:
+            # Dos clientes distintos, como dos modelos de chat, sobre el mismo pool
+            for client in (pool.client(), pool.client()):
+                for _ in range(3):
+                    response = client.post(server.url + "/v1/chat/completions", json=BODY)
+                    assert response.status_code == 200
+        finally:
+            pool.close()
+
+    stats = pool.stats()
+    assert server.requests == 6
+    assert server.connections == 1
+    assert stats["requests"] == 6
+    assert stats["connections"] == 1
+    assert stats["reused"] == 5
+
+
+def test_async_clients_reuse_connections():
+    async def run(pool, url):
+        clients = [pool.async_client(), pool.async_client()]
+        for _ in range(3):
+            responses = await asyncio.gather(*[client.post(url, json=BODY) for client in clients])
+            assert all(response.status_code == 200 for response in responses)
+        await pool.aclose()
+
+    with StubLLMServer(latency=0.01) as server:
+        pool = HTTPPool(endpoint_key(server.url), http2=False)
+        asyncio.run(run(pool, server.url + "/v1/chat/completions"))
+
+    stats = pool.stats()
+    assert stats["requests"] == 6
+    # Como mucho una conexión por petición simultánea
+    assert server.connections <= 2
+    assert stats["connections"] == server.connections
+    assert stats["reused"] == 6 - server.connections
@@ -0,0 +1,45 @@
+"""MicroBatcher y VotingService contra un LLM simulado."""
+
+import asyncio
+
+import pytest
+
+import voting_service
+from fake_llm import FakeChatModel
+from voting_service import VotingService
+
+
+def test_batches_concurrent_requests():
+    async def run():
+        service = VotingService(FakeChatModel(latency=0.01), window=0.05)
+        results = await asyncio.gather(*[service.evaluate(f"Caso {i}", "Acción") for i in range(6)])
+        await service.batcher.stop()
+        return service, results
+
+    service, results = asyncio.run(run())
+    assert [result["final_decision"] for result in results] == ["CORRECTO"] * 6
+    assert service.batcher.batches < 6
+    assert service.metrics()["latency"]["count"] == 6
+
+
+def test_unknown_quorum_is_rejected_up_front():
+    with pytest.raises(ValueError):
+        VotingService(FakeChatModel(), quorum="mayoria")
+
+
+def test_error_before_abatch_fails_every_request(monkeypatch):
+    def broken_config(*args, **kwargs):
+        raise RuntimeError("configuración rota")
+
+    monkeypatch.setattr(voting_service, "create_run_config", broken_config)
+
+    async def run():
+        service = VotingService(FakeChatModel(), window=0.05)
+        requests = [service.evaluate(f"Caso {i}", "Acción") for i in range(3)]
+        results = await asyncio.wait_for(asyncio.gather(*requests, return_exceptions=True), timeout=5)
+        await service.batcher.stop()
+        return service, results
+
+    service, results = asyncio.run(run())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert service.errors == 3
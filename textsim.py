@@ -0,0 +1,47 @@
+"""Similitud de textos local (sin embeddings): tokens, TF-IDF y coseno."""
+
+import math
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, List
+
+# Palabras vacías frecuentes en español e inglés; no aportan a la similitud
+STOPWORDS = frozenset("""
+a al algo ante como con contra cual cuando de del desde donde el ella ellas ellos en entre era es esa ese
+eso esta este esto estos estas fue ha han hay la las le les lo los mas me mi muy no nos o os para pero
+por porque que se ser si sin sobre son su sus tambien te tiene todo tu un una uno unos unas y ya yo
+the and of to in is it that for on with as are be this by or not
+""".split())
+
+_WORD = re.compile(r"[a-z0-9ñ]+")
+
+
+def normalize(text: str) -> str:
+    """Minúsculas y sin tildes (se conserva la ñ)."""
+    text = unicodedata.normalize("NFKD", text.lower().replace("ñ", "\0"))
+    return "".join(ch for ch in text if not unicodedata.combining(ch)).replace("\0", "ñ")
+
+
+def tokenize(text: str) -> List[str]:
+    return [word for word in _WORD.findall(normalize(text)) if len(word) > 2 and word not in STOPWORDS]
+
+
+def tfidf_vectors(docs: List[List[str]]) -> List[Dict[str, float]]:
+    """Vectores TF-IDF (idf suavizado) de documentos ya tokenizados, normalizados a norma 1."""
+    df = Counter(term for doc in docs for term in set(doc))
+    n = len(docs)
+    vectors = []
+    for doc in docs:
+        tf = Counter(doc)
+        vector = {term: count * (math.log((1 + n) / (1 + df[term])) + 1) for term, count in tf.items()}
+        norm = math.sqrt(sum(w * w for w in vector.values()))
+        vectors.append({term: w / norm for term, w in vector.items()} if norm else {})
+    return vectors
+
+
+def cosine(a: Dict[str, float], b: Dict[str, float]) -> float:
+    """Coseno entre vectores dispersos ya normalizados."""
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(w * b.get(term, 0.0) for term, w in a.items())
@@ -0,0 +1,115 @@
+"""Transcripción de conversación de solo-añadir.
+
+Cada intervención es un Turn (rol, contenido) compacto. Una Transcript es una
+vista de longitud fija sobre un búfer compartido que solo crece por el final:
+añadir turnos crea una vista nueva sin copiar el historial (O(1) amortizado),
+y las vistas anteriores siguen viendo exactamente lo que veían. Solo si dos
+vistas añaden turnos distintos desde el mismo punto se copia el búfer.
+
+En un grafo de LangGraph se usa con el reductor `append_turns`, de modo que
+los nodos devuelven solo los turnos nuevos.
+"""
+
+from collections.abc import Sequence
+from itertools import islice
+from typing import Iterable, List, NamedTuple, Union
+
+
+class Turn(NamedTuple):
+    role: str
+    content: str
+
+
+TurnLike = Union[Turn, dict, tuple]
+
+
+def as_turn(turn: TurnLike) -> Turn:
+    """Acepta Turn, dict {"role", "content"} o tupla (rol, contenido)."""
+    if isinstance(turn, Turn):
+        return turn
+    if isinstance(turn, dict):
+        return Turn(turn.get("role", "unknown"), turn.get("content", ""))
+    return Turn(*turn)
+
+
+class Transcript(Sequence):
+    """Secuencia inmutable de Turn que comparte búfer con sus ampliaciones."""
+
+    __slots__ = ("_turns", "_size")
+
+    def __init__(self, turns: Iterable[TurnLike] = ()):
+        self._turns = [as_turn(turn) for turn in turns]
+        self._size = len(self._turns)
+
+    @classmethod
+    def _view(cls, turns: list, size: int) -> "Transcript":
+        view = cls.__new__(cls)
+        view._turns = turns
+        view._size = size
+        return view
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._turns[i] for i in range(self._size)[index]]
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("Transcript index out of range")
+        return self._turns[index]
+
+    def __iter__(self):
+        return islice(self._turns, self._size)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (Transcript, list)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"Transcript({list(self)!r})"
+
+    def _asdict(self) -> dict:
+        """Argumentos del constructor; el serializador de checkpoints de LangGraph lo usa como con una namedtuple."""
+        return {"turns": list(self)}
+
+    def appended(self, turns: Iterable[TurnLike]) -> "Transcript":
+        """Vista nueva con `turns` añadidos al final; esta vista no cambia."""
+        new = [as_turn(turn) for turn in turns]
+        buffer, size = self._turns, self._size
+        if len(buffer) == size:
+            buffer.extend(new)
+        elif buffer[size:size + len(new)] != new:
+            # Otra vista ya siguió por otro camino desde aquí: se bifurca el búfer
+            buffer = buffer[:size] + new
+        # Si otra vista ya añadió estos mismos turnos, se comparten
+        return self._view(buffer, size + len(new))
+
+    def add(self, role: str, content: str) -> Turn:
+        """Añade un turno a esta misma vista (para un único propietario, p. ej. DebateManager)."""
+        extended = self.appended([Turn(role, content)])
+        self._turns, self._size = extended._turns, extended._size
+        return self._turns[self._size - 1]
+
+    def tail(self, n: int) -> List[Turn]:
+        """Los últimos `n` turnos (copia solo esos `n`)."""
+        return self[-n:] if n > 0 else []
+
+    def as_dicts(self) -> List[dict]:
+        return [turn._asdict() for turn in self]
+
+
+def append_turns(current, update) -> Transcript:
+    """
+    Reductor para campos Annotated[Transcript, append_turns] del estado.
+
+    Devuelve una vista ampliada con los turnos nuevos sin copiar el historial.
+    `update` puede ser un turno suelto o una lista de turnos.
+    """
+    if not isinstance(current, Transcript):
+        current = Transcript(current or ())
+    if isinstance(update, (Turn, dict)):
+        update = [update]
+    return current.appended(update or ())
@@ -0,0 +1,156 @@
+"""Parser JSON incremental para los votos de los especialistas.
+
+Recibe los tokens a medida que llegan del modelo y publica el campo "voto" en
+cuanto su cadena se cierra, sin esperar al resto del razonamiento. Si la cola
+de la respuesta llega malformada, el voto ya extraído se conserva. Los valores
+que no son cadenas (p. ej. "confianza": 0.8) se guardan con su texto literal.
+"""
+
+import json
+import math
+from typing import Callable, Optional
+
+# strict=False admite saltos de línea literales dentro de las cadenas
+_DECODER = json.JSONDecoder(strict=False)
+
+
+class VoteStreamParser:
+    """
+    Analiza incrementalmente un objeto JSON plano {"voto": ..., "confianza": ..., "razonamiento": ...}.
+
+    Args:
+        on_vote: Callback que recibe el voto en cuanto está completo
+    """
+
+    def __init__(self, on_vote: Optional[Callable[[str], None]] = None):
+        self.on_vote = on_vote
+        self.fields = {}
+        self.text = ""
+        self.complete = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._raw = []
+        self._key: Optional[str] = None
+        self._expect_key = False
+        self._string_key: Optional[str] = None
+        self._scalar = []
+
+    @property
+    def vote(self) -> Optional[str]:
+        return self.fields.get("voto")
+
+    @property
+    def confidence(self) -> Optional[float]:
+        """Confianza que declaró el modelo en [0, 1], o None si no la dio o no se entiende."""
+        return parse_confidence(self.fields.get("confianza"))
+
+    @property
+    def reasoning(self) -> str:
+        """Razonamiento completo o, si aún se está recibiendo, lo que haya llegado."""
+        if "razonamiento" in self.fields:
+            return self.fields["razonamiento"]
+        if self._in_string and self._string_key == "razonamiento":
+            return _decode_partial("".join(self._raw))
+        return ""
+
+    def feed(self, chunk: str) -> None:
+        self.text += chunk
+        if self.complete:
+            return
+
+        for ch in chunk:
+            if self._in_string:
+                self._consume_string_char(ch)
+            elif ch == "{":
+                self._depth += 1
+                if self._depth == 1:
+                    self._expect_key = True
+            elif ch == "}" and self._depth:
+                if self._depth == 1:
+                    self._end_scalar()
+                self._depth -= 1
+                if self._depth == 0:
+                    self.complete = True
+                    return
+            elif self._depth == 0:
+                continue  # Texto antes del objeto JSON
+            elif ch == '"':
+                self._in_string = True
+                self._raw = []
+                self._string_key = None if self._expect_key else self._key
+            elif ch == ":" and self._depth == 1:
+                self._expect_key = False
+            elif ch == "," and self._depth == 1:
+                self._end_scalar()
+                self._expect_key = True
+                self._key = None
+            elif self._depth == 1 and not self._expect_key and self._key is not None and not ch.isspace():
+                self._scalar.append(ch)
+
+    def _end_scalar(self) -> None:
+        if self._scalar and self._key is not None:
+            self.fields[self._key] = "".join(self._scalar)
+        self._scalar = []
+
+    def _consume_string_char(self, ch: str) -> None:
+        if self._escape:
+            self._escape = False
+            self._raw.append(ch)
+            return
+        if ch == "\\":
+            self._escape = True
+            self._raw.append(ch)
+            return
+        if ch != '"':
+            self._raw.append(ch)
+            return
+
+        # Fin de la cadena
+        self._in_string = False
+        value = _decode_partial("".join(self._raw))
+        if self._depth != 1:
+            return
+        if self._expect_key:
+            self._key = value
+        elif self._key is not None:
+            self.fields[self._key] = value
+            if self._key == "voto" and self.on_vote:
+                self.on_vote(value)
+
+    def result(self) -> tuple:
+        """
+        Devuelve (voto, razonamiento). Si no llegó a publicarse un voto, cae
+        a INDECISO con el texto completo como razonamiento.
+        """
+        if self.vote is None:
+            return "INDECISO", self.text
+        return self.vote, self.reasoning
+
+
+def parse_confidence(value: Optional[str]) -> Optional[float]:
+    """
+    Convierte la confianza declarada ("0.8", "80", "80%") a [0, 1]. Por encima
+    de 1 se entiende como porcentaje.
+    """
+    if value is None:
+        return None
+    try:
+        confidence = float(value.strip().rstrip("%"))
+    except ValueError:
+        return None
+    if not math.isfinite(confidence):
+        return None
+    if confidence > 1:
+        confidence /= 100
+    return min(max(confidence, 0.0), 1.0)
+
+
+def _decode_partial(raw: str) -> str:
+    """Decodifica los escapes JSON de una cadena, tolerando un escape cortado al final."""
+    for end in range(len(raw), max(len(raw) - 6, -1), -1):
+        try:
+            return _DECODER.decode(f'"{raw[:end]}"')
+        except json.JSONDecodeError:
+            continue
+    return raw
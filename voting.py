@@ -1,37 +1,77 @@
-from langchain_core.output_parsers import JsonOutputParser
-from langchain_core.messages import HumanMessage
-from langchain.agents import create_agent
-from dotenv import load_dotenv
-load_dotenv()
-
-from typing import TypedDict
-from langgraph.graph import StateGraph, END
+from typing import Annotated, AsyncIterator, Callable, Iterable, Iterator, Optional, Tuple, TypedDict, Union
+from langgraph.constants import START, END
+from quorum import DEFAULT_QUORUM, MIXED_DECISION, Ballot, decide, weighted_support
+from vote_stream import VoteStreamParser
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from collections import Counter, OrderedDict
+from contextlib import closing
+import argparse
+import asyncio
+import contextvars
 import json
+import operator
+import os
+import threading
+import time
 
-from langchain_openai import ChatOpenAI
-from typing import TypedDict
-from langgraph.graph import StateGraph, END
-import json
+from cascade import ModelCascade
+from llms import get_routed_model
+from output import add_sink_arguments, sink_from_args
+
+# Voto de un especialista abandonado por vencer el plazo del caso
+TIMEOUT_VOTE = "TIMEOUT"
+
+# Veredictos que evaluate_medical_cases recuerda para copiarlos a casos duplicados
+DEDUP_MAX_REPRESENTATIVES = 4096
+# Casos leídos en espera (evaluándose o copiando un veredicto) por hueco de concurrencia
+DEDUP_PENDING_PER_SLOT = 4
+
+def merge_dicts(left: dict, right: dict) -> dict:
+    """Reducer que combina las actualizaciones parciales de cada especialista"""
+    return {**(left or {}), **(right or {})}
 
 # Define el estado compartido entre agentes
 class MedicalState(TypedDict):
     case: str
     action: str
-    eye_specialist_vote: str
-    cardiac_specialist_vote: str
-    eye_reasoning: str
-    cardiac_reasoning: str
+    votes: Annotated[dict, merge_dicts]
+    reasoning: Annotated[dict, merge_dicts]
+    vote_distribution: Annotated[dict, merge_dicts]
+    confidence: Annotated[dict, merge_dicts]
+    cancelled: Annotated[list, operator.add]
     final_decision: str
+    incomplete: bool
     messages: list
 
-# Inicializa cliente de OpenAI
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.7)
+def get_llm():
+    """
+    Cliente de OpenAI compartido, creado en el primer uso. Si la cascada está
+    activada (llms.enable_cascade / LLM_CASCADE) devuelve la cascada local -> OpenAI
+    """
+    return get_routed_model("gpt-4o-mini", temperature=0.7)
+
+# Registro de especialistas: clave -> rol en el prompt, etiqueta en el resumen y muestras
+SPECIALISTS = {}
+_voting_graph = None
 
-def eye_specialist_agent(state: MedicalState) -> MedicalState:
+def register_specialist(key: str, role: str, label: str, samples: int = 1) -> None:
     """
-    Agente especializado en salud ocular que evalúa acciones médicas
+    Registra un especialista que votará en paralelo sobre cada caso.
+    Con `samples` > 1 pide k respuestas en una sola llamada (n=k) y vota
+    con la distribución resultante (self-consistency); su confianza es la
+    fracción de muestras que dan el voto. Con una sola muestra, la confianza
+    es la que declara el modelo en el campo "confianza"
     """
-    prompt = f"""Eres un oftalmólogo experto. Evalúa el siguiente caso médico y la acción tomada.
+    global _voting_graph
+    SPECIALISTS[key] = {"role": role, "label": label, "samples": samples}
+    # El grafo compilado depende de los especialistas registrados
+    _voting_graph = None
+
+register_specialist("eye", "un oftalmólogo experto", "ESPECIALISTA EN SALUD OCULAR")
+register_specialist("cardiac", "un cardiólogo experto", "ESPECIALISTA EN SALUD CARDIACA")
+
+def build_specialist_prompt(role: str, state: MedicalState) -> str:
+    return f"""Eres {role}. Evalúa el siguiente caso médico y la acción tomada.
 
 CASO: {state['case']}
 ACCIÓN MÉDICA TOMADA: {state['action']}
@@ -39,143 +79,744 @@ ACCIÓN MÉDICA TOMADA: {state['action']}
 Responde en JSON con este formato exacto:
 {{
     "voto": "CORRECTO" o "INCORRECTO",
+    "confianza": número entre 0 y 1 con tu seguridad en el voto,
     "razonamiento": "Tu explicación detallada"
 }}
 
 Considera si la acción es apropiada, segura y basada en mejores prácticas médicas."""
 
-    from langchain_core.messages import HumanMessage
-    
-    response = llm.invoke([HumanMessage(content=prompt)])
-    response_text = response.content
-    
-    try:
-        # Extrae JSON del contenido
-        json_start = response_text.find('{')
-        json_end = response_text.rfind('}') + 1
-        json_str = response_text[json_start:json_end]
-        response_json = json.loads(json_str)
-        state["eye_specialist_vote"] = response_json.get("voto", "INDECISO")
-        state["eye_reasoning"] = response_json.get("razonamiento", "")
-    except (json.JSONDecodeError, ValueError):
-        state["eye_specialist_vote"] = "INDECISO"
-        state["eye_reasoning"] = response_text
-    
-    return state
+def parse_vote(response_text: str) -> tuple:
+    """
+    Extrae (voto, razonamiento) de la respuesta JSON completa del especialista
+    """
+    parser = VoteStreamParser()
+    parser.feed(response_text)
+    return parser.result()
 
-def cardiac_specialist_agent(state: MedicalState) -> MedicalState:
+def summarize_samples(texts: list) -> tuple:
     """
-    Agente especializado en salud cardiaca que evalúa acciones médicas
+    Agrega k respuestas de un especialista en (voto, razonamiento, distribución).
+    El voto es el más frecuente entre las respuestas válidas; la distribución
+    incluye también las INDECISO, que restan confianza
     """
-    prompt = f"""Eres un cardiólogo experto. Evalúa el siguiente caso médico y la acción tomada.
+    parsed = [parse_vote(text) for text in texts]
+    counts = Counter(vote for vote, _ in parsed)
+    decided = Counter({vote: n for vote, n in counts.items() if vote != "INDECISO"})
+    vote = (decided or counts).most_common(1)[0][0]
+    reasoning = next(reasoning for v, reasoning in parsed if v == vote)
+    distribution = {v: round(n / len(parsed), 3) for v, n in counts.items()}
+    return vote, reasoning, distribution
 
-CASO: {state['case']}
-ACCIÓN MÉDICA TOMADA: {state['action']}
+def _sample(model, messages: list, k: int) -> list:
+    """
+    k respuestas para el mismo prompt: una sola petición con n=k si el modelo
+    lo admite (OpenAI), o k peticiones concurrentes si no (Ollama)
+    """
+    if "n" in getattr(type(model), "model_fields", {}):
+        result = model.generate([messages], n=k)
+        return [generation.text for generation in result.generations[0]]
+    return [response.content for response in model.batch([messages] * k)]
 
-Responde en JSON con este formato exacto:
-{{
-    "voto": "CORRECTO" o "INCORRECTO",
-    "razonamiento": "Tu explicación detallada"
-}}
+async def _asample(model, messages: list, k: int) -> list:
+    if "n" in getattr(type(model), "model_fields", {}):
+        result = await model.agenerate([messages], n=k)
+        return [generation.text for generation in result.generations[0]]
+    return [response.content for response in await model.abatch([messages] * k)]
 
-Considera si la acción es apropiada, segura y basada en mejores prácticas médicas."""
+def _vote_update(key: str, vote: str, reasoning: str, distribution: Optional[dict] = None,
+                 confidence: Optional[float] = None) -> dict:
+    """
+    Parte del estado de un especialista. La confianza sale de la distribución
+    si hay varias muestras y, si no, de la declarada por el modelo (1.0 si no la dio)
+    """
+    if distribution is not None:
+        confidence = distribution.get(vote, 0.0)
+    elif confidence is None:
+        confidence = 1.0
+    return {
+        "votes": {key: vote},
+        "reasoning": {key: reasoning},
+        "vote_distribution": {key: distribution or {vote: 1.0}},
+        "confidence": {key: confidence},
+    }
 
+def _vote_publisher(key: str):
+    """
+    Publica el voto en el stream "custom" del grafo en cuanto se conoce
+    """
+    from langgraph.config import get_stream_writer
+    writer = get_stream_writer()
+    return lambda vote: writer({"specialist": key, "voto": vote})
 
-    
-    response = llm.invoke([HumanMessage(content=prompt)])
-    response_text = response.content
-    
-    try:
-        # Extrae JSON del contenido
-        json_start = response_text.find('{')
-        json_end = response_text.rfind('}') + 1
-        json_str = response_text[json_start:json_end]
-        response_json = json.loads(json_str)
-        state["cardiac_specialist_vote"] = response_json.get("voto", "INCORRECTO")
-        state["cardiac_reasoning"] = response_json.get("razonamiento", "")
-    except (json.JSONDecodeError, ValueError):
-        state["cardiac_specialist_vote"] = "INDECISO"
-        state["cardiac_reasoning"] = response_text
-    
-    return state
+def _run_config() -> dict:
+    from langgraph.config import get_config
+    return get_config().get("configurable", {})
 
-def coordinator_agent(state: MedicalState) -> MedicalState:
+def _current_ballot():
     """
-    Agente coordinador que tabula los votos y da una decisión final
+    Urna de la ejecución actual (ver create_run_config), o None si el grafo
+    se invocó sin ella; en ese caso no hay terminación anticipada
     """
-    eye_vote = state.get("eye_specialist_vote", "INDECISO")
-    cardiac_vote = state.get("cardiac_specialist_vote", "INDECISO")
-    
-    # Lógica de votación: mayoría simple
-    if eye_vote == cardiac_vote:
-        final_decision = eye_vote
+    return _run_config().get("ballot")
+
+def _remaining(deadline: Optional[float]) -> Optional[float]:
+    """Segundos que quedan hasta el plazo absoluto (time.monotonic), o None sin plazo"""
+    return None if deadline is None else deadline - time.monotonic()
+
+def _cancelled(key: str, ballot: Ballot) -> dict:
+    ballot.mark_cancelled(key)
+    return {"cancelled": [key]}
+
+def _vote_or_timeout(key: str, vote: Optional[str], reasoning: str, confidence: Optional[float] = None) -> dict:
+    """
+    Resultado de un especialista abandonado por plazo: si su voto ya había
+    llegado se conserva (con el razonamiento recibido hasta entonces)
+    """
+    if vote is not None:
+        return _vote_update(key, vote, reasoning + " [razonamiento incompleto]", confidence=confidence)
+    _record_deadline(key, timed_out=True)
+    return {"votes": {key: TIMEOUT_VOTE}, "reasoning": {key: "Sin respuesta antes del plazo"}}
+
+# Métricas de plazos: especialista -> {"calls": n, "timeouts": m}
+_deadline_stats = {}
+_deadline_lock = threading.Lock()
+
+def _record_deadline(key: str, timed_out: bool = False):
+    with _deadline_lock:
+        stats = _deadline_stats.setdefault(key, {"calls": 0, "timeouts": 0})
+        if timed_out:
+            stats["timeouts"] += 1
+        else:
+            stats["calls"] += 1
+
+def deadline_stats() -> dict:
+    """
+    Cuántas veces venció el plazo por especialista (solo llamadas con plazo)
+    """
+    with _deadline_lock:
+        return {
+            key: {**stats, "timeout_rate": round(stats["timeouts"] / stats["calls"], 3) if stats["calls"] else 0.0}
+            for key, stats in _deadline_stats.items()
+        }
+
+# Llamadas abandonadas cuyo hilo sigue esperando al proveedor
+_abandoned_calls = 0
+
+def _start_call(func) -> Future:
+    """
+    Ejecuta `func` en un hilo propio (con el contexto actual: callbacks, telemetría)
+    para poder abandonarla. Un pool compartido no sirve: una llamada abandonada
+    sigue bloqueada hasta el timeout HTTP del cliente, y bastarían unas cuantas
+    para que los casos siguientes esperasen en cola y venciesen sin llegar al modelo.
+    """
+    future = Future()
+    context = contextvars.copy_context()
+
+    def run():
+        try:
+            future.set_result(context.run(func))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name="specialist-call", daemon=True).start()
+    return future
+
+class _CallGuard:
+    """
+    Estado compartido entre una llamada síncrona y quien la espera. El voto
+    solo se entrega (publica y vota) mientras la llamada no se haya abandonado,
+    y entregar y abandonar se excluyen: tras abandonarla, `vote` es el último
+    voto entregado y el hilo ya no puede publicar ni votar
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._abandoned = False
+        self.vote: Optional[str] = None
+
+    def is_abandoned(self) -> bool:
+        return self._abandoned
+
+    def deliver(self, vote: str, action: Callable[[str], None]):
+        with self._lock:
+            if self._abandoned:
+                return
+            self.vote = vote
+            action(vote)
+
+    def abandon(self, call: Future):
+        """Marca la llamada como abandonada y la cuenta mientras su hilo siga vivo."""
+        global _abandoned_calls
+        with self._lock:
+            self._abandoned = True
+        with _deadline_lock:
+            _abandoned_calls += 1
+
+        def finished(_):
+            global _abandoned_calls
+            with _deadline_lock:
+                _abandoned_calls -= 1
+
+        call.add_done_callback(finished)
+
+def abandoned_calls() -> int:
+    """Llamadas abandonadas (plazo vencido o decisión fijada) que aún no han terminado."""
+    with _deadline_lock:
+        return _abandoned_calls
+
+def _accepts(update: dict, key: str, min_confidence: float) -> bool:
+    """
+    ¿Se queda la cascada con este resultado? Escala si el voto no se pudo
+    extraer (INDECISO) o la confianza es baja (con una sola muestra, la que
+    declaró el modelo). Cancelado o TIMEOUT no escalan: ya no hay decisión
+    que cambiar ni tiempo para hacerlo
+    """
+    vote = update.get("votes", {}).get(key)
+    if vote is None or vote == TIMEOUT_VOTE:
+        return True
+    return vote != "INDECISO" and update["confidence"][key] >= min_confidence
+
+def create_specialist_agent(key: str, llm=None):
+    """
+    Factory para crear el nodo de un especialista registrado.
+    Si no se pasa `llm`, usa el modelo de get_llm() (cliente compartido o cascada)
+    """
+    from langchain_core.messages import HumanMessage
+
+    def _parser(ballot, publish: bool, guard: Optional[_CallGuard] = None):
+        publisher = _vote_publisher(key) if publish else None
+
+        def on_vote(vote):
+            if publisher is not None:
+                publisher(vote)
+            if ballot is not None:
+                ballot.cast(key, vote)
+
+        # Una llamada abandonada ya se dio por TIMEOUT o cancelada: su voto no cuenta
+        if guard is not None:
+            return VoteStreamParser(on_vote=lambda vote: guard.deliver(vote, on_vote))
+        return VoteStreamParser(on_vote=on_vote)
+
+    def _commit(update: dict, ballot):
+        """Publica y registra en la urna un voto obtenido sin publicar (p. ej. en la cascada)"""
+        vote = update["votes"][key]
+        _vote_publisher(key)(vote)
+        if ballot is not None:
+            # La urna pondera con la distribución, no solo con el voto principal
+            ballot.cast(key, update["vote_distribution"][key])
+
+    def _sampled_update(texts: list, ballot, publish: bool) -> dict:
+        vote, reasoning, distribution = summarize_samples(texts)
+        update = _vote_update(key, vote, reasoning, distribution)
+        if publish:
+            _commit(update, ballot)
+        return update
+
+    def consult(model, messages: list, ballot, deadline, publish: bool = True) -> dict:
+        """Una consulta síncrona al modelo, con cancelación por quórum y plazo"""
+        guard = _CallGuard()
+        parser = _parser(ballot, publish, guard)
+        samples = SPECIALISTS[key]["samples"]
+        sampled = []
+
+        def consume() -> bool:
+            """Consulta al modelo; True si la cortó una decisión ya fijada sin su voto"""
+            if samples > 1:
+                sampled.extend(_sample(model, messages, samples))
+                return False
+            # Las respuestas cacheadas no pasan por stream, así que se piden enteras
+            if getattr(model, "cache", None):
+                parser.feed(model.invoke(messages).content)
+                return False
+            # Cerrar el stream corta la generación en el proveedor
+            with closing(model.stream(messages)) as stream:
+                for chunk in stream:
+                    parser.feed(chunk.content)
+                    if guard.is_abandoned():
+                        return False
+                    if ballot is not None and ballot.should_stop(key):
+                        return True
+            return False
+
+        if ballot is None and deadline is None:
+            stopped = consume()
+        else:
+            if deadline is not None:
+                _record_deadline(key)
+                if _remaining(deadline) <= 0:
+                    return _vote_or_timeout(key, None, "")
+            # La llamada bloqueante corre en otro hilo y aquí se espera a que termine,
+            # se fije la decisión o venza el plazo, lo que llegue antes: el hilo
+            # abandonado corta el stream en cuanto llegue el siguiente token
+            wake = threading.Event()
+            call = _start_call(consume)
+            call.add_done_callback(lambda _: wake.set())
+            if ballot is not None:
+                ballot.subscribe(wake)
+            wake.wait(_remaining(deadline))
+            if not call.done():
+                if ballot is not None and ballot.should_stop(key):
+                    guard.abandon(call)
+                    if guard.vote is None:
+                        return _cancelled(key, ballot)
+                    # Su voto llegó justo antes de abandonarla: ya está en la urna
+                    return _vote_or_timeout(key, guard.vote, parser.reasoning, parser.confidence)
+                try:
+                    # El propio voto pudo fijar la decisión: termina su razonamiento dentro del plazo
+                    call.result(timeout=_remaining(deadline))
+                except FutureTimeoutError:
+                    guard.abandon(call)
+                    return _vote_or_timeout(key, guard.vote, parser.reasoning, parser.confidence)
+            stopped = call.result()
+
+        # Solo se da por cancelado si de verdad no terminó
+        if stopped:
+            return _cancelled(key, ballot)
+        if sampled:
+            return _sampled_update(sampled, ballot, publish)
+        vote, reasoning = parser.result()
+        if ballot is not None:
+            ballot.cast(key, vote)
+
+        # Solo devuelve su parte del estado para no pisar a los demás especialistas
+        return _vote_update(key, vote, reasoning, confidence=parser.confidence)
+
+    async def aconsult(model, messages: list, ballot, deadline, publish: bool = True) -> dict:
+        """Una consulta asíncrona al modelo, con cancelación por quórum y plazo"""
+        parser = _parser(ballot, publish)
+        samples = SPECIALISTS[key]["samples"]
+        sampled = []
+
+        async def consume():
+            if samples > 1:
+                sampled.extend(await _asample(model, messages, samples))
+                return
+            if getattr(model, "cache", None):
+                parser.feed((await model.ainvoke(messages)).content)
+                return
+            stream = model.astream(messages)
+            try:
+                async for chunk in stream:
+                    parser.feed(chunk.content)
+            finally:
+                await stream.aclose()
+
+        if deadline is not None:
+            _record_deadline(key)
+            if _remaining(deadline) <= 0:
+                return _vote_or_timeout(key, parser.vote, parser.reasoning, parser.confidence)
+
+        # Corre la llamada en paralelo con la espera de decisión y el plazo para
+        # poder cancelarla aunque todavía no haya llegado ningún token
+        call = asyncio.ensure_future(consume())
+        waiters = {call}
+        decided = None
+        if ballot is not None:
+            decided = asyncio.ensure_future(ballot.wait_decided())
+            waiters.add(decided)
+        await asyncio.wait(waiters, timeout=_remaining(deadline), return_when=asyncio.FIRST_COMPLETED)
+        if decided is not None:
+            decided.cancel()
+
+        if not call.done():
+            if ballot is not None and ballot.should_stop(key):
+                call.cancel()
+                await asyncio.gather(call, return_exceptions=True)
+                return _cancelled(key, ballot)
+            try:
+                # El propio voto pudo fijar la decisión: termina su razonamiento dentro del plazo
+                await asyncio.wait_for(call, _remaining(deadline))
+            except asyncio.TimeoutError:
+                return _vote_or_timeout(key, parser.vote, parser.reasoning, parser.confidence)
+        call.result()
+
+        if sampled:
+            return _sampled_update(sampled, ballot, publish)
+        vote, reasoning = parser.result()
+        if ballot is not None:
+            ballot.cast(key, vote)
+        return _vote_update(key, vote, reasoning, confidence=parser.confidence)
+
+    def _after_tier(update: dict, cascade: ModelCascade, ballot, final: bool) -> dict:
+        """
+        Los niveles previos al último consultan sin publicar ni votar: su voto
+        solo cuenta si la cascada lo acepta
+        """
+        if final:
+            return update
+        if _accepts(update, key, cascade.min_confidence):
+            if update.get("votes", {}).get(key) not in (None, TIMEOUT_VOTE):
+                _commit(update, ballot)
+        elif ballot is not None and ballot.should_stop(key):
+            # La decisión se fijó mientras consultábamos el nivel local: no hace falta escalar
+            return _cancelled(key, ballot)
+        return update
+
+    def specialist_agent(state: MedicalState) -> dict:
+        model = llm or get_llm()
+        messages = [HumanMessage(content=build_specialist_prompt(SPECIALISTS[key]["role"], state))]
+        ballot = _current_ballot()
+        deadline = _run_config().get("deadline")
+        if ballot is not None and ballot.should_stop(key):
+            return _cancelled(key, ballot)
+
+        if not isinstance(model, ModelCascade):
+            return consult(model, messages, ballot, deadline)
+
+        def attempt(tier, final: bool) -> dict:
+            update = consult(tier, messages, ballot if final else None, deadline, publish=final)
+            return _after_tier(update, model, ballot, final)
+
+        return model.run(attempt, accept=lambda update: _accepts(update, key, model.min_confidence))
+
+    async def aspecialist_agent(state: MedicalState) -> dict:
+        model = llm or get_llm()
+        messages = [HumanMessage(content=build_specialist_prompt(SPECIALISTS[key]["role"], state))]
+        ballot = _current_ballot()
+        deadline = _run_config().get("deadline")
+        if ballot is not None and ballot.should_stop(key):
+            return _cancelled(key, ballot)
+
+        if not isinstance(model, ModelCascade):
+            return await aconsult(model, messages, ballot, deadline)
+
+        async def attempt(tier, final: bool) -> dict:
+            update = await aconsult(tier, messages, ballot if final else None, deadline, publish=final)
+            return _after_tier(update, model, ballot, final)
+
+        return await model.arun(attempt, accept=lambda update: _accepts(update, key, model.min_confidence))
+
+    # Versión síncrona para graph.invoke y asíncrona para graph.ainvoke
+    from langchain_core.runnables import RunnableLambda
+    return RunnableLambda(specialist_agent, afunc=aspecialist_agent, name=f"{key}_specialist_agent")
+
+def tally_votes(votes: dict, quorum: str = DEFAULT_QUORUM, distributions: Optional[dict] = None) -> tuple:
+    """
+    Devuelve (decisión, observación) para los votos recibidos según la
+    política de quórum (ver quorum.py). Por defecto, unanimidad.
+    Si hay `distributions` (especialistas con varias muestras) se agregan
+    los votos ponderados en lugar del voto principal.
+    Los especialistas con TIMEOUT no cuentan: la decisión se toma sobre
+    los que respondieron y se marca como parcial
+    """
+    distributions = distributions or {}
+    timed_out = [key for key, vote in votes.items() if vote == TIMEOUT_VOTE]
+    answered = {key: vote for key, vote in votes.items() if vote != TIMEOUT_VOTE}
+    if not answered and timed_out:
+        return "INDECISO", "Ningún especialista respondió antes del plazo"
+
+    weighted = {key: distributions.get(key, vote) for key, vote in answered.items()}
+    decision = decide(weighted, len(SPECIALISTS) - len(timed_out), quorum) or MIXED_DECISION
+    if decision == MIXED_DECISION:
+        consensus = "Votos divididos - requiere revisión adicional"
+    elif len(answered) == len(SPECIALISTS) and len(set(answered.values())) == 1:
         consensus = "Consenso alcanzado"
     else:
-        final_decision = "ANÁLISIS MIXTO"
-        consensus = "Votos divididos - requiere revisión adicional"
+        consensus = f"Quórum alcanzado ({quorum})"
+
+    if timed_out:
+        consensus += f" - DECISIÓN PARCIAL: sin respuesta a tiempo de {', '.join(timed_out)}"
+    return decision, consensus
+
+def coordinator_agent(state: MedicalState) -> dict:
+    """
+    Agente coordinador que tabula los votos y da una decisión final
+    """
+    quorum = _run_config().get("quorum", DEFAULT_QUORUM)
+    votes = state["votes"]
+    distributions = state.get("vote_distribution", {})
+    final_decision, consensus = tally_votes(votes, quorum, distributions)
+    incomplete = TIMEOUT_VOTE in votes.values()
+    answered = {key: distributions.get(key, vote) for key, vote in votes.items() if vote != TIMEOUT_VOTE}
+    support = weighted_support(answered)
+
+    def vote_line(key: str) -> str:
+        if SPECIALISTS[key]["samples"] > 1 and key in distributions:
+            return f"{votes[key]} (confianza {state['confidence'][key]:.0%} en {SPECIALISTS[key]['samples']} muestras)"
+        return votes[key]
     
+    specialists_summary = "".join(
+        f"""
+{SPECIALISTS[key]['label']}: {vote_line(key)}
+  Razonamiento: {state['reasoning'].get(key, 'N/A')}
+""" if key in votes else f"""
+{SPECIALISTS[key]['label']}: CANCELADO (la decisión ya estaba fijada)
+"""
+        for key in SPECIALISTS
+    )
     summary = f"""
 === RESUMEN DE VOTACIÓN ===
 CASO: {state['case']}
 ACCIÓN: {state['action']}
-
-ESPECIALISTA EN SALUD OCULAR: {eye_vote}
-  Razonamiento: {state.get('eye_reasoning', 'N/A')}
-
-ESPECIALISTA EN SALUD CARDIACA: {cardiac_vote}
-  Razonamiento: {state.get('cardiac_reasoning', 'N/A')}
-
+{specialists_summary}
+APOYO PONDERADO: {', '.join(f'{verdict} {share:.0%}' for verdict, share in support.items())}
 DECISIÓN FINAL: {final_decision}
 OBSERVACIÓN: {consensus}
 """
     
-    state["final_decision"] = final_decision
     state["messages"].append(summary)
     
-    return state
+    # Devuelve solo lo que cambia para no re-aplicar los reducers de los especialistas
+    return {"final_decision": final_decision, "incomplete": incomplete, "messages": state["messages"]}
 
-def build_medical_voting_graph():
+def build_medical_voting_graph(llm=None, checkpointer=None):
     """
-    Construye el grafo del sistema multi-agente
+    Construye el grafo del sistema multi-agente.
+    `llm` permite inyectar otro modelo (p. ej. uno simulado en pruebas)
+    `checkpointer` guarda cada caso por thread_id para reanudarlo (ver checkpoint.py)
     """
+    from langgraph.graph import StateGraph
     workflow = StateGraph(MedicalState)
     
-    # Añade nodos para cada agente
-    workflow.add_node("eye_specialist", eye_specialist_agent)
-    workflow.add_node("cardiac_specialist", cardiac_specialist_agent)
+    # Añade un nodo por cada especialista registrado y el coordinador
+    specialist_nodes = []
+    for key in SPECIALISTS:
+        node = f"{key}_specialist"
+        workflow.add_node(node, create_specialist_agent(key, llm))
+        specialist_nodes.append(node)
     workflow.add_node("coordinator", coordinator_agent)
     
     # Define el flujo: los especialistas trabajan en paralelo, luego el coordinador
-    workflow.set_entry_point("eye_specialist")
-    
-    workflow.add_edge("eye_specialist", "cardiac_specialist")
-    workflow.add_edge("cardiac_specialist", "coordinator")
+    for node in specialist_nodes:
+        workflow.add_edge(START, node)
+    workflow.add_edge(specialist_nodes, "coordinator")
     workflow.add_edge("coordinator", END)
     
-    return workflow.compile()
+    return workflow.compile(checkpointer=checkpointer)
 
-def evaluate_medical_case(case: str, action: str) -> dict:
+def get_medical_voting_graph():
     """
-    Evalúa un caso médico con el sistema multi-agente
+    Grafo compilado una sola vez y reutilizado entre evaluaciones
     """
-    graph = build_medical_voting_graph()
-    
-    initial_state: MedicalState = {
+    global _voting_graph
+    if _voting_graph is None:
+        _voting_graph = build_medical_voting_graph()
+    return _voting_graph
+
+def create_run_config(quorum: str = DEFAULT_QUORUM, deadline: Optional[float] = None,
+                      case_id: Optional[str] = None) -> dict:
+    """
+    Configuración de una ejecución: política de quórum, una urna nueva para
+    que los especialistas puedan cancelarse en cuanto la decisión está fijada
+    y, si se indica `deadline` (segundos desde ahora), el plazo absoluto del caso.
+    Con la telemetría activa, lleva su callback y el `case_id` del caso.
+    """
+    from telemetry import with_telemetry
+    configurable = {"quorum": quorum, "ballot": Ballot(SPECIALISTS, quorum)}
+    if deadline is not None:
+        configurable["deadline"] = time.monotonic() + deadline
+    return with_telemetry({"configurable": configurable}, case_id=case_id)
+
+def evaluate_medical_case(case: str, action: str, quorum: str = DEFAULT_QUORUM,
+                          deadline: Optional[float] = None) -> dict:
+    """
+    Evalúa un caso médico con el sistema multi-agente.
+    `quorum`: "unanimity" (por defecto), "supermajority" o "majority"
+    `deadline`: presupuesto en segundos; los especialistas que no respondan a
+    tiempo quedan como TIMEOUT y el resultado se marca con incomplete=True
+    """
+    graph = get_medical_voting_graph()
+    result = graph.invoke(create_initial_state(case, action), create_run_config(quorum, deadline))
+    return result
+
+def stream_medical_case(case: str, action: str, quorum: str = DEFAULT_QUORUM,
+                        deadline: Optional[float] = None) -> Iterator[dict]:
+    """
+    Evalúa un caso emitiendo una decisión provisional cada vez que un
+    especialista publica su voto, sin esperar a que termine su razonamiento.
+    La decisión provisional es "PENDIENTE" mientras el quórum no esté fijado.
+
+    Yields:
+        {"type": "provisional", "specialist", "votes", "pending", "final_decision"}
+        por cada voto, y al final {"type": "final", **estado_final}
+    """
+    votes = {}
+    final_state = None
+    stream = get_medical_voting_graph().stream(
+        create_initial_state(case, action), create_run_config(quorum, deadline), stream_mode=["custom", "values"]
+    )
+    for mode, payload in stream:
+        if mode == "custom" and "voto" in payload:
+            votes[payload["specialist"]] = payload["voto"]
+            decision = decide(votes, len(SPECIALISTS), quorum) or "PENDIENTE"
+            yield {
+                "type": "provisional",
+                "specialist": payload["specialist"],
+                "votes": dict(votes),
+                "pending": [key for key in SPECIALISTS if key not in votes],
+                "final_decision": decision,
+            }
+        elif mode == "values":
+            final_state = payload
+
+    yield {"type": "final", **final_state}
+
+def create_initial_state(case: str, action: str) -> MedicalState:
+    """
+    Estado inicial de un caso antes de que voten los especialistas
+    """
+    return {
         "case": case,
         "action": action,
-        "eye_specialist_vote": "",
-        "cardiac_specialist_vote": "",
-        "eye_reasoning": "",
-        "cardiac_reasoning": "",
+        "votes": {},
+        "reasoning": {},
+        "vote_distribution": {},
+        "confidence": {},
+        "cancelled": [],
         "final_decision": "",
+        "incomplete": False,
         "messages": []
     }
-    
-    result = graph.invoke(initial_state)
-    return result
 
-# Ejemplo de uso
-if __name__ == "__main__":
+def iter_cases(source: Union[str, os.PathLike, Iterable]) -> Iterator[dict]:
+    """
+    Itera perezosamente los casos de una ruta JSONL, un archivo abierto
+    o cualquier iterable de dicts / líneas JSON
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, encoding="utf-8") as f:
+            yield from iter_cases(f)
+        return
+
+    for item in source:
+        if isinstance(item, (str, bytes)):
+            if not item.strip():
+                continue
+            item = json.loads(item)
+        yield item
+
+async def evaluate_medical_cases(
+    cases: Union[str, os.PathLike, Iterable],
+    concurrency: int = 8,
+    quorum: str = DEFAULT_QUORUM,
+    deadline: Optional[float] = None,
+    checkpoint: Optional[str] = None,
+    dedup: Optional[float] = None,
+    dedup_log: Optional[str] = None,
+) -> AsyncIterator[Tuple[int, dict]]:
+    """
+    Evalúa un lote de casos de forma concurrente.
+
+    Args:
+        cases: Ruta a un JSONL, archivo abierto o iterable con dicts {"case", "action"}
+        concurrency: Máximo de casos en vuelo a la vez
+        quorum: Política de quórum del coordinador (ver quorum.py)
+        deadline: Presupuesto en segundos por caso, contado desde que empieza
+        checkpoint: Base SQLite de checkpoints. Cada caso se guarda con su "id" (o su
+            posición): al relanzar el lote, los terminados se devuelven sin llamar al
+            LLM y los interrumpidos se reanudan desde el último especialista terminado
+        dedup: Umbral de similitud (0-1) para agrupar casos casi duplicados (ver dedup.py):
+            solo se evalúa el primero de cada grupo con la misma acción y los demás
+            copian su veredicto con "duplicate_of" y "similarity" (si el representante
+            falló o quedó incompleto, se evalúan ellos también). Se recuerdan los
+            últimos DEDUP_MAX_REPRESENTATIVES veredictos. None = evaluar todos
+        dedup_log: JSONL donde se registra, por caso, su grupo y su representante
+
+    Yields:
+        Tuplas (índice_de_entrada, resultado) en orden de finalización. Si un caso
+        falla, el resultado trae final_decision="ERROR" y el detalle en "error".
+    """
+    saver = None
+    if checkpoint:
+        from checkpoint import asession_status, open_checkpointer, thread_config
+        saver = open_checkpointer(checkpoint)
+        graph = build_medical_voting_graph(checkpointer=saver)
+    else:
+        graph = get_medical_voting_graph()
+    source = enumerate(iter_cases(cases))
+
+    # Huecos de evaluación: los duplicados que se evalúan porque su representante
+    # falló también los ocupan, así que nunca hay más de `concurrency` casos en el LLM
+    slots = asyncio.Semaphore(concurrency)
+
+    async def run_case(index: int, item: dict) -> Tuple[int, dict]:
+        async with slots:
+            try:
+                case_id = str(item.get("id", index))
+                state = create_initial_state(item["case"], item["action"])
+                config = create_run_config(quorum, deadline, case_id=case_id)
+                if saver is not None:
+                    config = thread_config(f"case-{case_id}", config)
+                    status = await asession_status(graph, config)
+                    if status == "done":
+                        return index, (await graph.aget_state(config)).values
+                    if status == "interrupted":
+                        state = None
+                return index, await graph.ainvoke(state, config)
+            except Exception as e:
+                result = create_initial_state(item.get("case", ""), item.get("action", ""))
+                result.update(final_decision="ERROR", error=repr(e))
+                return index, result
+
+    clusterer = None
+    # Veredicto -> tarea del representante; LRU para que la memoria no crezca con el lote
+    representatives: "OrderedDict[int, asyncio.Future]" = OrderedDict()
+    mapping = None
+    if dedup is not None:
+        from dedup import CaseClusterer, copy_verdict
+        clusterer = CaseClusterer(threshold=dedup)
+        mapping = open(dedup_log, "w", encoding="utf-8") if dedup_log else None
+
+    async def copy_case(index: int, item: dict, assignment, representative: asyncio.Future) -> Tuple[int, dict]:
+        _, result = await asyncio.shield(representative)
+        # Un fallo o un veredicto parcial (plazo vencido) no se copia: el duplicado se evalúa
+        if result.get("error") or result.get("incomplete"):
+            return await run_case(index, item)
+        return index, copy_verdict(result, item.get("case", ""), item.get("action", ""), assignment)
+
+    # Solo se leen nuevos casos cuando hay hueco, así la memoria no crece con el archivo.
+    # Las copias de veredicto no llaman al LLM y no ocupan hueco, pero sí cuentan para
+    # el tope de casos en espera: si no, un representante lento dejaría leer el resto
+    pending = set()
+    evaluating = set()
+    max_pending = concurrency * DEDUP_PENDING_PER_SLOT
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(evaluating) < concurrency and len(pending) < max_pending:
+                try:
+                    index, item = next(source)
+                except StopIteration:
+                    exhausted = True
+                    break
+                if clusterer is None or "case" not in item or "action" not in item:
+                    task = asyncio.ensure_future(run_case(index, item))
+                    evaluating.add(task)
+                else:
+                    case_id = str(item.get("id", index))
+                    assignment = clusterer.assign(case_id, item["case"], item["action"])
+                    if mapping:
+                        mapping.write(json.dumps({"index": index, "id": case_id, **assignment._asdict()}) + "\n")
+                    if assignment.is_new:
+                        task = representatives[assignment.cluster] = asyncio.ensure_future(run_case(index, item))
+                        if len(representatives) > DEDUP_MAX_REPRESENTATIVES:
+                            # El agrupador olvida el veredicto y, si se queda vacío, su grupo de casos
+                            evicted, _ = representatives.popitem(last=False)
+                            clusterer.forget(evicted)
+                        evaluating.add(task)
+                    else:
+                        representatives.move_to_end(assignment.cluster)
+                        representative = representatives[assignment.cluster]
+                        task = asyncio.ensure_future(copy_case(index, item, assignment, representative))
+                pending.add(task)
+
+            if not pending:
+                break
+
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            evaluating -= done
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+        if saver is not None:
+            saver.close()
+        if mapping:
+            mapping.close()
+
+def main():
+    """Evalúa los casos de ejemplo o los de un JSONL."""
     # Casos de prueba
     test_cases = [
         {
@@ -192,15 +833,28 @@ if __name__ == "__main__":
         }
     ]
     
-    for i, test_case in enumerate(test_cases, 1):
-        print(f"\n{'='*60}")
-        print(f"EVALUANDO CASO {i}")
-        print(f"{'='*60}")
-        
-        result = evaluate_medical_case(
-            case=test_case["case"],
-            action=test_case["action"]
-        )
-        
-        for message in result.get("messages", []):
-            print(message)
\ No newline at end of file
+    # Uso: python voting.py [casos.jsonl] [--checkpoint checkpoints.sqlite]
+    parser = argparse.ArgumentParser(description="Votación multi-agente sobre casos médicos")
+    parser.add_argument("cases", nargs="?", help="JSONL con {id?, case, action} por línea")
+    parser.add_argument("--checkpoint", help="Base SQLite para reanudar el lote si se interrumpe")
+    parser.add_argument("--dedup", type=float, help="Umbral (0-1) para votar una vez por grupo de casos casi iguales")
+    parser.add_argument("--dedup-log", help="JSONL con el grupo y el representante de cada caso")
+    add_sink_arguments(parser)
+    args = parser.parse_args()
+    cases = args.cases or test_cases
+    sink = sink_from_args(args)
+
+    async def run():
+        async for index, result in evaluate_medical_cases(cases, checkpoint=args.checkpoint,
+                                                          dedup=args.dedup, dedup_log=args.dedup_log):
+            sink({"type": "case_result", "index": index, "messages": result.get("messages", []),
+                  "error": result.get("error")})
+
+    try:
+        asyncio.run(run())
+    finally:
+        sink.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+"""Servicio HTTP (ASGI) de larga duración para el sistema de votación médica.
+
+El grafo se compila una sola vez al arrancar y los clientes LLM se reutilizan
+entre peticiones. Las peticiones que llegan dentro de una ventana corta se
+agrupan en un micro-lote que se ejecuta de forma concurrente con graph.abatch.
+
+Endpoints:
+    GET  /health    -> estado del servicio
+    GET  /metrics   -> percentiles de latencia y estadísticas de lotes
+    POST /evaluate  -> {"case": "...", "action": "...", "deadline": 5.0} -> veredicto
+                       ("deadline" es opcional: presupuesto en segundos)
+
+Uso:
+    python voting_service.py --port 8000          # requiere uvicorn
+    python voting_service.py --stub               # con un LLM simulado
+    uvicorn voting_service:app
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+from typing import Optional
+
+from quorum import DEFAULT_QUORUM, validate_policy
+from voting import (abandoned_calls, build_medical_voting_graph, create_initial_state, create_run_config,
+                    deadline_stats)
+
+
+class LatencyTracker:
+    """Guarda las latencias recientes y calcula percentiles."""
+
+    def __init__(self, window: int = 1000):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+        self.count += 1
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))
+        return ordered[index]
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "p50_ms": _to_ms(self.percentile(50)),
+            "p95_ms": _to_ms(self.percentile(95)),
+            "p99_ms": _to_ms(self.percentile(99)),
+        }
+
+
+def _to_ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+class MicroBatcher:
+    """
+    Agrupa las peticiones que llegan dentro de `window` segundos (hasta
+    `max_batch`) y las ejecuta juntas con graph.abatch.
+    """
+
+    def __init__(self, graph, window: float = 0.01, max_batch: int = 32, max_concurrency: int = 16,
+                 quorum: str = DEFAULT_QUORUM, deadline: Optional[float] = None):
+        validate_policy(quorum)
+        self.graph = graph
+        self.quorum = quorum
+        self.deadline = deadline
+        self.window = window
+        self.max_batch = max_batch
+        self.max_concurrency = max_concurrency
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.batches = 0
+        self.batched_requests = 0
+        self._worker: Optional[asyncio.Task] = None
+        self._running = set()
+
+    def start(self):
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._collect())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    async def submit(self, state: dict, deadline: Optional[float] = None) -> dict:
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        deadline = self.deadline if deadline is None else deadline
+        await self.queue.put((state, future, deadline, time.monotonic()))
+        return await future
+
+    async def _collect(self):
+        while True:
+            batch = [await self.queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            # Cada lote corre en su propia tarea para no bloquear la recolección del siguiente
+            task = asyncio.create_task(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch):
+        # Pase lo que pase, ninguna petición del lote se queda esperando su futuro
+        try:
+            await self._execute(batch)
+        except Exception as e:
+            for _, future, *_ in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            for _, future, *_ in batch:
+                if not future.done():
+                    future.cancel()
+
+    async def _execute(self, batch):
+        self.batches += 1
+        self.batched_requests += len(batch)
+        states = [state for state, *_ in batch]
+        # Cada caso necesita su propia urna de votos; el plazo cuenta desde que llegó la petición
+        now = time.monotonic()
+        configs = [
+            {
+                **create_run_config(self.quorum, None if deadline is None else deadline - (now - arrived)),
+                "max_concurrency": self.max_concurrency,
+            }
+            for _, _, deadline, arrived in batch
+        ]
+        results = await self.graph.abatch(states, config=configs, return_exceptions=True)
+        for (_, future, *_), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+class VotingService:
+    """Mantiene el grafo compilado, el micro-batcher y las métricas."""
+
+    def __init__(self, llm=None, window: float = 0.01, max_batch: int = 32, max_concurrency: int = 16,
+                 quorum: str = DEFAULT_QUORUM, deadline: Optional[float] = None):
+        validate_policy(quorum)
+        self.graph = build_medical_voting_graph(llm)
+        self.batcher = MicroBatcher(self.graph, window, max_batch, max_concurrency, quorum, deadline)
+        self.latency = LatencyTracker()
+        self.started_at = time.time()
+        self.in_flight = 0
+        self.errors = 0
+
+    async def evaluate(self, case: str, action: str, deadline: Optional[float] = None) -> dict:
+        start = time.perf_counter()
+        self.in_flight += 1
+        try:
+            return await self.batcher.submit(create_initial_state(case, action), deadline)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self.latency.record(time.perf_counter() - start)
+
+    def health(self) -> dict:
+        return {
+            "status": "ok",
+            "uptime_s": round(time.time() - self.started_at, 1),
+            "in_flight": self.in_flight,
+        }
+
+    def metrics(self) -> dict:
+        batches = self.batcher.batches
+        return {
+            "latency": self.latency.summary(),
+            "errors": self.errors,
+            "batches": batches,
+            "avg_batch_size": round(self.batcher.batched_requests / batches, 2) if batches else 0,
+            "deadlines": deadline_stats(),
+            "abandoned_calls": abandoned_calls(),
+        }
+
+
+def create_app(llm=None, **service_kwargs):
+    """
+    Crea la aplicación ASGI. El servicio (y el grafo) se construye al
+    arrancar, no al importar el módulo.
+    """
+    service: Optional[VotingService] = None
+
+    def get_service() -> VotingService:
+        nonlocal service
+        if service is None:
+            service = VotingService(llm, **service_kwargs)
+        return service
+
+    async def app(scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    get_service().batcher.start()
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    if service is not None:
+                        await service.batcher.stop()
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+
+        if scope["type"] != "http":
+            return
+
+        method, path = scope["method"], scope["path"]
+        if method == "GET" and path == "/health":
+            await _send_json(send, 200, get_service().health())
+        elif method == "GET" and path == "/metrics":
+            await _send_json(send, 200, get_service().metrics())
+        elif method == "POST" and path == "/evaluate":
+            try:
+                payload = json.loads(await _read_body(receive) or b"{}")
+                case, action = payload["case"], payload["action"]
+                deadline = payload.get("deadline")
+                deadline = None if deadline is None else float(deadline)
+            except (json.JSONDecodeError, KeyError, TypeError, ValueError):
+                await _send_json(send, 400, {"error": "Se esperaba JSON con 'case' y 'action'"})
+                return
+            try:
+                result = await get_service().evaluate(case, action, deadline)
+            except Exception as e:
+                await _send_json(send, 500, {"error": repr(e)})
+                return
+            await _send_json(send, 200, {
+                "final_decision": result["final_decision"],
+                "votes": result["votes"],
+                "reasoning": result["reasoning"],
+                "cancelled": result["cancelled"],
+                "incomplete": result["incomplete"],
+                "summary": "\n".join(result["messages"]),
+            })
+        else:
+            await _send_json(send, 404, {"error": "No encontrado"})
+
+    app.get_service = get_service
+    return app
+
+
+async def _read_body(receive) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def _send_json(send, status: int, payload: dict):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+app = create_app()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servicio de votación médica")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--window-ms", type=float, default=10, help="Ventana de micro-batching")
+    parser.add_argument("--max-batch", type=int, default=32)
+    parser.add_argument("--quorum", default=DEFAULT_QUORUM, help="unanimity, supermajority o majority")
+    parser.add_argument("--deadline", type=float, default=None, help="Plazo por caso en segundos")
+    parser.add_argument("--stub", action="store_true", help="Usa un LLM simulado")
+    args = parser.parse_args()
+
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("Instala uvicorn para ejecutar el servicio: pip install uvicorn")
+
+    llm = None
+    if args.stub:
+        from fake_llm import FakeChatModel
+        llm = FakeChatModel(latency=0.2)
+
+    service_app = create_app(llm, window=args.window_ms / 1000, max_batch=args.max_batch, quorum=args.quorum,
+                             deadline=args.deadline)
+    uvicorn.run(service_app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()